@@ -1,6 +1,7 @@
 #include QMK_KEYBOARD_H
 #include "via.h"
 #include "raw_hid.h"
+#include "dynamic_keymap.h"
 #include "print.h"
 #include "qp.h"
 #include "font/proton_mono20.qff.h"
@@ -36,7 +37,40 @@ uint32_t              oled_timer          = 0;
 uint8_t               oled_timeout_config = 1; // 0=10s, 1=30s, 2=60s, 3=Never
 bool                  oled_is_on          = true;
 
+// Host event subscription (0xFC 0x07); legacy hosts get every event
+#define NEXAHUB_EVENT_LAYER (1 << 0)
+#define NEXAHUB_EVENT_KEY (1 << 1)
+#define NEXAHUB_EVENT_KEY_BATCH (1 << 2)
+uint8_t event_mask = NEXAHUB_EVENT_LAYER | NEXAHUB_EVENT_KEY;
+
+// Key events of the current scan, sent together by housekeeping_task_user
+// Protocol: [0xFB, 0x03, count, (row, col | pressed << 7) * count]
+#define NEXAHUB_KEY_BATCH_MAX 14
+uint8_t key_batch[32];
+uint8_t key_batch_count = 0;
+
+// Layer of each host profile slot (0xFC 0x08), switched to by 0xFC 0x09
+#define NEXAHUB_PROFILE_SLOTS 16
+uint8_t profile_layers[NEXAHUB_PROFILE_SLOTS];
+uint8_t profile_count = 0;
+
+// Last layer drawn and reported; 0xFF forces the first update
+uint8_t last_layer = 0xFF;
+
 void render_oled_page_layer_badge(layer_state_t state);
+void oled_wake(void);
+
+void flush_key_batch(void) {
+    if (key_batch_count == 0) {
+        return;
+    }
+    key_batch[0] = 0xFB; // Event Packet
+    key_batch[1] = 0x03; // Key Event Batch
+    key_batch[2] = key_batch_count;
+    raw_hid_send(key_batch, 32);
+    memset(key_batch, 0, 32);
+    key_batch_count = 0;
+}
 
 void keyboard_post_init_user(void) {
     // Initialize the display
@@ -54,30 +88,47 @@ void keyboard_post_init_user(void) {
 }
 
 bool process_record_user(uint16_t keycode, keyrecord_t *record) {
-    // Send key event to host via Raw HID
-    // Protocol: [0xFB, 0x02, row, col, pressed]
-    uint8_t data[32];
-    memset(data, 0, 32);
-    data[0] = 0xFB; // Event Packet
-    data[1] = 0x02; // Key Event
-    data[2] = record->event.key.row;
-    data[3] = record->event.key.col;
-    data[4] = record->event.pressed ? 1 : 0;
-    raw_hid_send(data, 32);
+    if (event_mask & NEXAHUB_EVENT_KEY_BATCH) {
+        // Queue the key event; flushed once per scan or when full
+        uint8_t *entry = &key_batch[3 + key_batch_count * 2];
+        entry[0]       = record->event.key.row;
+        entry[1]       = record->event.key.col | (record->event.pressed ? 0x80 : 0);
+        if (++key_batch_count == NEXAHUB_KEY_BATCH_MAX) {
+            flush_key_batch();
+        }
+    } else if (event_mask & NEXAHUB_EVENT_KEY) {
+        // Send key event to host via Raw HID
+        // Protocol: [0xFB, 0x02, row, col, pressed]
+        uint8_t data[32];
+        memset(data, 0, 32);
+        data[0] = 0xFB; // Event Packet
+        data[1] = 0x02; // Key Event
+        data[2] = record->event.key.row;
+        data[3] = record->event.key.col;
+        data[4] = record->event.pressed ? 1 : 0;
+        raw_hid_send(data, 32);
+    }
 
     if (record->event.pressed) {
         oled_timer = timer_read32();
-        if (!oled_is_on) {
-            qp_power(display, true);
-            oled_is_on = true;
-            // Refresh display when turning back on
-            render_oled_page_layer_badge(layer_state);
-        }
+        oled_wake();
     }
     return true;
 }
 
+// Turn a dark display back on; layer changes are not drawn while it is off
+void oled_wake(void) {
+    if (!oled_is_on) {
+        qp_power(display, true);
+        oled_is_on = true;
+        render_oled_page_layer_badge(layer_state);
+    }
+}
+
 void housekeeping_task_user(void) {
+    // Runs after each matrix scan: events of one scan share a report
+    flush_key_batch();
+
     if (oled_is_on && oled_timeout_config != 3) {
         uint32_t timeout_ms = 30000;
         switch (oled_timeout_config) {
@@ -123,20 +174,57 @@ void render_oled_page_layer_badge(layer_state_t state) {
 }
 
 layer_state_t layer_state_set_user(layer_state_t state) {
-    render_oled_page_layer_badge(state);
-
-    // Send layer change to host
+    // Only the highest layer is shown and reported; skip redundant updates
     uint8_t layer = get_highest_layer(state);
-    uint8_t data[32];
-    memset(data, 0, 32);
-    data[0] = 0xFB; // Event Packet
-    data[1] = 0x01; // Layer Change
-    data[2] = layer;
-    raw_hid_send(data, 32);
+    if (layer == last_layer) {
+        return state;
+    }
+    last_layer = layer;
+
+    // A dark display is redrawn when it wakes up
+    if (oled_is_on) {
+        render_oled_page_layer_badge(state);
+    }
+
+    if (event_mask & NEXAHUB_EVENT_LAYER) {
+        // Key events that caused the change go first
+        flush_key_batch();
+
+        // Send layer change to host
+        uint8_t data[32];
+        memset(data, 0, 32);
+        data[0] = 0xFB; // Event Packet
+        data[1] = 0x01; // Layer Change
+        data[2] = layer;
+        raw_hid_send(data, 32);
+    }
 
     return state;
 }
 
+// NexaHub host protocol, reported by the 0x05 handshake
+#define NEXAHUB_PROTOCOL_VERSION 1
+#define NEXAHUB_FEATURE_LAYER_EVENTS (1 << 0)
+#define NEXAHUB_FEATURE_KEY_EVENTS (1 << 1)
+#define NEXAHUB_FEATURE_OLED_TIMEOUT (1 << 2)
+#define NEXAHUB_FEATURE_ENCODER_READ (1 << 3)
+#define NEXAHUB_FEATURE_EVENT_SUBSCRIBE (1 << 4)
+#define NEXAHUB_FEATURE_PROFILES (1 << 5)
+#define NEXAHUB_FEATURE_ENCODER_MAP (1 << 6)
+
+#define NEXAHUB_BASE_FEATURES (NEXAHUB_FEATURE_LAYER_EVENTS | NEXAHUB_FEATURE_KEY_EVENTS | NEXAHUB_FEATURE_OLED_TIMEOUT | NEXAHUB_FEATURE_EVENT_SUBSCRIBE | NEXAHUB_FEATURE_PROFILES)
+#if defined(ENCODER_MAP_ENABLE)
+#    define NEXAHUB_FEATURES (NEXAHUB_BASE_FEATURES | NEXAHUB_FEATURE_ENCODER_READ | NEXAHUB_FEATURE_ENCODER_MAP)
+#else
+#    define NEXAHUB_FEATURES NEXAHUB_BASE_FEATURES
+#endif
+
+#if defined(ENCODER_ENABLE)
+#    define NEXAHUB_NUM_ENCODERS NUM_ENCODERS
+#else
+#    define NEXAHUB_NUM_ENCODERS 0
+#endif
+
 // Raw HID handler for auto-layer switching
 void raw_hid_receive_kb(uint8_t *data, uint8_t length) {
     if (data[0] == 0xFC) {
@@ -152,16 +240,91 @@ void raw_hid_receive_kb(uint8_t *data, uint8_t length) {
             case 0x03: // Set OLED Timeout
                 oled_timeout_config = data[2];
                 oled_timer          = timer_read32(); // Reset timer
-                if (!oled_is_on) {
-                    qp_power(display, true);
-                    oled_is_on = true;
-                }
+                oled_wake();
                 data[1] = 0xFD; // Acknowledge
                 break;
             case 0x04: // Get OLED Timeout
                 data[2] = oled_timeout_config;
                 data[1] = 0xFD; // Acknowledge
                 break;
+            case 0x05: // Get capabilities
+                // Reply: [0xFC][0xFD][0x05][version][rows][cols][layers][encoders][features_hi][features_lo]
+                data[1] = 0xFD; // Acknowledge
+                data[2] = 0x05; // Keep the command so the reply is identifiable
+                data[3] = NEXAHUB_PROTOCOL_VERSION;
+                data[4] = MATRIX_ROWS;
+                data[5] = MATRIX_COLS;
+                data[6] = DYNAMIC_KEYMAP_LAYER_COUNT;
+                data[7] = NEXAHUB_NUM_ENCODERS;
+                data[8] = (NEXAHUB_FEATURES >> 8) & 0xFF;
+                data[9] = NEXAHUB_FEATURES & 0xFF;
+                break;
+#if defined(ENCODER_MAP_ENABLE)
+            case 0x06: { // Get encoder keycodes: [0xFC][0x06][layer][encoder]
+                // Reply: [0xFC][0xFD][0x06][layer][encoder][ccw_hi][ccw_lo][cw_hi][cw_lo]
+                uint8_t layer   = data[2];
+                uint8_t encoder = data[3];
+                if (layer >= DYNAMIC_KEYMAP_LAYER_COUNT || encoder >= NUM_ENCODERS) {
+                    break; // Echoed unchanged
+                }
+                uint16_t ccw = dynamic_keymap_get_encoder(layer, encoder, false);
+                uint16_t cw  = dynamic_keymap_get_encoder(layer, encoder, true);
+                data[1]      = 0xFD; // Acknowledge
+                data[2]      = 0x06;
+                data[3]      = layer;
+                data[4]      = encoder;
+                data[5]      = ccw >> 8;
+                data[6]      = ccw & 0xFF;
+                data[7]      = cw >> 8;
+                data[8]      = cw & 0xFF;
+                break;
+            }
+            case 0x0A: { // Get encoder map entries: [0xFC][0x0A][first][count]
+                // Entry i is layer i / NUM_ENCODERS, encoder i % NUM_ENCODERS
+                // Reply: [0xFC][0xFD][0x0A][first][count] + [ccw_hi][ccw_lo][cw_hi][cw_lo] per entry
+                uint8_t first = data[2];
+                uint8_t count = data[3];
+                if (count == 0 || count > (length - 5) / 4 || (uint16_t)first + count > DYNAMIC_KEYMAP_LAYER_COUNT * NUM_ENCODERS) {
+                    break; // Echoed unchanged
+                }
+                data[1] = 0xFD; // Acknowledge
+                data[2] = 0x0A;
+                data[3] = first;
+                data[4] = count;
+                for (uint8_t i = 0; i < count; i++) {
+                    uint8_t  layer   = (first + i) / NUM_ENCODERS;
+                    uint8_t  encoder = (first + i) % NUM_ENCODERS;
+                    uint16_t ccw     = dynamic_keymap_get_encoder(layer, encoder, false);
+                    uint16_t cw      = dynamic_keymap_get_encoder(layer, encoder, true);
+                    uint8_t *entry   = &data[5 + 4 * i];
+                    entry[0]         = ccw >> 8;
+                    entry[1]         = ccw & 0xFF;
+                    entry[2]         = cw >> 8;
+                    entry[3]         = cw & 0xFF;
+                }
+                break;
+            }
+#endif
+            case 0x07: // Subscribe to event classes: [0xFC][0x07][mask]
+                if (!(data[2] & NEXAHUB_EVENT_KEY_BATCH)) {
+                    flush_key_batch();
+                }
+                event_mask = data[2];
+                data[1]    = 0xFD; // Acknowledge
+                break;
+            case 0x08: // Load profile slots: [0xFC][0x08][count][layer per slot...]
+                profile_count = MIN(data[2], NEXAHUB_PROFILE_SLOTS);
+                for (uint8_t i = 0; i < profile_count; i++) {
+                    profile_layers[i] = MIN(data[3 + i], DYNAMIC_KEYMAP_LAYER_COUNT - 1);
+                }
+                data[1] = 0xFD; // Acknowledge
+                break;
+            case 0x09: // Activate profile slot: [0xFC][0x09][slot]
+                // Fire-and-forget: the layer event (if subscribed) confirms it
+                if (data[2] < profile_count) {
+                    layer_move(profile_layers[data[2]]);
+                }
+                return;
         }
     }
     raw_hid_send(data, length);
@@ -0,0 +1,476 @@
+"""End-to-end benchmarks for the NexaHub host pipeline.
+
+Runs NexaHubApp headless (offscreen QPA) against a simulated NexaPad and a
+scripted window-focus source, then compares the results with a stored
+baseline.
+
+Usage:
+    python benchmarks/run_benchmarks.py                  # run and compare
+    python benchmarks/run_benchmarks.py --save-baseline  # record a new baseline
+    python benchmarks/run_benchmarks.py --quick          # short smoke run
+    python benchmarks/run_benchmarks.py --async-core     # asyncio core (qasync)
+
+Exit status is 1 when any metric regresses past its threshold.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+# Must be set before QApplication is created
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psutil
+from PySide6.QtCore import QObject, QEvent, QEventLoop, QRect, QTimer
+
+from main import NexaHubApp
+from engine.settings_manager import SettingsManager
+from engine.latency_tracer import percentile
+from engine.device_pool import DevicePool
+from engine.capabilities import CapabilityCache
+from engine.fake_windows import FakeWindowTree
+from engine.foreground_state import ForegroundState
+from engine.window_monitor import WindowMonitor
+from benchmarks.sim_device import SimulatedDevice, SimulatedHIDManager
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Allowed regression per metric: (max ratio vs baseline, absolute slack).
+# A metric regresses when value > baseline * ratio + slack.
+REGRESSION_THRESHOLDS = {
+    "focus_switch_p50_ms": (1.25, 5.0),
+    "focus_switch_p95_ms": (1.25, 10.0),
+    "layer_switch_p50_ms": (1.25, 2.0),
+    "layer_switch_p95_ms": (1.25, 5.0),
+    "profile_switch_p50_ms": (1.25, 2.0),
+    "profile_switch_p95_ms": (1.25, 5.0),
+    "keymap_refresh_p50_ms": (1.25, 2.0),
+    "keymap_refresh_p95_ms": (1.25, 5.0),
+    "key_paint_p50_ms": (1.25, 2.0),
+    "key_paint_p95_ms": (1.25, 5.0),
+    "key_record_ns": (1.5, 200.0),
+    "macro_trigger_p50_ms": (1.25, 2.0),
+    "macro_trigger_p95_ms": (1.25, 5.0),
+    "window_sample_us": (1.5, 5.0),
+    "idle_cpu_s_per_hour": (1.5, 5.0),
+    "idle_wakeups_per_min": (1.25, 5.0),
+    "idle_relayouts_per_min": (1.0, 0.0),
+    "memory_growth_kb": (1.5, 1024.0),
+}
+
+# Process names used by the scripted focus source and their mapped layers
+SCRIPTED_APPS = [("app1.exe", 1), ("app2.exe", 2), ("app3.exe", 3), ("idle.exe", 0)]
+
+
+class ScriptedFocusSource:
+    """Window source whose foreground window is set by the benchmark."""
+
+    def __init__(self):
+        self._current = ("idle.exe", "Idle")
+        self.changed_at = time.perf_counter()
+
+    def set(self, process_name: str, window_title: Optional[str] = None):
+        self.changed_at = time.perf_counter()
+        self._current = (process_name, window_title)
+
+    def __call__(self) -> Optional[tuple]:
+        return self._current
+
+
+class Waiter:
+    """Runs a nested Qt event loop until done() is called or a timeout expires.
+
+    Completion is event driven (no processEvents() polling), so the recorded
+    timestamp is taken exactly when the awaited event is delivered.
+    """
+
+    def __init__(self):
+        self.loop = QEventLoop()
+        self.done_at: Optional[float] = None
+
+    def done(self):
+        if self.done_at is None:
+            self.done_at = time.perf_counter()
+            self.loop.quit()
+
+    def wait(self, timeout: float) -> bool:
+        if self.done_at is None:
+            timer = QTimer()
+            timer.setSingleShot(True)
+            timer.timeout.connect(self.loop.quit)
+            timer.start(int(timeout * 1000))
+            self.loop.exec()
+            timer.stop()
+        return self.done_at is not None
+
+
+class PaintProbe(QObject):
+    """Event filter completing a Waiter on the next paint of a widget.
+
+    With ``rect``, only paints that cover part of it count.
+    """
+
+    def __init__(self, waiter: Waiter, rect: Optional[QRect] = None):
+        super().__init__()
+        self.waiter = waiter
+        self.rect = rect
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Paint and (
+            self.rect is None or event.rect().intersects(self.rect)
+        ):
+            self.waiter.done()
+        return False
+
+
+def _idle(seconds: float):
+    """Run the Qt event loop for a while (no polling of our own)."""
+    Waiter().wait(seconds)
+
+
+def _summarize(name: str, values: List[float], results: Dict[str, float]):
+    values.sort()
+    results[f"{name}_p50_ms"] = percentile(values, 50)
+    results[f"{name}_p95_ms"] = percentile(values, 95)
+
+
+def _is_running(activity) -> bool:
+    """Whether a QTimer or WindowMonitor is running."""
+    return activity.isActive() if isinstance(activity, QTimer) else activity.running
+
+
+class BenchmarkRunner:
+    """Builds a headless NexaHubApp and runs the benchmark scenarios."""
+
+    def __init__(
+        self, iterations: int, idle_seconds: float, soak_cycles: int, async_core: bool = False
+    ):
+        self.iterations = iterations
+        self.idle_seconds = idle_seconds
+        self.soak_cycles = soak_cycles
+
+        self._config_dir = tempfile.TemporaryDirectory(prefix="nexahub-bench-")
+        settings = SettingsManager(config_dir=self._config_dir.name)
+        settings.show_overlay = True
+        settings.auto_switch_layer = True
+        settings.default_layer = 0
+        settings.async_core = async_core
+        settings.config["layer_mappings"] = [
+            {"layer": layer, "process_name": name, "window_title": None}
+            for name, layer in SCRIPTED_APPS
+            if layer != 0
+        ]
+
+        self.device = SimulatedDevice()
+        self.focus = ScriptedFocusSource()
+        self.nexahub = NexaHubApp(
+            settings=settings,
+            pool=DevicePool(
+                SimulatedHIDManager(self.device),
+                CapabilityCache(settings.config_dir / "capabilities.json"),
+            ),
+            window_source=self.focus,
+        )
+        self.app = self.nexahub.app
+        self.process = psutil.Process()
+
+        # Completed when the GUI thread handles the expected device layer event
+        self._layer_waiter: Optional[Waiter] = None
+        self._expected_layer: Optional[int] = None
+        self.nexahub.hid_bridge.layer_event.connect(self._on_layer_event)
+        self._keymap_waiter: Optional[Waiter] = None
+        self.nexahub.hid_bridge.keymap_event.connect(self._on_keymap_event)
+
+    def _on_layer_event(self, key: str, layer_id: int):
+        if self._layer_waiter is not None and layer_id == self._expected_layer:
+            self._layer_waiter.done()
+
+    def _on_keymap_event(self, key: str, keycodes: list, encoder_keycodes):
+        if self._keymap_waiter is not None:
+            self._keymap_waiter.done()
+
+    def close(self):
+        self.nexahub._quit()
+        if self.nexahub.loop is not None:
+            self.nexahub.loop.close()
+        self._config_dir.cleanup()
+
+    def bench_focus_switch(self, results: Dict[str, float]):
+        """Scripted focus change -> layer event handled on the GUI thread."""
+        samples = []
+        rng = random.Random(1234)
+        poll_interval = self.nexahub.window_monitor.poll_interval
+        for i in range(self.iterations):
+            name, layer = SCRIPTED_APPS[i % len(SCRIPTED_APPS)]
+            # Spread focus changes across the monitor's polling phase
+            _idle(rng.uniform(0, poll_interval))
+            waiter = Waiter()
+            self._layer_waiter, self._expected_layer = waiter, layer
+            self.focus.set(name, f"{name} window {i}")
+            if waiter.wait(5.0):
+                samples.append((waiter.done_at - self.focus.changed_at) * 1000)
+        self._layer_waiter = None
+        _summarize("focus_switch", samples, results)
+
+    def _report_count(self) -> int:
+        stats = self.nexahub.pool.stats.snapshot()
+        return sum(stats["sent"].values()) + sum(stats["received"].values())
+
+    def _bench_switch(self, name: str, results: Dict[str, float]):
+        """Published focus change -> device layer event, and HID reports per switch."""
+        # Warm-up: record usage, load profile slots, fill the keymap cache
+        for app, _ in SCRIPTED_APPS:
+            self.nexahub.foreground.publish(app, f"{app} warm-up")
+            _idle(0.05)
+
+        samples = []
+        reports = self._report_count()
+        for i in range(self.iterations):
+            app, layer = SCRIPTED_APPS[i % len(SCRIPTED_APPS)]
+            waiter = Waiter()
+            self._layer_waiter, self._expected_layer = waiter, layer
+            start = time.perf_counter()
+            self.nexahub.foreground.publish(app, f"{app} switch {i}")
+            if waiter.wait(2.0):
+                samples.append((waiter.done_at - start) * 1000)
+        self._layer_waiter = None
+        _idle(0.05)  # Late acks belong to this flow
+        results[f"{name}_reports"] = (self._report_count() - reports) / self.iterations
+        _summarize(name, samples, results)
+
+    def bench_profile_switch(self, results: Dict[str, float]):
+        """Today's switch flow against profile mode, without window polling."""
+        settings = self.nexahub.settings
+        # Nothing else may send reports while switches are counted: window
+        # polls would publish the scripted window (still the last one
+        # focused) again, and the connection and keymap polls run every 2 s
+        nexahub = self.nexahub
+        background = (nexahub.window_monitor, nexahub.reconnect_timer, nexahub.keymap_poll_timer)
+        running = [activity for activity in background if _is_running(activity)]
+        for activity in running:
+            activity.stop()
+        try:
+            self._bench_switch("layer_switch", results)
+            settings.profile_mode = True
+            nexahub._update_profiles(force=True)
+            self._bench_switch("profile_switch", results)
+        finally:
+            settings.profile_mode = False
+            nexahub._update_profiles(force=True)
+            for activity in running:
+                activity.start()
+
+    def bench_keymap_refresh(self, results: Dict[str, float]):
+        """_poll_keymap round-trips (keycodes + encoder) until the keymap event."""
+        samples = []
+        for _ in range(self.iterations):
+            waiter = Waiter()
+            self._keymap_waiter = waiter
+            start = time.perf_counter()
+            self.nexahub._poll_keymap()
+            if waiter.wait(2.0):
+                samples.append((waiter.done_at - start) * 1000)
+        self._keymap_waiter = None
+        _summarize("keymap_refresh", samples, results)
+
+    def bench_key_paint(self, results: Dict[str, float]):
+        """Device key event -> overlay key cell painted."""
+        grid = self.nexahub.overlay_window.keymap_grid
+        row, col = 1, 1
+        cell = grid.cell_rect(row, col)
+        samples = []
+        for i in range(self.iterations):
+            waiter = Waiter()
+            probe = PaintProbe(waiter, cell)
+            grid.installEventFilter(probe)
+            start = time.perf_counter()
+            self.device.press_key(row, col, pressed=(i % 2 == 0))
+            if waiter.wait(2.0):
+                samples.append((waiter.done_at - start) * 1000)
+            grid.removeEventFilter(probe)
+        _summarize("key_paint", samples, results)
+
+    def bench_key_record(self, results: Dict[str, float]):
+        """Per-press cost of key usage recording (must stay well under 1 us)."""
+        analytics = self.nexahub.key_analytics
+        analytics.set_app(SCRIPTED_APPS[0][0])
+        record = analytics.record
+        presses = 200000
+        start = time.perf_counter()
+        for i in range(presses):
+            record(i % 5, (i >> 2) & 3, i & 3)
+        results["key_record_ns"] = (time.perf_counter() - start) * 1e9 / presses
+
+    def bench_macro_trigger(self, results: Dict[str, float]):
+        """Key event received -> macro action started (a shell command)."""
+        macros = self.nexahub.macros
+        macros.configure([{"row": 3, "col": 3, "action": "command", "target": "exit 0"}])
+        self.nexahub._compile_macros()
+        macros._latencies.clear()
+        for _ in range(self.iterations):
+            self.device.press_key(3, 3, pressed=True)
+            self.device.press_key(3, 3, pressed=False)
+            _idle(0.05)
+        _idle(0.2)
+        summary = macros.latency_summary()
+        results["macro_trigger_p50_ms"] = summary["p50"]
+        results["macro_trigger_p95_ms"] = summary["p95"]
+        macros.configure(self.nexahub.settings.macros)
+        self.nexahub._compile_macros()
+
+    def bench_window_sample(self, results: Dict[str, float]):
+        """Per-sample cost of the monitor's own window source on a fake desktop."""
+        tree = FakeWindowTree()
+        windows = [
+            tree.add_uwp_app("Calculator.exe", "Calculator"),
+            tree.add_app("Code.exe", "main.py - project - Visual Studio Code"),
+            tree.add_window(tree.add_process("explorer.exe"), "MultitaskingViewFrame"),
+        ]
+        sample = WindowMonitor(ForegroundState(), tree=tree)._get_active_window_info
+        samples = 30000
+        start = time.perf_counter()
+        for i in range(samples):
+            tree.focus(windows[i % len(windows)])
+            sample()
+        results["window_sample_us"] = (time.perf_counter() - start) * 1e6 / samples
+
+    def bench_idle_cpu(self, results: Dict[str, float]):
+        """CPU time, wakeups and overlay relayouts while idle."""
+        overlay = self.nexahub.overlay_window
+        relayouts = overlay.relayouts
+        cpu_start = self.process.cpu_times()
+        _idle(self.idle_seconds)
+        cpu_end = self.process.cpu_times()
+        used = (cpu_end.user - cpu_start.user) + (cpu_end.system - cpu_start.system)
+        results["idle_cpu_s_per_hour"] = used * 3600.0 / self.idle_seconds
+        results["idle_wakeups_per_min"] = self.nexahub.power.wakeups_per_minute()
+        # Keymap polls with unchanged content must not touch the geometry
+        results["idle_relayouts_per_min"] = (
+            (overlay.relayouts - relayouts) * 60.0 / self.idle_seconds
+        )
+
+    def bench_memory_growth(self, results: Dict[str, float]):
+        """RSS growth over a long run of focus changes, key events and polls."""
+        _idle(0.1)
+        rss_start = self.process.memory_info().rss
+        for i in range(self.soak_cycles):
+            name, _ = SCRIPTED_APPS[i % len(SCRIPTED_APPS)]
+            self.focus.set(name, f"{name} window {i}")
+            self.device.press_key(i % 4, (i // 4) % 4, pressed=True)
+            self.device.press_key(i % 4, (i // 4) % 4, pressed=False)
+            self.nexahub._poll_keymap()
+            _idle(0.01)
+        rss_end = self.process.memory_info().rss
+        results["memory_growth_kb"] = (rss_end - rss_start) / 1024.0
+
+    def run(self) -> Dict[str, float]:
+        results: Dict[str, float] = {}
+        # Let the app connect, start monitoring and settle
+        _idle(1.0)
+        self.bench_focus_switch(results)
+        self.bench_profile_switch(results)
+        self.bench_keymap_refresh(results)
+        self.bench_key_paint(results)
+        self.bench_key_record(results)
+        self.bench_macro_trigger(results)
+        self.bench_window_sample(results)
+        self.bench_idle_cpu(results)
+        self.bench_memory_growth(results)
+        return results
+
+    def run_in_loop(self) -> Dict[str, float]:
+        """Run the scenarios, inside the asyncio loop when the core uses one."""
+        loop = self.nexahub.loop
+        if loop is None:
+            return self.run()
+
+        results: Dict[str, float] = {}
+
+        def scenarios():
+            # A plain callback (not a task), so nested Qt loops can step tasks
+            results.update(self.run())
+            loop.stop()
+
+        loop.call_soon(scenarios)
+        loop.run_forever()
+        return results
+
+
+def compare_with_baseline(results: Dict[str, float], baseline: Dict[str, float]) -> List[str]:
+    """Return a list of human-readable regressions."""
+    regressions = []
+    for metric, (ratio, slack) in REGRESSION_THRESHOLDS.items():
+        if metric not in results or metric not in baseline:
+            continue
+        limit = baseline[metric] * ratio + slack
+        if results[metric] > limit:
+            regressions.append(
+                f"{metric}: {results[metric]:.3f} > {limit:.3f} "
+                f"(baseline {baseline[metric]:.3f})"
+            )
+    return regressions
+
+
+def main():
+    """Entry point."""
+    parser = argparse.ArgumentParser(description="NexaHub host pipeline benchmarks")
+    parser.add_argument("--iterations", type=int, default=40)
+    parser.add_argument("--idle-seconds", type=float, default=30.0)
+    parser.add_argument("--soak-cycles", type=int, default=2000)
+    parser.add_argument("--quick", action="store_true", help="Short smoke run")
+    parser.add_argument(
+        "--async-core", action="store_true", help="Use the asyncio HID core (needs qasync)"
+    )
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="Store results as the new baseline"
+    )
+    args = parser.parse_args()
+
+    if args.quick:
+        args.iterations, args.idle_seconds, args.soak_cycles = 8, 3.0, 100
+
+    runner = BenchmarkRunner(
+        args.iterations, args.idle_seconds, args.soak_cycles, args.async_core
+    )
+    try:
+        results = runner.run_in_loop()
+    finally:
+        runner.close()
+
+    for metric, value in sorted(results.items()):
+        print(f"{metric:28s} {value:12.3f}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline found; run with --save-baseline to create one.")
+        return 0
+
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+
+    regressions = compare_with_baseline(results, baseline)
+    if regressions:
+        print("\nRegressions:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+
+    print("\nNo regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
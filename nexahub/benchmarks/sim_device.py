@@ -0,0 +1,300 @@
+"""Simulated NexaPad for headless benchmarks.
+
+Implements the subset of the pywinusb ``HidDevice`` interface used by
+HIDManager and answers reports the way the firmware in keymaps/default does.
+"""
+
+import json
+import lzma
+import queue
+import random
+import threading
+import time
+from typing import Callable, List, Optional
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine.hid_manager import HIDManager
+from engine.capabilities import (
+    FEATURE_LAYER_EVENTS,
+    FEATURE_KEY_EVENTS,
+    FEATURE_OLED_TIMEOUT,
+    FEATURE_ENCODER_READ,
+    FEATURE_ENCODER_MAP,
+    FEATURE_EVENT_SUBSCRIBE,
+    FEATURE_PROFILES,
+)
+from engine.hid_protocol import (
+    EVENT_MASK_LAYER,
+    EVENT_MASK_KEY,
+    EVENT_MASK_KEY_BATCH,
+    EVENT_MASK_DEFAULT,
+    KEY_BATCH_PRESSED,
+    VIA_UNHANDLED,
+    VIAL_CMD_GET_KEYBOARD_ID,
+    VIAL_CMD_GET_SIZE,
+    VIAL_CMD_GET_DEFINITION,
+    VIAL_DEFINITION_BLOCK,
+)
+
+# Key events per 0xFB 0x03 report (NEXAHUB_KEY_BATCH_MAX)
+KEY_BATCH_MAX = 14
+
+# Raw HID endpoint size used by QMK
+REPORT_SIZE = 32
+
+# VIAL_KEYBOARD_UID of keymaps/default/config.h
+VIAL_KEYBOARD_UID = bytes([0x0A, 0xA3, 0x01, 0x10, 0x46, 0x68, 0xAD, 0xC2])
+VIAL_PROTOCOL_VERSION = 6
+
+
+class SimulatedDevice:
+    """Firmware model answering VIA, Vial and NexaHub commands."""
+
+    vendor_id = HIDManager.VENDOR_ID
+    product_id = HIDManager.PRODUCT_ID
+    product_name = "NexaPad (simulated)"
+
+    def __init__(
+        self,
+        serial_number: str = "SIM0001",
+        latency: float = 0.002,
+        num_layers: int = 5,
+        rows: int = 4,
+        cols: int = 4,
+        num_encoders: int = 1,
+        drop_rate: float = 0.0,
+        protocol_version: int = 1,
+        vial: bool = True,
+        encoder_map_read: bool = True,
+    ):
+        self.serial_number = serial_number
+        # bcdDevice; part of the capability cache key
+        self.version_number = 0x0001
+        self.device_path = f"sim://{serial_number}"
+        self.latency = latency
+        self.num_layers = num_layers
+        self.rows = rows
+        self.cols = cols
+        self.num_encoders = num_encoders
+        # 0 models firmware from before the capability handshake
+        self.protocol_version = protocol_version
+        # False models firmware with the per-encoder read (0x06) only
+        self.encoder_map_read = encoder_map_read
+        # Compressed vial.json; None models firmware without Vial
+        self.vial_definition = self._vial_definition() if vial else None
+        self.definition_reads = 0
+        # Fault injection: fraction of requests left unanswered, and unplug
+        self.drop_rate = drop_rate
+        self.unplugged = False
+        self._rng = random.Random(serial_number)
+
+        # Same content as keymaps/default/keymap.c: TO(n+1) everywhere
+        self.keymaps: List[List[int]] = [
+            [0x5200 | ((layer + 1) % num_layers)] * (rows * cols)
+            for layer in range(num_layers)
+        ]
+        # encoder_map[layer][encoder] = (ccw, cw)
+        self.encoder_map = [
+            [(0x00A9 + layer, 0x00AA + layer)] * num_encoders
+            for layer in range(num_layers)
+        ]
+        self.layer = 0
+        self.oled_timeout = 1
+        self.event_mask = EVENT_MASK_DEFAULT
+        self.profile_layers: List[int] = []
+
+        self._handler: Optional[Callable[[List[int]], None]] = None
+        self._queue: "queue.Queue[Optional[bytes]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # --- pywinusb HidDevice interface ---
+    def open(self):
+        pass
+
+    def close(self):
+        self._queue.put(None)
+
+    def set_raw_data_handler(self, handler: Callable[[List[int]], None]):
+        self._handler = handler
+
+    def send_output_report(self, report) -> bool:
+        if self.unplugged:
+            raise OSError("Device not connected")
+        self._queue.put(bytes(report))
+        return True
+
+    # --- Device-initiated events ---
+    def press_key(self, row: int, col: int, pressed: bool = True):
+        """Emit a key event as process_record_user does."""
+        self.scan([(row, col, pressed)])
+
+    def scan(self, events):
+        """Emit the (row, col, pressed) events of one matrix scan."""
+        if self.protocol_version and self.event_mask & EVENT_MASK_KEY_BATCH:
+            # Flushed by housekeeping_task_user after the scan
+            for start in range(0, len(events), KEY_BATCH_MAX):
+                batch = events[start : start + KEY_BATCH_MAX]
+                payload = [0xFB, 0x03, len(batch)]
+                for row, col, pressed in batch:
+                    payload += [row, col | (KEY_BATCH_PRESSED if pressed else 0)]
+                self._send(payload)
+        elif self.event_mask & EVENT_MASK_KEY:
+            for row, col, pressed in events:
+                self._send([0xFB, 0x02, row, col, 1 if pressed else 0])
+
+    def set_layer(self, layer: int):
+        """Change layer on the device side (e.g. a TO() key)."""
+        self._layer_move(layer)
+
+    # --- Firmware model ---
+    def _run(self):
+        while True:
+            report = self._queue.get()
+            if report is None:
+                break
+            if self.latency > 0:
+                time.sleep(self.latency)
+            if self.drop_rate and self._rng.random() < self.drop_rate:
+                continue
+            self._handle(bytearray(report[1 : REPORT_SIZE + 1]))
+
+    def _send(self, payload):
+        data = bytearray(REPORT_SIZE)
+        data[: len(payload)] = bytes(payload)
+        if self._handler:
+            self._handler([0x00] + list(data))
+
+    def _layer_move(self, layer: int):
+        if layer != self.layer:
+            self.layer = layer
+            # layer_state_set_user notifies the host
+            if self.event_mask & EVENT_MASK_LAYER:
+                self._send([0xFB, 0x01, layer])
+
+    def _vial_definition(self) -> bytes:
+        """vial.json like keymaps/default: encoder row above the key matrix."""
+        rows = [[f"{row},{col}" for col in range(self.cols)] for row in range(self.rows)]
+        if self.num_encoders:
+            rows.insert(0, ["0,0\n\n\n\n\n\n\n\n\ne", "0,1\n\n\n\n\n\n\n\n\ne"])
+        definition = {
+            "name": "NexaPad (simulated)",
+            "matrix": {"rows": self.rows, "cols": self.cols},
+            "layouts": {"keymap": rows},
+        }
+        return lzma.compress(json.dumps(definition).encode())
+
+    def _keymap_buffer(self) -> bytes:
+        buf = bytearray()
+        for layer in self.keymaps:
+            for kc in layer:
+                buf += bytes([kc >> 8, kc & 0xFF])
+        return bytes(buf)
+
+    def _handle(self, data: bytearray):
+        """Mirror raw_hid_receive (VIA/Vial) and raw_hid_receive_kb."""
+        if data[0] == 0xFC:
+            cmd = data[1]
+            if cmd == 0x01:
+                self._layer_move(data[2])
+                data[1] = 0xFD
+            elif cmd == 0x02:
+                data[2] = self.layer
+                data[1] = 0xFD
+            elif cmd == 0x03:
+                self.oled_timeout = data[2]
+                data[1] = 0xFD
+            elif cmd == 0x04:
+                data[2] = self.oled_timeout
+                data[1] = 0xFD
+            elif cmd == 0x05 and self.protocol_version:
+                features = (
+                    FEATURE_LAYER_EVENTS
+                    | FEATURE_KEY_EVENTS
+                    | FEATURE_OLED_TIMEOUT
+                    | FEATURE_EVENT_SUBSCRIBE
+                    | FEATURE_PROFILES
+                )
+                if self.num_encoders:
+                    features |= FEATURE_ENCODER_READ
+                    if self.encoder_map_read:
+                        features |= FEATURE_ENCODER_MAP
+                data[1:10] = bytes([
+                    0xFD, 0x05, self.protocol_version, self.rows, self.cols,
+                    self.num_layers, self.num_encoders, features >> 8, features & 0xFF,
+                ])
+            elif (
+                cmd == 0x06
+                and self.protocol_version
+                and data[2] < self.num_layers
+                and data[3] < self.num_encoders
+            ):
+                layer, idx = data[2], data[3]
+                ccw, cw = self.encoder_map[layer][idx]
+                data[1:9] = bytes([
+                    0xFD, 0x06, layer, idx, ccw >> 8, ccw & 0xFF, cw >> 8, cw & 0xFF,
+                ])
+            elif (
+                cmd == 0x0A
+                and self.protocol_version
+                and self.encoder_map_read
+                and 0 < data[3] <= (REPORT_SIZE - 5) // 4
+                and data[2] + data[3] <= self.num_layers * self.num_encoders
+            ):
+                first, count = data[2], data[3]
+                data[1:5] = bytes([0xFD, 0x0A, first, count])
+                for i in range(count):
+                    layer, idx = divmod(first + i, self.num_encoders)
+                    ccw, cw = self.encoder_map[layer][idx]
+                    data[5 + 4 * i : 9 + 4 * i] = bytes([ccw >> 8, ccw & 0xFF, cw >> 8, cw & 0xFF])
+            elif cmd == 0x07 and self.protocol_version:
+                self.event_mask = data[2]
+                data[1] = 0xFD
+            elif cmd == 0x08 and self.protocol_version:
+                count = min(data[2], 16)
+                self.profile_layers = [min(layer, self.num_layers - 1) for layer in data[3 : 3 + count]]
+                data[1] = 0xFD
+            elif cmd == 0x09 and self.protocol_version:
+                # Not acknowledged
+                if data[2] < len(self.profile_layers):
+                    self._layer_move(self.profile_layers[data[2]])
+                return
+        elif data[0] == HIDManager.VIA_CMD_GET_KEYMAP_BUFFER:
+            offset = (data[1] << 8) | data[2]
+            size = min(data[3], REPORT_SIZE - 4)
+            chunk = self._keymap_buffer()[offset : offset + size]
+            data[4 : 4 + len(chunk)] = chunk
+        elif data[0] == HIDManager.VIA_CMD_VIAL_PREFIX:
+            if self.vial_definition is None:
+                data[0] = VIA_UNHANDLED
+            elif data[1] == HIDManager.VIAL_CMD_GET_ENCODER:
+                layer, idx = data[2], data[3]
+                ccw, cw = self.encoder_map[layer][idx]
+                data[0:4] = bytes([ccw >> 8, ccw & 0xFF, cw >> 8, cw & 0xFF])
+            elif data[1] == VIAL_CMD_GET_KEYBOARD_ID:
+                data[0:4] = VIAL_PROTOCOL_VERSION.to_bytes(4, "little")
+                data[4:12] = VIAL_KEYBOARD_UID
+            elif data[1] == VIAL_CMD_GET_SIZE:
+                data[0:4] = len(self.vial_definition).to_bytes(4, "little")
+            elif data[1] == VIAL_CMD_GET_DEFINITION:
+                self.definition_reads += 1
+                start = int.from_bytes(data[2:6], "little") * VIAL_DEFINITION_BLOCK
+                block = self.vial_definition[start : start + VIAL_DEFINITION_BLOCK]
+                data[0:VIAL_DEFINITION_BLOCK] = block.ljust(VIAL_DEFINITION_BLOCK, b"\0")
+        self._send(data)
+
+
+class SimulatedHIDManager(HIDManager):
+    """HIDManager that 'finds' SimulatedDevices instead of enumerating USB."""
+
+    def __init__(self, *devices: SimulatedDevice):
+        super().__init__()
+        self.sim_devices = list(devices)
+
+    def discover_devices(self, exclude=()) -> List[SimulatedDevice]:
+        self.last_error = None
+        return [d for d in self.sim_devices if d.device_path not in exclude]
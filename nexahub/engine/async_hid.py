@@ -0,0 +1,354 @@
+"""Optional asyncio core for HID transactions and focus changes.
+
+Enabled by the "async_core" setting when qasync is installed. The asyncio
+loop runs inside the Qt event loop, so coroutines run on the GUI thread:
+responses are awaited instead of blocking in ``Event.wait`` loops, and many
+transactions can be in flight without extra threads.
+"""
+
+import asyncio
+import time
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+try:
+    import qasync
+except ImportError:  # Optional dependency; the threaded core is used instead
+    qasync = None
+
+from engine.hid_manager import HIDManager
+from engine.hid_protocol import (
+    strip_report_id,
+    COMMAND_PREFIX,
+    ACK,
+    EVENT_PREFIX,
+    VIA_CMD_GET_KEYMAP_BUFFER,
+    VIA_CMD_VIAL_PREFIX,
+    VIA_MAX_CHUNK,
+    CMD_SWITCH_LAYER,
+    CMD_GET_LAYER,
+    COMMAND_TAG_OFFSET,
+    CMD_GET_ENCODER,
+    CMD_GET_ENCODER_MAP,
+    ENCODER_MAP_CHUNK,
+    command_tag,
+    is_command_ack,
+)
+from engine.capabilities import FEATURE_ENCODER_READ, FEATURE_ENCODER_MAP
+from engine.foreground_state import ForegroundState
+from engine.latency_tracer import tracer
+from engine.hid_reliability import backoff_delay
+
+
+def async_available() -> bool:
+    """True when qasync is installed."""
+    return qasync is not None
+
+
+def install_event_loop(app) -> Optional[asyncio.AbstractEventLoop]:
+    """Create an asyncio loop driven by the Qt event loop of ``app``.
+
+    Returns None when qasync is not installed. The loop must be run with
+    ``loop.run_forever()`` (which runs ``app.exec()``) for tasks to progress.
+    """
+    if qasync is None:
+        return None
+    loop = qasync.QEventLoop(app)
+    asyncio.set_event_loop(loop)
+    return loop
+
+
+class AsyncHIDClient:
+    """Awaitable transactions on top of one HIDManager.
+
+    Each transaction registers a matcher for its response before sending.
+    Incoming reports are handed to the loop thread and resolve the first
+    pending transaction they match. VIA keymap reads are matched by offset,
+    so several can be in flight at once; encoder reads and 0xFC commands
+    have no identifiable response and are serialized.
+    """
+
+    def __init__(self, hid: HIDManager, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.hid = hid
+        self.loop = loop or asyncio.get_event_loop()
+        self._pending: List[Tuple[Callable[[bytes], bool], asyncio.Future]] = []
+        self._encoder_lock = asyncio.Lock()
+        self._command_lock = asyncio.Lock()
+        hid.register_callback(self._on_report)
+
+    def close(self):
+        """Stop receiving reports and cancel pending transactions."""
+        self.hid.unregister_callback(self._on_report)
+        for _, future in self._pending:
+            future.cancel()
+        self._pending.clear()
+
+    def _on_report(self, data: bytes):
+        """Called on the HID thread."""
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._dispatch, bytes(data))
+
+    def _dispatch(self, data: bytes):
+        """Resolve the oldest pending transaction matching this report."""
+        payload = strip_report_id(data)
+        for i, (match, future) in enumerate(self._pending):
+            if not future.done() and match(payload):
+                del self._pending[i]
+                future.set_result(payload)
+                return
+
+    async def transact(
+        self,
+        payload: bytes,
+        match: Callable[[bytes], bool],
+    ) -> Optional[bytes]:
+        """Send a report and await the first response accepted by ``match``.
+
+        Uses the HIDManager's round-trip estimator (keyed by the first
+        payload byte), retry policy and circuit breaker. Returns the
+        response payload (report ID stripped), or None on failure.
+        Sends never block the loop: a send error or a handle busy with
+        another thread's write is retried after an awaited backoff.
+        Cancellation propagates to the caller.
+        """
+        hid = self.hid
+        if not hid.breaker.allow():
+            return None
+        rtt = hid.rtt_for(payload[0])
+        # Error of the last send attempt, if it failed
+        send_error = None
+
+        for attempt in range(hid.MAX_RETRIES + 1):
+            if attempt:
+                hid.stats.record_retry()
+                await asyncio.sleep(backoff_delay(attempt))
+
+            future = self.loop.create_future()
+            entry = (match, future)
+            # Registered before sending: the response may beat the send's return
+            self._pending.append(entry)
+            try:
+                if not hid.connected:
+                    return None
+                sent_at = time.perf_counter()
+                try:
+                    # Never blocks the loop: a busy handle is retried like an error
+                    sent = hid.try_send_report(payload)
+                except Exception as e:
+                    send_error = e
+                    continue
+                send_error = None
+                if not sent:
+                    continue
+                response = await asyncio.wait_for(future, rtt.timeout(attempt))
+            except asyncio.TimeoutError:
+                hid.stats.record_timeout()
+                continue
+            finally:
+                if entry in self._pending:
+                    self._pending.remove(entry)
+
+            # Karn's rule: a retried request's round-trip is ambiguous
+            if attempt == 0:
+                rtt.observe(time.perf_counter() - sent_at)
+            hid.breaker.record_success()
+            return response
+
+        if send_error is not None:
+            hid.send_failed(send_error)
+        hid.breaker.record_failure()
+        return None
+
+    # --- NexaHub commands (0xFC) ---
+    @staticmethod
+    def _is_ack(payload: bytes) -> bool:
+        return len(payload) > 2 and payload[0] == COMMAND_PREFIX and payload[1] == ACK
+
+    @staticmethod
+    def _command_report(command: int, data: bytes = b"") -> bytes:
+        """[0xFC][command][data], with the command's tag for its ack to echo."""
+        report = bytearray(COMMAND_TAG_OFFSET)
+        report[0] = COMMAND_PREFIX
+        report[1] = command
+        report[2 : 2 + len(data)] = data[: COMMAND_TAG_OFFSET - 2]
+        return bytes(report) + command_tag(command)
+
+    async def command(self, command: int, data: bytes = b"") -> Optional[bytes]:
+        """Send an 0xFC command and await its acknowledgement."""
+        # Acks overwrite the command byte, so only one may be outstanding
+        async with self._command_lock:
+            return await self.transact(
+                self._command_report(command, data), lambda p: is_command_ack(p, command)
+            )
+
+    async def switch_layer(self, layer: int) -> bool:
+        """Switch layer; True once the pad acknowledged it."""
+        async with self._command_lock:
+            if tracer.enabled:
+                tracer.mark(tracer.STAGE_SWITCH)
+            # The ack echoes the layer: a switch sent by another thread is not ours
+            response = await self.transact(
+                self._command_report(CMD_SWITCH_LAYER, bytes([layer])),
+                lambda p: is_command_ack(p, CMD_SWITCH_LAYER) and p[2] == layer,
+            )
+        return response is not None
+
+    async def get_current_layer(self) -> Optional[int]:
+        """Current layer as reported in the acknowledgement."""
+        async with self._command_lock:
+            response = await self.transact(
+                self._command_report(CMD_GET_LAYER), lambda p: is_command_ack(p, CMD_GET_LAYER)
+            )
+        return response[2] if response else None
+
+    # --- VIA / Vial ---
+    async def get_keymap_buffer(self, offset: int, size: int) -> Optional[bytes]:
+        """Read ``size`` bytes of the dynamic keymap at ``offset``."""
+        request = bytes([VIA_CMD_GET_KEYMAP_BUFFER, (offset >> 8) & 0xFF, offset & 0xFF, size])
+        response = await self.transact(
+            request,
+            lambda p: len(p) > 4 and bytes(p[:3]) == request[:3],
+        )
+        return bytes(response[4 : 4 + size]) if response else None
+
+    async def get_layer_keycodes(self, layer: int) -> Optional[List[int]]:
+        """Read all keycodes of a layer; the chunk reads run concurrently."""
+        caps = self.hid.capabilities
+        if layer < 0 or layer >= caps.layers:
+            return None
+
+        size = caps.layer_size
+        offset = layer * size
+        chunks = await asyncio.gather(
+            *(
+                self.get_keymap_buffer(offset + start, min(VIA_MAX_CHUNK, size - start))
+                for start in range(0, size, VIA_MAX_CHUNK)
+            )
+        )
+        if any(chunk is None for chunk in chunks):
+            return None
+
+        buffer = b"".join(chunks)
+        return [(buffer[i] << 8) | buffer[i + 1] for i in range(0, size, 2)]
+
+    async def get_encoder_keycodes(self, layer: int, encoder_idx: int) -> Optional[Tuple[int, int]]:
+        """Read (ccw, cw) keycodes of an encoder."""
+        if self.hid.capabilities.has(FEATURE_ENCODER_READ):
+            # Its ack would also satisfy a pending command's matcher
+            async with self._command_lock:
+                response = await self.transact(
+                    bytes([COMMAND_PREFIX, CMD_GET_ENCODER, layer, encoder_idx]),
+                    lambda p: len(p) > 8
+                    and p[0] == COMMAND_PREFIX
+                    and (
+                        p[1] == CMD_GET_ENCODER
+                        or bytes(p[1:5]) == bytes([ACK, CMD_GET_ENCODER, layer, encoder_idx])
+                    ),
+                )
+            if response is None:
+                return None
+            if response[1] == ACK:
+                return ((response[5] << 8) | response[6], (response[7] << 8) | response[8])
+            # Echoed unchanged: firmware without the command
+            self.hid.drop_capability(FEATURE_ENCODER_READ)
+
+        # The response overwrites the command bytes with the keycodes, so it
+        # is only recognizable as "the next report that is not something else"
+        async with self._encoder_lock:
+            response = await self.transact(
+                bytes([VIA_CMD_VIAL_PREFIX, HIDManager.VIAL_CMD_GET_ENCODER, layer, encoder_idx]),
+                lambda p: len(p) > 3
+                and p[0] not in (EVENT_PREFIX, VIA_CMD_GET_KEYMAP_BUFFER)
+                and not self._is_ack(p),
+            )
+        if not response:
+            return None
+        return ((response[0] << 8) | response[1], (response[2] << 8) | response[3])
+
+    async def _get_encoder_map_chunk(self, first: int, count: int) -> Optional[List[Tuple[int, int]]]:
+        """Read ``count`` encoder map entries from ``first`` with 0x0A."""
+        async with self._command_lock:
+            response = await self.transact(
+                bytes([COMMAND_PREFIX, CMD_GET_ENCODER_MAP, first, count]),
+                lambda p: len(p) > 4
+                and p[0] == COMMAND_PREFIX
+                and (
+                    p[1] == CMD_GET_ENCODER_MAP
+                    or bytes(p[1:4]) == bytes([ACK, CMD_GET_ENCODER_MAP, first])
+                ),
+            )
+        if response is None:
+            return None
+        if response[1] != ACK:
+            # Echoed unchanged: firmware without the command
+            self.hid.drop_capability(FEATURE_ENCODER_MAP)
+            return None
+        entries = []
+        for offset in range(5, 5 + 4 * response[4], 4):
+            ccw_hi, ccw_lo, cw_hi, cw_lo = response[offset : offset + 4]
+            entries.append(((ccw_hi << 8) | ccw_lo, (cw_hi << 8) | cw_lo))
+        return entries
+
+    async def get_layer_encoders(self, layer: int) -> Optional[Tuple[int, ...]]:
+        """Keycodes of every encoder on a layer, flattened (ccw0, cw0, ccw1, ...)."""
+        encoders = self.hid.capabilities.encoders
+        if not encoders:
+            return None
+
+        entries = None
+        if self.hid.capabilities.has(FEATURE_ENCODER_MAP):
+            first = layer * encoders
+            chunks = await asyncio.gather(
+                *(
+                    self._get_encoder_map_chunk(first + start, min(ENCODER_MAP_CHUNK, encoders - start))
+                    for start in range(0, encoders, ENCODER_MAP_CHUNK)
+                )
+            )
+            if all(chunk is not None for chunk in chunks):
+                entries = [entry for chunk in chunks for entry in chunk]
+            elif self.hid.capabilities.has(FEATURE_ENCODER_MAP):
+                return None
+        if entries is None:
+            entries = await asyncio.gather(
+                *(self.get_encoder_keycodes(layer, idx) for idx in range(encoders))
+            )
+            if any(entry is None for entry in entries):
+                return None
+        return tuple(keycode for entry in entries for keycode in entry)
+
+    async def read_keymap(self, layer: int) -> Optional[Tuple[list, Optional[tuple]]]:
+        """Keycodes and encoders of a layer, read concurrently."""
+        keycodes, encoder_keycodes = await asyncio.gather(
+            self.get_layer_keycodes(layer), self.get_layer_encoders(layer)
+        )
+        if not keycodes:
+            return None
+        return keycodes, encoder_keycodes
+
+
+async def focus_changes(
+    state: ForegroundState,
+) -> AsyncIterator[Tuple[str, Optional[str]]]:
+    """Async stream of foreground changes published to ``state``.
+
+    Starts with the current foreground window, if any. Changes that pile up
+    while the consumer is busy are coalesced: only the latest is yielded.
+    """
+    loop = asyncio.get_running_loop()
+    queue: "asyncio.Queue[Tuple[str, Optional[str]]]" = asyncio.Queue()
+
+    def on_change(process_name: str, window_title: Optional[str]):
+        # Called on the monitor thread
+        loop.call_soon_threadsafe(queue.put_nowait, (process_name, window_title))
+
+    state.subscribe(on_change)
+    current = state.current()
+    if current is not None:
+        queue.put_nowait(current)
+    try:
+        while True:
+            change = await queue.get()
+            while not queue.empty():
+                change = queue.get_nowait()
+            yield change
+    finally:
+        state.unsubscribe(on_change)
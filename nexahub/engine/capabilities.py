@@ -0,0 +1,193 @@
+"""Firmware capability handshake (0xFC 0x05) and its per-device cache.
+
+Reply layout, written in place by raw_hid_receive_kb:
+
+    [0xFC][0xFD][0x05][version][rows][cols][layers][encoders][features_hi][features_lo]
+
+Firmware without the handshake echoes the request unchanged
+([0xFC][0x05]...), which identifies it as legacy without a timeout.
+"""
+
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from engine.hid_protocol import COMMAND_PREFIX, ACK, CMD_GET_CAPABILITIES
+
+# Host protocol version understood by this app
+PROTOCOL_VERSION = 1
+
+# Feature bits
+FEATURE_LAYER_EVENTS = 1 << 0  # 0xFB 0x01 layer change events
+FEATURE_KEY_EVENTS = 1 << 1  # 0xFB 0x02 key events
+FEATURE_OLED_TIMEOUT = 1 << 2  # 0xFC 0x03 / 0x04
+FEATURE_ENCODER_READ = 1 << 3  # 0xFC 0x06 tagged encoder read
+FEATURE_EVENT_SUBSCRIBE = 1 << 4  # 0xFC 0x07 event mask, 0xFB 0x03 key batches
+FEATURE_PROFILES = 1 << 5  # 0xFC 0x08 / 0x09 profile slots
+FEATURE_ENCODER_MAP = 1 << 6  # 0xFC 0x0A bulk encoder map read
+
+FEATURE_NAMES = {
+    FEATURE_LAYER_EVENTS: "layer_events",
+    FEATURE_KEY_EVENTS: "key_events",
+    FEATURE_OLED_TIMEOUT: "oled_timeout",
+    FEATURE_ENCODER_READ: "encoder_read",
+    FEATURE_EVENT_SUBSCRIBE: "event_subscribe",
+    FEATURE_PROFILES: "profiles",
+    FEATURE_ENCODER_MAP: "encoder_map",
+}
+
+
+class DeviceCapabilities:
+    """What a pad's firmware supports and how its keymap is sized."""
+
+    def __init__(
+        self,
+        protocol_version: int,
+        rows: int,
+        cols: int,
+        layers: int,
+        encoders: int,
+        features: int,
+    ):
+        self.protocol_version = protocol_version
+        self.rows = rows
+        self.cols = cols
+        self.layers = layers
+        self.encoders = encoders
+        self.features = features
+
+    @property
+    def num_keys(self) -> int:
+        return self.rows * self.cols
+
+    @property
+    def layer_size(self) -> int:
+        """Bytes of one layer in the VIA dynamic keymap buffer."""
+        return self.num_keys * 2
+
+    @property
+    def negotiated(self) -> bool:
+        """True if the firmware answered the handshake (not legacy)."""
+        return self.protocol_version > 0
+
+    def has(self, feature: int) -> bool:
+        return bool(self.features & feature)
+
+    def without(self, feature: int) -> "DeviceCapabilities":
+        """Copy with a feature bit cleared."""
+        data = self.to_dict()
+        data["features"] &= ~feature
+        return DeviceCapabilities.from_dict(data)
+
+    def feature_names(self):
+        return [name for bit, name in FEATURE_NAMES.items() if self.has(bit)]
+
+    def to_dict(self) -> Dict[str, int]:
+        return {
+            "protocol_version": self.protocol_version,
+            "rows": self.rows,
+            "cols": self.cols,
+            "layers": self.layers,
+            "encoders": self.encoders,
+            "features": self.features,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DeviceCapabilities":
+        return cls(
+            int(data["protocol_version"]),
+            int(data["rows"]),
+            int(data["cols"]),
+            int(data["layers"]),
+            int(data["encoders"]),
+            int(data["features"]),
+        )
+
+    @classmethod
+    def parse(cls, payload: bytes) -> Optional["DeviceCapabilities"]:
+        """Decode a handshake reply (report ID stripped).
+
+        Returns LEGACY_CAPABILITIES for an echoed request, None if the
+        payload is not a handshake reply.
+        """
+        if len(payload) < 10 or payload[0] != COMMAND_PREFIX:
+            return None
+        if payload[1] == CMD_GET_CAPABILITIES:
+            return LEGACY_CAPABILITIES
+        if payload[1] != ACK or payload[2] != CMD_GET_CAPABILITIES:
+            return None
+        return cls(
+            payload[3],
+            payload[4],
+            payload[5],
+            payload[6],
+            payload[7],
+            (payload[8] << 8) | payload[9],
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, DeviceCapabilities) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return (
+            f"DeviceCapabilities(v{self.protocol_version}, {self.rows}x{self.cols}, "
+            f"{self.layers} layers, {self.encoders} encoders, {self.feature_names()})"
+        )
+
+
+# Firmware predating the handshake: the original NexaPad keymap
+LEGACY_CAPABILITIES = DeviceCapabilities(
+    0, 4, 4, 5, 1, FEATURE_LAYER_EVENTS | FEATURE_KEY_EVENTS | FEATURE_OLED_TIMEOUT
+)
+
+
+class CapabilityCache:
+    """Handshake results persisted per device (serial number + firmware release).
+
+    Used when a pad does not answer the handshake; an answer replaces the entry.
+    """
+
+    def __init__(self, file_path: Optional[Path] = None):
+        self.file_path = (
+            Path(file_path) if file_path else Path.home() / ".nexahub" / "capabilities.json"
+        )
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, int]] = {}
+        self._load()
+
+    def _load(self):
+        if self.file_path.exists():
+            try:
+                with open(self.file_path, "r") as f:
+                    self._entries = json.load(f)
+            except (json.JSONDecodeError, IOError):
+                self._entries = {}
+
+    def _save(self):
+        try:
+            self.file_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.file_path, "w") as f:
+                json.dump(self._entries, f, indent=4)
+        except IOError as e:
+            print(f"Could not save capability cache: {e}")
+
+    def get(self, key: str) -> Optional[DeviceCapabilities]:
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        try:
+            return DeviceCapabilities.from_dict(entry)
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def put(self, key: str, capabilities: DeviceCapabilities):
+        with self._lock:
+            self._entries[key] = capabilities.to_dict()
+            self._save()
+
+    def remove(self, key: str):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._save()
@@ -0,0 +1,492 @@
+"""Pool of connected NexaPads.
+
+Every matching Raw HID interface gets its own HIDManager, layer state and
+keymap cache. Commands for a pad run on that pad's single worker thread, so
+a slow or wedged device never delays layer switches on another one.
+"""
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from engine.hid_manager import HIDManager
+from engine.hid_stats import HIDStats
+from engine.hid_capture import HIDCapture
+from engine.capabilities import CapabilityCache
+from engine.vial_definition import DefinitionCache
+from engine.keymap_snapshot import KeymapSnapshot, SnapshotStore
+from engine.profiles import ProfileTable
+from engine.hid_protocol import EVENT_MASK_DEFAULT
+
+
+def _read_keymap(hid: HIDManager, layer: int) -> Optional[Tuple[list, Optional[tuple]]]:
+    """Read keycodes and encoders of a layer (runs on the pad's worker)."""
+    keycodes = hid.get_layer_keycodes(layer)
+    if not keycodes:
+        return None
+    return keycodes, hid.get_layer_encoders(layer)
+
+
+def _read_keymaps(hid: HIDManager, layers: List[int]) -> Dict[int, Tuple[list, Optional[tuple]]]:
+    """Read several layers' keymaps; unreadable ones are left out."""
+    layers = [layer for layer in layers if 0 <= layer < hid.capabilities.layers]
+    keycodes = {layer: hid.get_layer_keycodes(layer) for layer in layers}
+    layers = [layer for layer in layers if keycodes[layer]]
+    encoder_map = hid.get_encoder_map(layers) if layers else None
+    return {
+        layer: (keycodes[layer], encoder_map.get(layer) if encoder_map else None)
+        for layer in layers
+    }
+
+
+def _initialize(
+    hid: HIDManager,
+    cache: Optional[CapabilityCache],
+    event_mask: int,
+    definitions: Optional[DefinitionCache] = None,
+) -> Dict[int, Tuple[list, Optional[tuple]]]:
+    """Negotiate capabilities and events, then read every layer and the encoder map.
+
+    Runs first on a new pad's worker, so later commands use the negotiated
+    sizes and the overlay finds every layer already cached. The Vial
+    definition (overlay layout) comes last; known pads load it from cache.
+    """
+    caps = hid.negotiate(cache)
+    # Also replaces a mask left behind by a host that did not exit cleanly
+    hid.subscribe_events(event_mask)
+    layers = hid.get_all_keycodes() or {}
+    encoder_map = (hid.get_encoder_map() if caps.encoders and layers else None) or {}
+    keymaps = {
+        layer: (keycodes, encoder_map.get(layer)) for layer, keycodes in layers.items()
+    }
+    hid.load_vial_definition(definitions)
+    return keymaps
+
+
+def _ping(hid: HIDManager) -> bool:
+    """Ask a pad for its layer (runs on the pad's worker); False once it is gone.
+
+    Only a failed send counts: a busy pad that misses the reply stays.
+    """
+    hid.get_current_layer()
+    return hid.connected
+
+
+def _load_profiles(
+    hid: HIDManager, table: ProfileTable, cached: List[int]
+) -> Optional[Dict[int, Tuple[list, Optional[tuple]]]]:
+    """Load profile slots, then prefetch keymaps of their layers not in ``cached``.
+
+    Returns the prefetched keymaps, or None if the slots were not loaded.
+    """
+    if not hid.load_profiles(table.layers):
+        return None
+    return _read_keymaps(hid, sorted(set(table.layers) - set(cached)))
+
+
+class PadState:
+    """Connection, layer and keymap cache of one pad."""
+
+    def __init__(self, key: str, hid: HIDManager, name: str):
+        self.key = key
+        self.hid = hid
+        self.name = name
+        self.current_layer: Optional[int] = None
+        # layer -> (keycodes, (ccw, cw) of every encoder flattened)
+        self.keymaps: Dict[int, Tuple[list, Optional[tuple]]] = {}
+        # layer -> time.monotonic() of the read, for freshness checks
+        self.keymap_read_at: Dict[int, float] = {}
+        # Profile slots loaded into the firmware (profile mode)
+        self.profiles: Optional[ProfileTable] = None
+        # Last connection check, answered on the worker (see DevicePool.check)
+        self.ping: Optional[Future] = None
+        # Commands queued or running on the worker
+        self.pending = 0
+        self._pending_lock = threading.Lock()
+        # Serializes commands to this pad; max_workers=1 keeps them ordered
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=f"pad-{key}"
+        )
+
+    @property
+    def connected(self) -> bool:
+        return self.hid.connected
+
+    def cached_keymap(self, layer: Optional[int]) -> Optional[Tuple[list, Optional[tuple]]]:
+        """Last keymap read for a layer, if any."""
+        if layer is None:
+            return None
+        return self.keymaps.get(layer)
+
+    def store_keymap(self, layer: int, keymap: Tuple[list, Optional[tuple]]):
+        self.keymaps[layer] = keymap
+        self.keymap_read_at[layer] = time.monotonic()
+
+    def seed_keymaps(self, snapshot: KeymapSnapshot):
+        """Fill the cache from a persisted snapshot until the pad answers.
+
+        Seeded layers have no read time, so they count as stale and are
+        replaced by the first read.
+        """
+        for layer, keymap in snapshot.keymaps.items():
+            self.keymaps.setdefault(layer, keymap)
+
+    def snapshot(self) -> Optional[KeymapSnapshot]:
+        """All layers as read from the pad, None until every layer was read once."""
+        caps = self.hid.capabilities
+        layers = range(caps.layers)
+        if not all(layer in self.keymap_read_at for layer in layers):
+            return None
+        keymaps = {layer: self.keymaps[layer] for layer in layers}
+        return KeymapSnapshot(self.current_layer or 0, caps.rows, caps.cols, keymaps)
+
+    def keymap_age(self, layer: int) -> float:
+        """Seconds since a layer's keymap was read (inf if never)."""
+        read_at = self.keymap_read_at.get(layer)
+        return float("inf") if read_at is None else time.monotonic() - read_at
+
+    def _track(self, delta: int):
+        with self._pending_lock:
+            self.pending += delta
+
+    def close(self):
+        """Disconnect and stop the worker (pending commands are dropped)."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.hid.disconnect()
+
+
+class DevicePool:
+    """Discovers every NexaPad and keeps one PadState per device.
+
+    Exposes ``stats``, ``capture``, ``start_capture`` and ``stop_capture``
+    like a single HIDManager, aggregated over all pads.
+    """
+
+    def __init__(
+        self,
+        scanner: Optional[HIDManager] = None,
+        capability_cache: Optional[CapabilityCache] = None,
+        definition_cache: Optional[DefinitionCache] = None,
+        snapshot_store: Optional[SnapshotStore] = None,
+    ):
+        # Only used for enumeration; each pad gets a fresh HIDManager
+        self.scanner = scanner or HIDManager()
+        self.capability_cache = capability_cache
+        self.definition_cache = definition_cache
+        # Last known keymaps per pad, seeded on connect and saved once read
+        self.snapshot_store = snapshot_store
+        # Event classes wanted from every pad (EVENT_MASK_* bits)
+        self.event_mask = EVENT_MASK_DEFAULT
+        self.pads: Dict[str, PadState] = {}
+        self.callbacks: List[Callable[[str, bytes], None]] = []
+        self.stats = HIDStats()
+        self.capture: Optional[HIDCapture] = None
+        self._lock = threading.Lock()
+
+    @property
+    def last_error(self) -> Optional[str]:
+        return self.scanner.last_error
+
+    @property
+    def connected(self) -> bool:
+        """True while at least one pad is connected."""
+        return any(pad.connected for pad in self.pad_list())
+
+    def pad_list(self) -> List[PadState]:
+        """Snapshot of the pads, in connection order."""
+        with self._lock:
+            return list(self.pads.values())
+
+    def get(self, key: Optional[str]) -> Optional[PadState]:
+        with self._lock:
+            return self.pads.get(key) if key is not None else None
+
+    # --- Discovery ---
+    def _make_key(self, hid: HIDManager) -> str:
+        """Stable key for per-device rules: serial number, else device path."""
+        key = hid.serial_number or hid.device_path or "pad"
+        if key in self.pads:
+            # Pads without a unique serial number
+            n = 2
+            while f"{key}#{n}" in self.pads:
+                n += 1
+            key = f"{key}#{n}"
+        return key
+
+    def discover(self) -> List[PadState]:
+        """Connect every Raw HID interface not yet in the pool.
+
+        Returns:
+            The newly added pads
+        """
+        with self._lock:
+            known = [pad.hid.device_path for pad in self.pads.values()]
+
+        added = []
+        for device in self.scanner.discover_devices(exclude=known):
+            hid = HIDManager()
+            hid.stats = self.stats
+            hid.capture = self.capture
+            hid.attach_device(device)
+
+            with self._lock:
+                key = self._make_key(hid)
+                name = getattr(device, "product_name", "") or "NexaPad"
+                pad = PadState(key, hid, name)
+                self.pads[key] = pad
+            if self.snapshot_store is not None:
+                snapshot = self.snapshot_store.load(key)
+                if snapshot is not None:
+                    pad.seed_keymaps(snapshot)
+            hid.register_callback(self._make_callback(key))
+            self._submit_initialize(pad)
+            print(f"Pad connected: {key} ({name})")
+            added.append(pad)
+        return added
+
+    def _submit_initialize(self, pad: PadState):
+        """Queue the handshake, keymap prefetch and definition fetch ahead of other commands."""
+        future = pad.executor.submit(
+            _initialize, pad.hid, self.capability_cache, self.event_mask, self.definition_cache
+        )
+
+        def initialized(future: Future):
+            if not future.cancelled() and future.exception() is None:
+                # Reads that finished meanwhile are newer; keep them
+                for layer, keymap in future.result().items():
+                    if layer not in pad.keymap_read_at:
+                        pad.store_keymap(layer, keymap)
+                # Reconcile the persisted snapshot with what the pad holds
+                self.save_snapshot(pad)
+
+        future.add_done_callback(initialized)
+
+    def _make_callback(self, key: str) -> Callable[[bytes], None]:
+        def on_data(data: bytes):
+            for callback in self.callbacks:
+                try:
+                    callback(key, data)
+                except Exception:
+                    pass
+
+        return on_data
+
+    def check(self) -> List[PadState]:
+        """Ping every pad and drop the ones that stopped answering.
+
+        The ping runs on the pad's worker, queued behind its other commands,
+        and its result is collected by the next check; a pad still busy with
+        the previous ping is not pinged again.
+
+        Returns:
+            The removed pads
+        """
+        removed = []
+        for pad in self.pad_list():
+            alive = pad.connected
+            ping = pad.ping
+            if alive and ping is not None and ping.done():
+                pad.ping = None
+                if not ping.cancelled():
+                    alive = ping.exception() is None and ping.result()
+            if alive:
+                if pad.ping is None:
+                    pad.ping = self.submit(pad.key, _ping)
+                continue
+            self.save_snapshot(pad)
+            pad.close()
+            with self._lock:
+                self.pads.pop(pad.key, None)
+            print(f"Pad disconnected: {pad.key}")
+            removed.append(pad)
+        return removed
+
+    def register_callback(self, callback: Callable[[str, bytes], None]):
+        """Register a callback for incoming data: callback(pad_key, data)."""
+        if callback not in self.callbacks:
+            self.callbacks.append(callback)
+
+    def unregister_callback(self, callback: Callable[[str, bytes], None]):
+        if callback in self.callbacks:
+            self.callbacks.remove(callback)
+
+    # --- Commands ---
+    def submit(self, key: str, fn: Callable, *args) -> Optional[Future]:
+        """Run ``fn(pad.hid, *args)`` on the pad's worker thread."""
+        pad = self.get(key)
+        if pad is None or not pad.connected:
+            return None
+        pad._track(1)
+        try:
+            future = pad.executor.submit(fn, pad.hid, *args)
+        except RuntimeError:  # Executor shut down by a concurrent close
+            pad._track(-1)
+            return None
+        future.add_done_callback(lambda _: pad._track(-1))
+        return future
+
+    def is_idle(self, key: str, gap: float) -> bool:
+        """True if a pad has no queued commands and saw no traffic for ``gap`` s."""
+        pad = self.get(key)
+        if pad is None or not pad.connected or pad.pending:
+            return False
+        return time.perf_counter() - pad.hid.last_activity >= gap
+
+    def prefetch_keymaps(self, key: str, layers: List[int]) -> Optional[Future]:
+        """Read keymaps into a pad's cache in the background."""
+        pad = self.get(key)
+        if pad is None or not layers:
+            return None
+        future = self.submit(key, _read_keymaps, list(layers))
+        if future is None:
+            return None
+
+        def prefetched(future: Future):
+            if not future.cancelled() and future.exception() is None:
+                for layer, keymap in future.result().items():
+                    pad.store_keymap(layer, keymap)
+
+        future.add_done_callback(prefetched)
+        return future
+
+    def switch_layers(self, targets: Dict[str, int]) -> Dict[str, Future]:
+        """Fan out layer switches; each pad switches independently.
+
+        A failed switch resets the pad's current_layer so the next focus
+        change retries it.
+        """
+        futures = {}
+        for key, layer in targets.items():
+            pad = self.get(key)
+            if pad is None:
+                continue
+            pad.current_layer = layer
+            future = self.submit(key, HIDManager.switch_layer, layer)
+            if future is None:
+                pad.current_layer = None
+                continue
+            future.add_done_callback(self._make_switch_done(pad))
+            futures[key] = future
+        return futures
+
+    def read_keymap(self, key: str, layer: int) -> Optional[Future]:
+        """Read a layer's keymap, queued behind the pad's pending commands.
+
+        Does not wait: the future's result (None if unread) is cached on the
+        pad before the future's own callbacks run.
+        """
+        pad = self.get(key)
+        if pad is None:
+            return None
+        future = self.submit(key, _read_keymap, layer)
+        if future is None:
+            return None
+
+        def read(future: Future):
+            if not future.cancelled() and future.exception() is None and future.result():
+                pad.store_keymap(layer, future.result())
+
+        future.add_done_callback(read)
+        return future
+
+    def load_profiles(self, key: str, table: ProfileTable) -> Optional[Future]:
+        """Load a pad's profile slots and prefetch keymaps of their layers.
+
+        The pad's ``profiles`` are set once the slots are loaded.
+        """
+        pad = self.get(key)
+        if pad is None:
+            return None
+        # Until then the old slots do not match the firmware any more
+        pad.profiles = None
+        future = self.submit(key, _load_profiles, table, list(pad.keymaps))
+        if future is None:
+            return None
+
+        def loaded(future: Future):
+            if future.cancelled() or future.exception() is not None:
+                return
+            keymaps = future.result()
+            if keymaps is not None:
+                for layer, keymap in keymaps.items():
+                    if layer not in pad.keymaps:
+                        pad.store_keymap(layer, keymap)
+                pad.profiles = table
+
+        future.add_done_callback(loaded)
+        return future
+
+    def activate_profiles(self, targets: Dict[str, Tuple[int, int]]) -> Dict[str, Future]:
+        """Switch pads to profile slots; targets maps pad key -> (slot, layer)."""
+        futures = {}
+        for key, (slot, layer) in targets.items():
+            pad = self.get(key)
+            if pad is None:
+                continue
+            pad.current_layer = layer
+            future = self.submit(key, HIDManager.activate_profile, slot)
+            if future is None:
+                pad.current_layer = None
+                continue
+            future.add_done_callback(self._make_switch_done(pad))
+            futures[key] = future
+        return futures
+
+    @staticmethod
+    def _make_switch_done(pad: PadState) -> Callable[[Future], None]:
+        def switch_done(future: Future):
+            if future.cancelled() or future.exception() or not future.result():
+                pad.current_layer = None
+
+        return switch_done
+
+    def subscribe_events(self, mask: int):
+        """Ask every pad, current and future, for these event classes only."""
+        if mask != self.event_mask:
+            self.event_mask = mask
+            self.broadcast(HIDManager.subscribe_events, mask)
+
+    def broadcast(self, fn: Callable, *args) -> Dict[str, Future]:
+        """Run ``fn(hid, *args)`` on every pad concurrently."""
+        futures = {}
+        for pad in self.pad_list():
+            future = self.submit(pad.key, fn, *args)
+            if future is not None:
+                futures[pad.key] = future
+        return futures
+
+    # --- Capture (shared by all pads) ---
+    def start_capture(self, file_path: str, max_bytes: int = 16 * 1024 * 1024):
+        """Capture raw reports of every pad to one file."""
+        self.stop_capture()
+        self.capture = HIDCapture(file_path, max_bytes)
+        for pad in self.pad_list():
+            pad.hid.capture = self.capture
+
+    def stop_capture(self):
+        capture = self.capture
+        self.capture = None
+        for pad in self.pad_list():
+            pad.hid.capture = None
+        if capture is not None:
+            capture.close()
+
+    def save_snapshot(self, pad: PadState) -> bool:
+        """Persist a pad's keymaps if all layers were read and anything changed."""
+        if self.snapshot_store is None:
+            return False
+        snapshot = pad.snapshot()
+        return snapshot is not None and self.snapshot_store.save(pad.key, snapshot)
+
+    def close(self):
+        """Disconnect every pad."""
+        self.stop_capture()
+        for pad in self.pad_list():
+            self.save_snapshot(pad)
+            if pad.connected:
+                # Leave the firmware as other hosts expect it
+                pad.hid.subscribe_events(EVENT_MASK_DEFAULT, batch_keys=False)
+            pad.close()
+        with self._lock:
+            self.pads.clear()
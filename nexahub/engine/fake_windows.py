@@ -0,0 +1,126 @@
+"""In-memory window tree for headless runs of the window monitor.
+
+Implements the window tree interface of engine/window_tree.py, so
+WindowMonitor's own source (filter, UWP resolution, caching) runs on any
+platform: the benchmarks time it and tests/test_window_tree.py checks it.
+"""
+
+from typing import Dict, List, Optional
+
+
+class FakeWindow:
+    """A window: owner process, class, title and child windows."""
+
+    __slots__ = ("hwnd", "pid", "class_name", "title", "children")
+
+    def __init__(self, hwnd: int, pid: int, class_name: str, title: str = ""):
+        self.hwnd = hwnd
+        self.pid = pid
+        self.class_name = class_name
+        self.title = title
+        self.children: List[int] = []
+
+
+class FakeWindowTree:
+    """Windows and processes of a scripted desktop."""
+
+    APPLICATION_FRAME_HOST = "ApplicationFrameHost.exe"
+
+    def __init__(self):
+        self.windows: Dict[int, FakeWindow] = {}
+        self.processes: Dict[int, str] = {}
+        self.foreground_hwnd = 0
+        # process_name() calls, to check what the resolver caches
+        self.process_lookups = 0
+        self._next_hwnd = 0x10010
+        self._next_pid = 1000
+
+    def add_process(self, name: str) -> int:
+        pid = self._next_pid
+        self._next_pid += 4
+        self.processes[pid] = name
+        return pid
+
+    def add_window(
+        self,
+        pid: int,
+        class_name: str,
+        title: str = "",
+        parent: Optional[int] = None,
+        hwnd: Optional[int] = None,
+    ) -> int:
+        """Add a window; ``hwnd`` reuses the handle of a closed window, as Windows does."""
+        if hwnd is None:
+            hwnd = self._next_hwnd
+            self._next_hwnd += 0x10
+        self.windows[hwnd] = FakeWindow(hwnd, pid, class_name, title)
+        if parent is not None:
+            self.windows[parent].children.append(hwnd)
+        return hwnd
+
+    def add_app(self, name: str, title: str, class_name: str = "Chrome_WidgetWin_1") -> int:
+        """A desktop application's top-level window."""
+        return self.add_window(self.add_process(name), class_name, title)
+
+    def add_uwp_app(self, name: str, title: str, attached: bool = True) -> int:
+        """A UWP application: a host frame with the application's core window inside.
+
+        With ``attached`` False the core window is missing, as while the
+        application starts; attach() adds it later.
+        """
+        host = self._host_pid()
+        frame = self.add_window(host, "ApplicationFrameWindow", title)
+        # The frame's own children belong to the host
+        self.add_window(host, "ApplicationFrameTitleBarWindow", parent=frame)
+        if attached:
+            self.attach(frame, name)
+        return frame
+
+    def attach(self, frame: int, name: str) -> int:
+        """Put a process's core window into a UWP frame."""
+        return self.add_window(self.add_process(name), "Windows.UI.Core.CoreWindow", parent=frame)
+
+    def _host_pid(self) -> int:
+        for pid, name in self.processes.items():
+            if name == self.APPLICATION_FRAME_HOST:
+                return pid
+        return self.add_process(self.APPLICATION_FRAME_HOST)
+
+    def focus(self, hwnd: int):
+        self.foreground_hwnd = hwnd
+
+    def close(self, hwnd: int):
+        for child in self.children(hwnd):
+            del self.windows[child]
+        del self.windows[hwnd]
+        if self.foreground_hwnd == hwnd:
+            self.foreground_hwnd = 0
+
+    # --- Window tree interface ---
+    def foreground(self) -> int:
+        return self.foreground_hwnd
+
+    def class_name(self, hwnd: int) -> str:
+        window = self.windows.get(hwnd)
+        return window.class_name if window else ""
+
+    def title(self, hwnd: int) -> str:
+        window = self.windows.get(hwnd)
+        return window.title if window else ""
+
+    def process_id(self, hwnd: int) -> int:
+        window = self.windows.get(hwnd)
+        return window.pid if window else 0
+
+    def children(self, hwnd: int) -> List[int]:
+        # Like EnumChildWindows: every descendant, depth first
+        found = []
+        window = self.windows.get(hwnd)
+        for child in window.children if window else []:
+            found.append(child)
+            found.extend(self.children(child))
+        return found
+
+    def process_name(self, pid: int) -> Optional[str]:
+        self.process_lookups += 1
+        return self.processes.get(pid)
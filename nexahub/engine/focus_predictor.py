@@ -0,0 +1,150 @@
+"""Application-switch history used to prefetch the next likely keymaps.
+
+File format (little endian):
+
+    header:      b"NXFP" + version (u8) + name count (u16)
+    name:        length (u8) followed by that many UTF-8 bytes
+    transitions: count (u32), then per transition
+                 from index (u16) | to index (u16) | count (u16)
+
+Names are stored once and referenced by index, so a long history of a few
+dozen applications stays a few kilobytes.
+"""
+
+import struct
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+MAGIC = b"NXFP"
+VERSION = 1
+HEADER = struct.Struct("<4sBH")
+COUNT = struct.Struct("<I")
+TRANSITION = struct.Struct("<HHH")
+
+# Counts are u16 on disk; a source reaching this is aged (all halved)
+MAX_COUNT = 0xFFFF
+
+
+class FocusPredictor:
+    """Counts focus transitions between applications and predicts the next one."""
+
+    def __init__(self, file_path: Optional[Path] = None, max_apps: int = 256):
+        self.file_path = Path(file_path) if file_path else None
+        self.max_apps = max_apps
+        # from process -> Counter of next processes
+        self.transitions: Dict[str, Counter] = {}
+        self.last_app: Optional[str] = None
+        self.dirty = False
+        self._lock = threading.Lock()
+        if self.file_path is not None:
+            self.load()
+
+    def record(self, process_name: str):
+        """Record that ``process_name`` gained focus."""
+        with self._lock:
+            previous, self.last_app = self.last_app, process_name
+            if previous is None or previous == process_name:
+                return
+            if previous not in self.transitions:
+                if len(self.transitions) >= self.max_apps:
+                    self._evict()
+                self.transitions[previous] = Counter()
+            counts = self.transitions[previous]
+            counts[process_name] += 1
+            if counts[process_name] >= MAX_COUNT:
+                # Halve so recent habits outweigh old ones
+                for name in list(counts):
+                    counts[name] //= 2
+                    if not counts[name]:
+                        del counts[name]
+            self.dirty = True
+
+    def _evict(self):
+        """Forget the source with the least recorded transitions."""
+        victim = min(self.transitions, key=lambda name: sum(self.transitions[name].values()))
+        del self.transitions[victim]
+
+    def predict(self, process_name: str, n: int = 2) -> List[Tuple[str, float]]:
+        """Most likely next applications after ``process_name`` with probabilities."""
+        with self._lock:
+            counts = self.transitions.get(process_name)
+            if not counts:
+                return []
+            total = sum(counts.values())
+            return [(name, count / total) for name, count in counts.most_common(n)]
+
+    # --- Persistence ---
+    def load(self):
+        """Read the history file; a missing or corrupt file starts empty."""
+        try:
+            data = self.file_path.read_bytes()
+        except OSError:
+            return
+        try:
+            transitions = self._decode(data)
+        except (struct.error, UnicodeDecodeError, IndexError, ValueError) as e:
+            print(f"Ignoring unreadable focus history: {e}")
+            return
+        with self._lock:
+            self.transitions = transitions
+            self.dirty = False
+
+    def save(self):
+        """Write the history file if anything changed since the last save."""
+        if self.file_path is None or not self.dirty:
+            return
+        with self._lock:
+            data = self._encode()
+            self.dirty = False
+        try:
+            self.file_path.parent.mkdir(parents=True, exist_ok=True)
+            # Replace atomically so a crash never leaves half a file
+            tmp_path = self.file_path.with_suffix(".tmp")
+            tmp_path.write_bytes(data)
+            tmp_path.replace(self.file_path)
+        except OSError as e:
+            print(f"Could not save focus history: {e}")
+
+    def _encode(self) -> bytes:
+        names: Dict[str, int] = {}
+        for source, counts in self.transitions.items():
+            for name in (source, *counts):
+                names.setdefault(name, len(names))
+
+        parts = [HEADER.pack(MAGIC, VERSION, len(names))]
+        for name in names:
+            raw = name.encode("utf-8")[:255]
+            parts.append(bytes([len(raw)]) + raw)
+
+        entries = [
+            TRANSITION.pack(names[source], names[name], count)
+            for source, counts in self.transitions.items()
+            for name, count in counts.items()
+        ]
+        parts.append(COUNT.pack(len(entries)))
+        parts.extend(entries)
+        return b"".join(parts)
+
+    @staticmethod
+    def _decode(data: bytes) -> Dict[str, Counter]:
+        magic, version, name_count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a focus history file")
+        offset = HEADER.size
+
+        names = []
+        for _ in range(name_count):
+            length = data[offset]
+            names.append(data[offset + 1 : offset + 1 + length].decode("utf-8"))
+            offset += 1 + length
+
+        (count,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        transitions: Dict[str, Counter] = {}
+        for _ in range(count):
+            source, target, value = TRANSITION.unpack_from(data, offset)
+            offset += TRANSITION.size
+            transitions.setdefault(names[source], Counter())[names[target]] = value
+        return transitions
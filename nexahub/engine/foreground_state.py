@@ -0,0 +1,65 @@
+"""Shared, observable foreground-window state.
+
+WindowMonitor is the only publisher; the layer matcher and the settings
+window subscribe instead of querying Win32/psutil themselves.
+"""
+
+import threading
+from typing import Callable, List, Optional, Tuple
+
+
+class ForegroundState:
+    """Current foreground (process_name, window_title) with change notification.
+
+    Published titles are normalized keys; the raw title they came from is
+    kept for the settings window, which saves it in new mappings (a key
+    normalized again is not always the same key).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._current: Optional[Tuple[str, Optional[str]]] = None
+        self._raw_title: Optional[str] = None
+        self._subscribers: List[Callable[[str, Optional[str]], None]] = []
+
+    def subscribe(self, callback: Callable[[str, Optional[str]], None]):
+        """Register a callback invoked (on the publisher's thread) on changes."""
+        with self._lock:
+            if callback not in self._subscribers:
+                self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[str, Optional[str]], None]):
+        """Remove a previously registered callback."""
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def current(self) -> Optional[Tuple[str, Optional[str]]]:
+        """Return the last published foreground window, if any."""
+        return self._current
+
+    def raw_title(self) -> Optional[str]:
+        """Unnormalized title of the published window (its key if not given)."""
+        return self._raw_title
+
+    def is_current(self, process_name: str, window_title: Optional[str]) -> bool:
+        """Return True if this window is already the published foreground."""
+        return self._current == (process_name, window_title)
+
+    def publish(
+        self, process_name: str, window_title: Optional[str], raw_title: Optional[str] = None
+    ) -> bool:
+        """Publish a foreground window; notifies subscribers only on change."""
+        with self._lock:
+            if self._current == (process_name, window_title):
+                return False
+            self._current = (process_name, window_title)
+            self._raw_title = raw_title if raw_title is not None else window_title
+            subscribers = list(self._subscribers)
+
+        for callback in subscribers:
+            try:
+                callback(process_name, window_title)
+            except Exception:
+                pass
+        return True
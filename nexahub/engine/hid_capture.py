@@ -0,0 +1,132 @@
+"""Bounded binary capture and replay of raw HID reports.
+
+File format (little endian, append-only):
+
+    header:  b"NXCAP" + version (u8) + start time (f64, unix seconds)
+    record:  delta_us (u32) | direction (u8) | report_len (u8) | stored_len (u8)
+             followed by ``stored_len`` payload bytes
+
+Trailing zero padding is not stored; ``report_len`` restores it on read.
+"""
+
+import struct
+import threading
+import time
+from typing import Callable, Iterator, Optional, Tuple
+
+MAGIC = b"NXCAP"
+VERSION = 1
+HEADER = struct.Struct("<5sBd")
+RECORD = struct.Struct("<IBBB")
+
+DIRECTION_IN = 0
+DIRECTION_OUT = 1
+
+# Largest delta representable in a record (~71 minutes)
+MAX_DELTA_US = 0xFFFFFFFF
+
+
+class HIDCapture:
+    """Appends raw reports with timestamps to a capture file."""
+
+    def __init__(self, file_path: str, max_bytes: int = 16 * 1024 * 1024):
+        self.file_path = file_path
+        self.max_bytes = max_bytes
+        self.records = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._file = open(file_path, "wb")
+        self._file.write(HEADER.pack(MAGIC, VERSION, time.time()))
+        self._size = HEADER.size
+        self._last_ns = time.perf_counter_ns()
+
+    def record(self, direction: int, data):
+        """Append one report; silently drops once the size bound is reached."""
+        report = bytes(data)
+        stored = report.rstrip(b"\x00")
+        now = time.perf_counter_ns()
+        with self._lock:
+            if self._file is None:
+                return
+            size = RECORD.size + len(stored)
+            if self._size + size > self.max_bytes:
+                self.dropped += 1
+                return
+            delta_us = min((now - self._last_ns) // 1000, MAX_DELTA_US)
+            self._last_ns = now
+            self._file.write(
+                RECORD.pack(delta_us, direction, len(report) & 0xFF, len(stored))
+            )
+            self._file.write(stored)
+            self._size += size
+            self.records += 1
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def close(self):
+        """Flush and close the capture file."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_capture(file_path: str) -> Iterator[Tuple[float, int, bytes]]:
+    """Yield (seconds_since_start, direction, report) for each record."""
+    with open(file_path, "rb") as f:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return
+        magic, version, _ = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a NexaHub capture file: {file_path}")
+
+        elapsed_us = 0
+        while True:
+            raw = f.read(RECORD.size)
+            if len(raw) < RECORD.size:
+                break
+            delta_us, direction, report_len, stored_len = RECORD.unpack(raw)
+            stored = f.read(stored_len)
+            if len(stored) < stored_len:
+                break  # Truncated tail (capture still being written)
+            elapsed_us += delta_us
+            report = stored + bytes(max(0, report_len - stored_len))
+            yield elapsed_us / 1e6, direction, report
+
+
+def replay_capture(
+    file_path: str,
+    handler: Callable[[bytes], None],
+    speed: float = 1.0,
+    direction: int = DIRECTION_IN,
+    stop: Optional[threading.Event] = None,
+) -> int:
+    """Feed captured reports to ``handler`` (e.g. HIDManager._on_data_received).
+
+    Args:
+        file_path: Capture file to read
+        handler: Called with each report of the selected direction
+        speed: Playback speed multiplier; 0 replays as fast as possible
+        direction: Which side of the traffic to replay
+        stop: Optional event that aborts the replay when set
+
+    Returns:
+        Number of reports replayed
+    """
+    count = 0
+    start = time.perf_counter()
+    for offset, rec_direction, report in read_capture(file_path):
+        if stop is not None and stop.is_set():
+            break
+        if rec_direction != direction:
+            continue
+        if speed > 0:
+            delay = offset / speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+        handler(report)
+        count += 1
+    return count
@@ -1,7 +1,51 @@
+import lzma
 import time
 import threading
-from typing import Optional, Callable, List, Dict, Any
-from pywinusb import hid
+from collections import deque
+from typing import Optional, Callable, Deque, Iterable, List, Dict, Any, Tuple
+try:
+    from pywinusb import hid
+except ImportError:  # Non-Windows hosts (capture replay, offline tools)
+    hid = None
+
+from engine.latency_tracer import tracer
+from engine.hid_stats import HIDStats
+from engine.hid_protocol import (
+    strip_report_id,
+    ACK,
+    CMD_GET_CAPABILITIES,
+    CMD_GET_LAYER,
+    COMMAND_TAG_OFFSET,
+    CMD_GET_ENCODER,
+    CMD_GET_ENCODER_MAP,
+    ENCODER_MAP_CHUNK,
+    CMD_SUBSCRIBE_EVENTS,
+    CMD_LOAD_PROFILES,
+    CMD_ACTIVATE_PROFILE,
+    EVENT_MASK_KEY,
+    EVENT_MASK_KEY_BATCH,
+    VIA_MAX_CHUNK,
+    VIA_UNHANDLED,
+    VIAL_CMD_GET_KEYBOARD_ID,
+    VIAL_CMD_GET_SIZE,
+    VIAL_CMD_GET_DEFINITION,
+    VIAL_DEFINITION_BLOCK,
+    command_tag,
+    is_command_ack,
+    is_event_report,
+)
+from engine.capabilities import (
+    DeviceCapabilities,
+    CapabilityCache,
+    LEGACY_CAPABILITIES,
+    FEATURE_ENCODER_READ,
+    FEATURE_ENCODER_MAP,
+    FEATURE_EVENT_SUBSCRIBE,
+    FEATURE_PROFILES,
+)
+from engine.hid_capture import HIDCapture, DIRECTION_IN, DIRECTION_OUT
+from engine.vial_definition import DefinitionCache, DefinitionDecoder, MAX_DEFINITION_SIZE
+from engine.hid_reliability import RttEstimator, CircuitBreaker, backoff_delay
 
 
 class HIDManager:
@@ -16,15 +60,13 @@ class HIDManager:
     # VIA Protocol command IDs
     VIA_CMD_GET_KEYMAP_BUFFER = 0x12
 
-    # NexaPad matrix dimensions
-    MATRIX_ROWS = 4
-    MATRIX_COLS = 4
-    NUM_KEYS = 16  # Full 4x4 matrix
-
     # Vial Protocol
     VIA_CMD_VIAL_PREFIX = 0xFE
     VIAL_CMD_GET_ENCODER = 0x03
 
+    # Attempts after the first for a failed send or unanswered request
+    MAX_RETRIES = 2
+
     def __init__(self):
         self.device: Optional[hid.HidDevice] = None
         self.connected = False
@@ -32,11 +74,56 @@ class HIDManager:
         self.callbacks: List[Callable[[bytes], None]] = []
         self._lock = threading.Lock()
         self.last_error: Optional[str] = None
-        self._response_event = threading.Event()
-        self._last_response: Optional[bytes] = None
+        # Reports waiting to be matched by synchronous requests
+        self._responses: Deque[bytes] = deque(maxlen=64)
+        self._response_ready = threading.Condition()
+        # Matrix size, layer count and features; legacy until negotiate()
+        self.capabilities: DeviceCapabilities = LEGACY_CAPABILITIES
+        # Decompressed vial.json embedded in the firmware, once loaded
+        self.vial_definition: Optional[bytes] = None
+        self._capability_cache: Optional[CapabilityCache] = None
+        self.stats = HIDStats()
+        self.capture: Optional[HIDCapture] = None
+        # Round-trip estimators per request type (0xFC acks, 0x12, Vial)
+        self.rtt: Dict[int, RttEstimator] = {}
+        # Trips when the pad stops answering; a send error means it is unplugged
+        self.breaker = CircuitBreaker()
+        # (command, send time) of the last 0xFC command awaiting its ack
+        self._command_sent: Optional[Tuple[int, float]] = None
+        # Last report in either direction; idle gaps allow background reads
+        self.last_activity = 0.0
 
     def find_device(self) -> bool:
         """Find and connect to the QMK keyboard."""
+        devices = self.discover_devices()
+        if not devices:
+            return False
+
+        # Keep the first Raw HID interface, release the others
+        self.attach_device(devices[0])
+        for device in devices[1:]:
+            try:
+                device.close()
+            except Exception:
+                pass
+        print(f"  Successfully connected!")
+        return True
+
+    def discover_devices(self, exclude: Iterable[str] = ()) -> List[Any]:
+        """Open every NexaPad Raw HID interface not already in use.
+
+        Args:
+            exclude: Device paths that are already connected and must be skipped
+
+        Returns:
+            List of opened Raw HID devices (empty on failure, see last_error)
+        """
+        if hid is None:
+            self.last_error = "pywinusb is not available on this platform"
+            return []
+
+        exclude = set(exclude)
+        found = []
         try:
             self.last_error = None
 
@@ -53,7 +140,7 @@ class HIDManager:
             if not all_devices:
                 self.last_error = "No HID devices found"
                 print(self.last_error)
-                return False
+                return []
 
             # Find devices matching VID/PID
             matching_devices = []
@@ -66,6 +153,9 @@ class HIDManager:
                 )
 
                 if vid == self.VENDOR_ID and pid == self.PRODUCT_ID:
+                    if device.device_path in exclude:
+                        print(f"    -> Already connected")
+                        continue
                     matching_devices.append(device)
                     print(f"    -> Matches VID/PID!")
 
@@ -90,13 +180,8 @@ class HIDManager:
 
                         # Check if this is the Raw HID interface
                         if usage_page == self.USAGE_PAGE and usage == self.USAGE_ID:
-                            print(f"  Raw HID interface found! Connecting...")
-                            self.device = device
-                            if self.device is not None:
-                                self.device.set_raw_data_handler(self._on_data_received)
-                            self.connected = True
-                            print(f"  Successfully connected!")
-                            return True
+                            print(f"  Raw HID interface found!")
+                            found.append(device)
                         else:
                             print(
                                 f"  Not Raw HID (expected {hex(self.USAGE_PAGE)}/{hex(self.USAGE_ID)})"
@@ -115,16 +200,45 @@ class HIDManager:
                     self.last_error = str(e)
                     continue
 
-            self.last_error = (
-                f"Found {len(matching_devices)} device(s) but no Raw HID interface"
-            )
-            print(f"Connection failed: {self.last_error}")
-            return False
+            if not found:
+                self.last_error = (
+                    f"Found {len(matching_devices)} device(s) but no Raw HID interface"
+                )
+                print(f"Connection failed: {self.last_error}")
+            return found
 
         except Exception as e:
             self.last_error = f"Exception in find_device: {e}"
             print(f"Connection failed: {self.last_error}")
-            return False
+            return found
+
+    def attach_device(self, device):
+        """Use an already opened Raw HID device (real or simulated)."""
+        self.device = device
+        self.device.set_raw_data_handler(self._on_data_received)
+        self.connected = True
+        self.breaker.reset()
+        self.capabilities = LEGACY_CAPABILITIES
+        self.vial_definition = None
+
+    @property
+    def device_path(self) -> Optional[str]:
+        """OS path of the connected interface (unique per plugged-in pad)."""
+        return getattr(self.device, "device_path", None) if self.device else None
+
+    @property
+    def serial_number(self) -> str:
+        """USB serial number of the connected pad, or an empty string."""
+        return (getattr(self.device, "serial_number", "") or "") if self.device else ""
+
+    @property
+    def capability_key(self) -> Optional[str]:
+        """Capability cache key: serial number and firmware release (bcdDevice)."""
+        serial = self.serial_number
+        if not serial:
+            return None
+        release = getattr(self.device, "version_number", 0) or 0
+        return f"{serial}:{release:04X}"
 
     def disconnect(self):
         """Disconnect from the device."""
@@ -136,6 +250,71 @@ class HIDManager:
             self.device = None
             self.connected = False
 
+    def start_capture(self, file_path: str, max_bytes: int = 16 * 1024 * 1024):
+        """Start capturing raw reports in both directions to a file."""
+        self.stop_capture()
+        self.capture = HIDCapture(file_path, max_bytes)
+
+    def stop_capture(self):
+        """Stop the active capture, if any."""
+        capture = self.capture
+        self.capture = None
+        if capture is not None:
+            capture.close()
+
+    def _send_report(self, report: bytearray):
+        """Send an output report (caller holds the lock)."""
+        self.last_activity = time.perf_counter()
+        capture = self.capture
+        if capture is not None:
+            capture.record(DIRECTION_OUT, report)
+        self.stats.record_sent(bytes(report[1:]))
+        self.device.send_output_report(report)
+
+    def rtt_for(self, request_id: int) -> RttEstimator:
+        """Round-trip estimator of a request type (first payload byte)."""
+        estimator = self.rtt.get(request_id)
+        if estimator is None:
+            estimator = RttEstimator()
+            # Any measured round-trip beats a blind initial timeout
+            for other in list(self.rtt.values()):
+                estimator.seed_from(other)
+            estimator = self.rtt.setdefault(request_id, estimator)
+        return estimator
+
+    def _retry_wait(self, attempt: int):
+        """Count a retry and sleep a jittered, growing delay before it."""
+        self.stats.record_retry()
+        time.sleep(backoff_delay(attempt))
+
+    def _send_with_retry(self, report: bytearray, before_send=None) -> bool:
+        """Send a report, retrying send errors; False means the pad is gone.
+
+        ``before_send`` runs under the lock right before each send.
+        """
+        error = None
+        for attempt in range(self.MAX_RETRIES + 1):
+            if attempt:
+                self._retry_wait(attempt)
+            if not self.device:
+                break
+            try:
+                with self._lock:
+                    if before_send:
+                        before_send()
+                    self._send_report(report)
+                return True
+            except Exception as e:
+                error = e
+
+        self.send_failed(error)
+        return False
+
+    def send_failed(self, error: Exception):
+        """Send errors that survive retries mean the handle is dead (unplugged)."""
+        print(f"Send failed, treating device as disconnected: {error}")
+        self.connected = False
+
     def send_command(self, command: int, data: bytes = b"") -> bool:
         """Send a command to the keyboard.
 
@@ -144,42 +323,103 @@ class HIDManager:
         if not self.connected or not self.device:
             return False
 
-        try:
-            # Build report: [ReportID][0xFC][Command][Data...][Padding]
-            report = bytearray(64)
-            report[0] = 0x00  # Report ID
-            report[1] = 0xFC  # Magic byte
-            report[2] = command
+        # Build report: [ReportID][0xFC][Command][Data...][Padding]
+        report = bytearray(64)
+        report[0] = 0x00  # Report ID
+        report[1] = 0xFC  # Magic byte
+        report[2] = command
 
-            # Copy data
-            for i, byte in enumerate(data[:61]):
-                report[3 + i] = byte
+        # Copy data (up to the tag, which the ack echoes)
+        for i, byte in enumerate(data[: COMMAND_TAG_OFFSET - 2]):
+            report[3 + i] = byte
+        report[1 + COMMAND_TAG_OFFSET : 4 + COMMAND_TAG_OFFSET] = command_tag(command)
 
-            with self._lock:
-                self.device.send_output_report(report)
-            return True
+        def mark_sent():
+            # The ack gives a round-trip sample
+            self._command_sent = (command, time.perf_counter())
 
-        except Exception:
-            self.connected = False
+        return self._send_with_retry(report, mark_sent)
+
+    def send_report(self, payload: bytes) -> bool:
+        """Send a raw report payload (without report ID); does not wait."""
+        if not self.connected or not self.device:
             return False
 
+        report = bytearray(64)
+        report[1 : 1 + len(payload[:63])] = payload[:63]
+        return self._send_with_retry(report)
+
+    def try_send_report(self, payload: bytes) -> bool:
+        """Send a raw report payload once, never blocking (asyncio core).
+
+        Returns False without sending while another thread is writing; send
+        errors are raised. The caller retries either way.
+        """
+        if not self.connected or not self.device:
+            return False
+        report = bytearray(64)
+        report[1 : 1 + len(payload[:63])] = payload[:63]
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            self._send_report(report)
+        finally:
+            self._lock.release()
+        return True
+
     def switch_layer(self, layer: int) -> bool:
         """Switch to a specific layer."""
-        return self.send_command(0x01, bytes([layer]))
+        sent = self.send_command(0x01, bytes([layer]))
+        if tracer.enabled and sent:
+            tracer.mark(tracer.STAGE_SWITCH)
+        return sent
 
     def get_current_layer(self) -> Optional[int]:
-        """Get the current layer from the keyboard."""
-        if self.send_command(0x02):
-            # Wait for response (simplified - in production use async)
-            time.sleep(0.1)
-            # Response would be handled by _on_data_received
+        """Get the current layer from the keyboard.
+
+        The firmware answers in place: [0xFC][0xFD][layer], tag echoed.
+        """
+        report = bytearray(64)
+        report[1] = 0xFC
+        report[2] = CMD_GET_LAYER
+        report[1 + COMMAND_TAG_OFFSET : 4 + COMMAND_TAG_OFFSET] = command_tag(CMD_GET_LAYER)
+        resp = self._transact(
+            0xFC, report, lambda payload: is_command_ack(payload, CMD_GET_LAYER)
+        )
+        if resp is None:
             return None
-        return None
+        return strip_report_id(resp)[2]
 
     def set_oled_timeout(self, timeout_option: int) -> bool:
         """Set OLED timeout (0=10s, 1=30s, 2=60s, 3=never)."""
         return self.send_command(0x03, bytes([timeout_option]))
 
+    def subscribe_events(self, mask: int, batch_keys: bool = True) -> bool:
+        """Choose the event classes the pad reports (EVENT_MASK_* bits).
+
+        With ``batch_keys``, key events are requested packed several per
+        report. Firmware without the subscription command keeps sending
+        everything; returns False then.
+        """
+        if not self.capabilities.has(FEATURE_EVENT_SUBSCRIBE):
+            return False
+        if batch_keys and mask & EVENT_MASK_KEY:
+            mask = (mask & ~EVENT_MASK_KEY) | EVENT_MASK_KEY_BATCH
+        return self.send_command(CMD_SUBSCRIBE_EVENTS, bytes([mask]))
+
+    def load_profiles(self, layers: List[int]) -> bool:
+        """Load the layer of each profile slot; False without firmware support."""
+        if not self.capabilities.has(FEATURE_PROFILES):
+            return False
+        return self.send_command(CMD_LOAD_PROFILES, bytes([len(layers)] + layers))
+
+    def activate_profile(self, slot: int) -> bool:
+        """Switch to a profile slot's layer with one unacknowledged report."""
+        sent = self.send_report(bytes([0xFC, CMD_ACTIVATE_PROFILE, slot]))
+        if tracer.enabled and sent:
+            tracer.mark(tracer.STAGE_SWITCH)
+        return sent
+
     def get_oled_timeout(self) -> Optional[int]:
         """Get current OLED timeout setting."""
         if self.send_command(0x04):
@@ -189,9 +429,22 @@ class HIDManager:
 
     def _on_data_received(self, data: bytes):
         """Handle incoming HID reports."""
-        # Store response for synchronous calls
-        self._last_response = bytes(data)
-        self._response_event.set()
+        self.last_activity = time.perf_counter()
+        capture = self.capture
+        if capture is not None:
+            capture.record(DIRECTION_IN, data)
+        payload = strip_report_id(data)
+        self.stats.record_received(payload)
+
+        sent = self._command_sent
+        if sent is not None and is_command_ack(payload, sent[0]):
+            self._command_sent = None
+            self.rtt_for(0xFC).observe(time.perf_counter() - sent[1])
+
+        # Queue response for synchronous calls
+        with self._response_ready:
+            self._responses.append(bytes(data))
+            self._response_ready.notify_all()
 
         # Notify all registered callbacks
         for callback in self.callbacks:
@@ -210,6 +463,72 @@ class HIDManager:
         if callback in self.callbacks:
             self.callbacks.remove(callback)
 
+    def _wait_response(
+        self, match: Callable[[bytes], bool], timeout: float
+    ) -> Optional[bytes]:
+        """Wait for a report accepted by ``match``, skipping unrelated ones
+        (like layer change events) that arrive in the meantime."""
+        deadline = time.perf_counter() + timeout
+        with self._response_ready:
+            while True:
+                while self._responses:
+                    resp = self._responses.popleft()
+                    if match(strip_report_id(resp)):
+                        return resp
+                    # Not our response (e.g., it was an 0xFB event), drop it
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return None
+                self._response_ready.wait(remaining)
+
+    def _clear_responses(self):
+        """Drop queued reports before sending a new request."""
+        with self._response_ready:
+            self._responses.clear()
+
+    def _transact(
+        self, request_id: int, report: bytearray, match: Callable[[bytes], bool]
+    ) -> Optional[bytes]:
+        """Send a request and return the matching response, or None.
+
+        The timeout follows the measured round-trip time of this request
+        type. Unanswered requests are retried with jittered backoff; once
+        the circuit breaker opens, requests fail fast until a probe succeeds.
+        A timeout never marks the device as disconnected, a send error does.
+        """
+        if not self.connected or not self.device:
+            return None
+        if not self.breaker.allow():
+            return None
+
+        rtt = self.rtt_for(request_id)
+        sent_at = 0.0
+
+        def before_send():
+            nonlocal sent_at
+            # Clear any previous response state before sending
+            self._clear_responses()
+            sent_at = time.perf_counter()
+
+        for attempt in range(self.MAX_RETRIES + 1):
+            if attempt:
+                self._retry_wait(attempt)
+            if not self._send_with_retry(report, before_send):
+                return None
+
+            resp = self._wait_response(match, rtt.timeout(attempt))
+            if resp is not None:
+                # Karn's rule: a retried request's round-trip is ambiguous
+                if attempt == 0:
+                    rtt.observe(time.perf_counter() - sent_at)
+                self.breaker.record_success()
+                return resp
+            self.stats.record_timeout()
+
+        if self.breaker.record_failure():
+            print(f"Device not answering request 0x{request_id:02X}; failing fast")
+        return None
+
     def get_keymap_buffer(self, offset: int, size: int) -> Optional[bytes]:
         """Get keymap buffer from device using VIA protocol.
 
@@ -222,90 +541,197 @@ class HIDManager:
         Returns:
             Raw buffer data or None if failed
         """
-        if not self.connected or not self.device:
-            return None
+        # Build VIA report: [ReportID][Command][offset_high][offset_low][size][padding...]
+        report = bytearray(64)
+        report[0] = 0x00  # Report ID
+        report[1] = self.VIA_CMD_GET_KEYMAP_BUFFER  # Command ID
+        report[2] = (offset >> 8) & 0xFF  # Offset high byte
+        report[3] = offset & 0xFF  # Offset low byte
+        report[4] = size  # Size (max 28)
+
+        # The response echoes command and offset, so a late answer to an
+        # earlier (retried) request for another chunk is not mistaken for ours
+        request = bytes(report[1:4])
+        return self._transact(
+            self.VIA_CMD_GET_KEYMAP_BUFFER,
+            report,
+            lambda payload: bytes(payload[:3]) == request,
+        )
+
+    @staticmethod
+    def _buffer_data(response: bytes, size: int) -> bytes:
+        """Keymap bytes of a 0x12 response."""
+        # Data starts at position 5 (if ReportID present) or position 4 (if not)
+        data_start = 5 if response[0] == 0x00 else 4
+        data = bytes(response[data_start : data_start + size])
+        return data + bytes(size - len(data))  # Missing bytes read as KC_NO
+
+    def read_keymap_buffer(self, offset: int, length: int) -> Optional[bytes]:
+        """Read ``length`` bytes of the dynamic keymap in max-size chunks.
+
+        Firmware that completed the handshake gets all chunk requests back
+        to back (responses are matched by their echoed offset); legacy
+        firmware gets one request at a time.
+        """
+        chunks = [
+            (start, min(VIA_MAX_CHUNK, offset + length - start))
+            for start in range(offset, offset + length, VIA_MAX_CHUNK)
+        ]
 
-        try:
-            # Build VIA report: [ReportID][Command][offset_high][offset_low][size][padding...]
+        results: Dict[int, bytes] = {}
+        if self.capabilities.negotiated and len(chunks) > 1:
+            results = self._read_chunks_pipelined(chunks)
+
+        for start, size in chunks:
+            if start not in results:
+                response = self.get_keymap_buffer(start, size)
+                if response is None:
+                    return None
+                results[start] = self._buffer_data(response, size)
+
+        return b"".join(results[start] for start, _ in chunks)
+
+    def _read_chunks_pipelined(self, chunks: List[tuple]) -> Dict[int, bytes]:
+        """Send every 0x12 request, then collect the answers.
+
+        Returns the chunks that arrived; the caller re-reads missing ones.
+        """
+        requests = {}
+        for start, size in chunks:
             report = bytearray(64)
-            report[0] = 0x00  # Report ID
-            report[1] = self.VIA_CMD_GET_KEYMAP_BUFFER  # Command ID
-            report[2] = (offset >> 8) & 0xFF  # Offset high byte
-            report[3] = offset & 0xFF  # Offset low byte
-            report[4] = size  # Size (max 28)
-
-            with self._lock:
-                # Clear any previous response state before sending
-                self._response_event.clear()
-                self._last_response = None
-                self.device.send_output_report(report)
-
-            # Wait for response with timeout, but loop to filter out other reports
-            # (like layer change events) that might arrive in the meantime
-            start_time = time.time()
-            timeout = 0.5
-            while time.time() - start_time < timeout:
-                remaining = timeout - (time.time() - start_time)
-                if remaining > 0 and self._response_event.wait(timeout=remaining):
-                    # Check if this response matches our command
-                    resp = self._last_response
-                    if resp and len(resp) > 1:
-                        # Command ID is at index 1 if ReportID is 0x00, otherwise index 0
-                        resp_cmd = resp[1] if resp[0] == 0x00 else resp[0]
-                        if resp_cmd == self.VIA_CMD_GET_KEYMAP_BUFFER:
-                            return resp
-                        
-                    # Not our response (e.g., it was an 0xFB event), clear and wait again
-                    self._response_event.clear()
-                else:
-                    break
+            report[1] = self.VIA_CMD_GET_KEYMAP_BUFFER
+            report[2] = (start >> 8) & 0xFF
+            report[3] = start & 0xFF
+            report[4] = size
+            requests[bytes(report[1:4])] = report
+
+        responses = self._transact_pipelined(self.VIA_CMD_GET_KEYMAP_BUFFER, requests)
+        return {
+            start: self._buffer_data(responses[tag], size)
+            for tag, (start, size) in zip(requests, chunks)
+            if tag in responses
+        }
+
+    def _transact_pipelined(
+        self, request_id: int, requests: Dict[bytes, bytearray]
+    ) -> Dict[bytes, bytes]:
+        """Send requests back to back, then collect the answers.
 
-            return None
+        Args:
+            request_id: Round-trip estimator key (see rtt_for)
+            requests: Answer prefix (report ID stripped) -> request report;
+                all prefixes have the same length
 
-        except Exception as e:
-            print(f"Error getting keymap buffer: {e}")
-            self.connected = False
-            return None
+        Returns:
+            Answer prefix -> response for the answers that arrived
+        """
+        if not requests or not self.connected or not self.device or not self.breaker.allow():
+            return {}
+
+        tag_length = len(next(iter(requests)))
+        for i, report in enumerate(requests.values()):
+            # Only the first send clears the queue; later ones keep answers
+            if not self._send_with_retry(report, self._clear_responses if i == 0 else None):
+                return {}
+
+        # The firmware answers in order, one round-trip apart at most
+        timeout = self.rtt_for(request_id).timeout() * len(requests)
+        deadline = time.perf_counter() + timeout
+        pending = set(requests)
+        results = {}
+        while pending:
+            remaining = deadline - time.perf_counter()
+            response = self._wait_response(
+                lambda payload: bytes(payload[:tag_length]) in pending, max(0.0, remaining)
+            )
+            if response is None:
+                self.stats.record_timeout()
+                break
+            tag = bytes(strip_report_id(response)[:tag_length])
+            pending.discard(tag)
+            results[tag] = response
+
+        if not pending:
+            self.breaker.record_success()
+        return results
 
     def get_layer_keycodes(self, layer: int) -> Optional[List[int]]:
         """Get all keycodes for a specific layer.
 
         Args:
-            layer: Layer number (0-4)
+            layer: Layer number (below capabilities.layers)
 
         Returns:
-            List of 16 keycode values or None if failed
+            List of capabilities.num_keys keycode values or None if failed
         """
-        if layer < 0 or layer >= 5:
+        caps = self.capabilities
+        if layer < 0 or layer >= caps.layers:
             return None
 
-        # Calculate offset: layer * MATRIX_ROWS * MATRIX_COLS * 2 bytes per keycode
-        offset = layer * self.MATRIX_ROWS * self.MATRIX_COLS * 2
-
-        # Read all keycodes for this layer (16 keys * 2 bytes = 32 bytes)
-        # Note: VIA buffer limit is 28 bytes per request, so we split it
-        keycodes = []
-        
-        # Split into two requests: 8 keys each (16 bytes each)
-        for chunk in [0, 1]:
-            chunk_offset = offset + (chunk * 8 * 2)
-            response = self.get_keymap_buffer(chunk_offset, 16)
-            
-            if not response or len(response) < 16:
-                return None
+        data = self.read_keymap_buffer(layer * caps.layer_size, caps.layer_size)
+        if data is None:
+            return None
+        return [(data[i] << 8) | data[i + 1] for i in range(0, len(data), 2)]
+
+    def get_all_keycodes(self) -> Optional[Dict[int, List[int]]]:
+        """Read every layer in one bulk pass over the keymap buffer.
 
-            # Data starts at position 5 (if ReportID present) or position 4 (if not)
-            data_start = 5 if response[0] == 0x00 else 4
+        Returns:
+            Dict of layer -> keycodes, or None if failed
+        """
+        caps = self.capabilities
+        data = self.read_keymap_buffer(0, caps.layers * caps.layer_size)
+        if data is None:
+            return None
 
-            for i in range(8):
-                idx = data_start + (i * 2)
-                if idx + 1 < len(response):
-                    kc = (response[idx] << 8) | response[idx + 1]
-                    keycodes.append(kc)
-                else:
-                    keycodes.append(0)  # KC_NO
+        keymaps = {}
+        for layer in range(caps.layers):
+            chunk = data[layer * caps.layer_size : (layer + 1) * caps.layer_size]
+            keymaps[layer] = [(chunk[i] << 8) | chunk[i + 1] for i in range(0, len(chunk), 2)]
+        return keymaps
 
-        return keycodes
+    # --- Capability handshake ---
+    def negotiate(self, cache: Optional[CapabilityCache] = None) -> DeviceCapabilities:
+        """Learn the firmware's capabilities with the handshake.
+
+        The handshake is one report and is always sent: a reflashed pad
+        often keeps its serial and release number, so a cached entry may
+        predate its features. The cache answers when the pad does not;
+        LEGACY_CAPABILITIES is used for firmware without the handshake.
+        """
+        self._capability_cache = cache
+        key = self.capability_key
+        caps = self._query_capabilities()
+        if caps is None:
+            # No answer (busy or resetting): the last handshake of this pad
+            caps = cache.get(key) if cache is not None and key else None
+        elif caps.negotiated and cache is not None and key and cache.get(key) != caps:
+            # Legacy answers are not cached: the echo identifies them anyway
+            cache.put(key, caps)
+        self.capabilities = caps or LEGACY_CAPABILITIES
+        print(f"Device capabilities: {self.capabilities}")
+        return self.capabilities
+
+    def _query_capabilities(self) -> Optional[DeviceCapabilities]:
+        """Send the 0xFC 0x05 handshake."""
+        report = bytearray(64)
+        report[1] = 0xFC
+        report[2] = CMD_GET_CAPABILITIES
+        response = self._transact(
+            0xFC,
+            report,
+            lambda payload: DeviceCapabilities.parse(payload) is not None,
+        )
+        if response is None:
+            return None
+        return DeviceCapabilities.parse(strip_report_id(response))
+
+    def drop_capability(self, feature: int):
+        """The firmware rejected a feature it advertised (stale cache entry)."""
+        self.capabilities = self.capabilities.without(feature)
+        key = self.capability_key
+        if self._capability_cache is not None and key:
+            self._capability_cache.remove(key)
 
     def get_encoder_keycodes(self, layer: int, encoder_idx: int) -> Optional[tuple[int, int]]:
         """Get encoder keycodes (CCW, CW) for a specific layer and encoder.
@@ -317,106 +743,276 @@ class HIDManager:
         Returns:
             Tuple of (ccw_keycode, cw_keycode) or None if failed
         """
-        if not self.connected or not self.device:
-            return None
-
-        try:
-            # Build Vial report: [ReportID][VIA_Prefix][Vial_Cmd][Layer][EncoderIdx][padding...]
+        if self.capabilities.has(FEATURE_ENCODER_READ):
+            # Tagged reply: [0xFC][0xFD][0x06][layer][encoder][ccw][cw]
             report = bytearray(64)
-            report[0] = 0x00
-            report[1] = self.VIA_CMD_VIAL_PREFIX
-            report[2] = self.VIAL_CMD_GET_ENCODER
+            report[1] = 0xFC
+            report[2] = CMD_GET_ENCODER
             report[3] = layer
             report[4] = encoder_idx
+            resp = self._transact(
+                0xFC,
+                report,
+                lambda p: p[0] == 0xFC
+                and (p[1] == CMD_GET_ENCODER or p[1:5] == bytes([ACK, CMD_GET_ENCODER, layer, encoder_idx])),
+            )
+            if resp is None:
+                return None
+            payload = strip_report_id(resp)
+            if payload[1] == ACK:
+                return ((payload[5] << 8) | payload[6], (payload[7] << 8) | payload[8])
+            # Echoed unchanged: firmware without the command
+            self.drop_capability(FEATURE_ENCODER_READ)
+
+        # Vial report: [ReportID][VIA_Prefix][Vial_Cmd][Layer][EncoderIdx][padding...]
+        payload = self._vial_request(self.VIAL_CMD_GET_ENCODER, bytes([layer, encoder_idx]))
+        if payload is None:
+            return None
+
+        # Response format: [CCW_H][CCW_L][CW_H][CW_L]
+        ccw = (payload[0] << 8) | payload[1]
+        cw = (payload[2] << 8) | payload[3]
+        return (ccw, cw)
+
+    def get_encoder_map(
+        self, layers: Optional[Iterable[int]] = None
+    ) -> Optional[Dict[int, Tuple[int, ...]]]:
+        """Read the keycodes of every encoder on several layers.
+
+        Uses the bulk 0xFC 0x0A read (six encoders per report) when the
+        firmware has it, otherwise one tagged 0x06 read per encoder, sent
+        back to back; Vial-only firmware is read one encoder at a time.
 
-            with self._lock:
-                self._response_event.clear()
-                self._last_response = None
-                self.device.send_output_report(report)
-
-            # Wait for response
-            start_time = time.time()
-            timeout = 0.5
-            while time.time() - start_time < timeout:
-                remaining = timeout - (time.time() - start_time)
-                if remaining > 0 and self._response_event.wait(timeout=remaining):
-                    resp = self._last_response
-                    # Check for Vial prefix match matches
-                    if resp and len(resp) > 3:
-                         # Response format: [ReportID][CmdID][CCW_H][CCW_L][CW_H][CW_L]
-                         # But wait, Vial firmware writes response directly to msg buffer.
-                         # msg[0]... from vial_handle_cmd start at offset 0 of DATA (which is index 1 of report usually? or index 0 if raw?)
-                         # hidapi/pywinusb: input reports usually have Report ID at 0.
-                         #
-                         # vial.c:
-                         # case vial_get_encoder:
-                         #    msg[0] = ccw >> 8; msg[1] = ccw & 0xFF;
-                         #    msg[2] = cw >> 8;  msg[3] = cw & 0xFF;
-                         #
-                         # The `msg` passed to `vial_handle_cmd` is `data` from `raw_hid_receive`.
-                         # command_id is at data[0].
-                         # In `raw_hid_receive`:
-                         #   vial_handle_cmd(data, length);
-                         #   raw_hid_send(data, length);
-                         #
-                         # The `data` buffer includes the command bytes initially.
-                         # When `vial_handle_cmd` returns, `msg` (data) has been modified in place.
-                         #
-                         # If we send: [0x00, 0xFE, 0x03, Layer, Idx...]
-                         # The firmware receives `data` starting at 0xFE.
-                         # `msg[0]` is 0xFE. `msg[1]` is 0x03.
-                         #
-                         # Wait, `vial_handle_cmd` checks `msg[1]`.
-                         # `msg[0]` is `id_vial_prefix` (0xFE).
-                         #
-                         # Inside `vial_get_encoder`:
-                         # msg[0] = keycode >> 8 ...
-                         # msg[1] = ...
-                         #
-                         # So it OVERWRITES the 0xFE at the start of the buffer!
-                         #
-                         # So the response we get back will start with the CCW keycode high byte at index 0 (or index 1 if ReportID is included).
-                         
-                         # pywinusb usually returns raw data. If ReportID is 0, it might be stripped or present.
-                         # In `get_keymap_buffer`, we checked `resp[0] == 0xVIA_CMD`.
-                         #
-                         # If `vial_get_encoder` overwrites msg[0], then we can't identify the response by command ID easily!
-                         # This is a known issue/feature of Vial/QMK raw HID. It's half-duplex essentially.
-                         #
-                         # However, since we acquire a lock and clear `_response_event`, the first report we get *should* be the response.
-                         # But `_on_data_received` could pick up other events (like 0xFB layer changes).
-                         # We need to filter.
-                         #
-                         # Encoder response will NOT start with 0xFB or 0xFC or 0xFE (likely, unless keycode is huge).
-                         # But it *could* start with anything.
-                         #
-                         # Actually, in `vial_handle_cmd`:
-                         # `vial_get_keyboard_id` sets msg[0]..3 to version.
-                         # `vial_get_encoder` sets msg[0]..3 to keycodes.
-                         #
-                         # We have to assume if we sent a request, the next non-event packet is our response.
-                         # The events start with 0xFB.
-                         
-                         data_start = 1 if resp[0] == 0x00 else 0
-                         # If using 0x00 report ID, the first byte of actual data is at 1.
-                         
-                         if resp[data_start] == 0xFB: # Event packet
-                             self._response_event.clear()
-                             continue
-                             
-                         # Assume it's our response
-                         idx = data_start
-                         ccw = (resp[idx] << 8) | resp[idx+1]
-                         cw = (resp[idx+2] << 8) | resp[idx+3]
-                         return (ccw, cw)
-                    
-                    self._response_event.clear()
-                else:
-                    break
-                    
+        Args:
+            layers: Layers to read (default: all)
+
+        Returns:
+            Dict of layer -> (ccw, cw) of each encoder, flattened
+            (ccw0, cw0, ccw1, cw1, ...), or None if failed
+        """
+        caps = self.capabilities
+        layers = sorted(set(range(caps.layers) if layers is None else layers))
+        if not caps.encoders or any(layer < 0 or layer >= caps.layers for layer in layers):
             return None
 
-        except Exception as e:
-            print(f"Error getting encoder keycodes: {e}")
-            self.connected = False
+        entries: Optional[Dict[int, Tuple[int, int]]] = None
+        if caps.has(FEATURE_ENCODER_MAP):
+            entries = self._read_encoder_map_bulk(
+                [layer * caps.encoders + idx for layer in layers for idx in range(caps.encoders)]
+            )
+        # Dropped if the firmware rejected the bulk read
+        if not self.capabilities.has(FEATURE_ENCODER_MAP):
+            entries = self._read_encoder_map_entries(layers)
+        if entries is None:
             return None
+
+        encoder_map = {}
+        for layer in layers:
+            first = layer * caps.encoders
+            encoder_map[layer] = tuple(
+                keycode for idx in range(first, first + caps.encoders) for keycode in entries[idx]
+            )
+        return encoder_map
+
+    def get_layer_encoders(self, layer: int) -> Optional[Tuple[int, ...]]:
+        """Keycodes of every encoder on one layer, flattened (see get_encoder_map)."""
+        encoder_map = self.get_encoder_map([layer])
+        return encoder_map.get(layer) if encoder_map else None
+
+    @staticmethod
+    def _encoder_map_request(first: int, count: int) -> bytearray:
+        report = bytearray(64)
+        report[1] = 0xFC
+        report[2] = CMD_GET_ENCODER_MAP
+        report[3] = first
+        report[4] = count
+        return report
+
+    @staticmethod
+    def _encoder_map_entries(payload: bytes) -> Dict[int, Tuple[int, int]]:
+        """Entries of a 0x0A reply: [0xFC][0xFD][0x0A][first][count][ccw, cw]..."""
+        first, count = payload[3], payload[4]
+        return {
+            first + i: (
+                (payload[5 + 4 * i] << 8) | payload[6 + 4 * i],
+                (payload[7 + 4 * i] << 8) | payload[8 + 4 * i],
+            )
+            for i in range(count)
+        }
+
+    def _read_encoder_map_bulk(self, indices: List[int]) -> Optional[Dict[int, Tuple[int, int]]]:
+        """Read encoder map entries with 0x0A, contiguous runs per report.
+
+        Returns None if unanswered, or rejected (the feature is dropped).
+        """
+        chunks: List[List[int]] = []
+        for idx in indices:
+            if chunks and idx == sum(chunks[-1]) and chunks[-1][1] < ENCODER_MAP_CHUNK:
+                chunks[-1][1] += 1
+            else:
+                chunks.append([idx, 1])
+
+        entries: Dict[int, Tuple[int, int]] = {}
+        if self.capabilities.negotiated and len(chunks) > 1:
+            requests = {
+                bytes([0xFC, ACK, CMD_GET_ENCODER_MAP, first]): self._encoder_map_request(first, count)
+                for first, count in chunks
+            }
+            for response in self._transact_pipelined(0xFC, requests).values():
+                entries.update(self._encoder_map_entries(strip_report_id(response)))
+
+        for first, count in chunks:
+            if first in entries:
+                continue
+            resp = self._transact(
+                0xFC,
+                self._encoder_map_request(first, count),
+                lambda p: p[0] == 0xFC
+                and (p[1] == CMD_GET_ENCODER_MAP or p[1:4] == bytes([ACK, CMD_GET_ENCODER_MAP, first])),
+            )
+            if resp is None:
+                return None
+            payload = strip_report_id(resp)
+            if payload[1] != ACK:
+                # Echoed unchanged: firmware without the command
+                self.drop_capability(FEATURE_ENCODER_MAP)
+                return None
+            entries.update(self._encoder_map_entries(payload))
+        return entries
+
+    def _read_encoder_map_entries(self, layers: List[int]) -> Optional[Dict[int, Tuple[int, int]]]:
+        """Read encoder map entries of ``layers`` one encoder at a time."""
+        encoders = self.capabilities.encoders
+        pairs = [(layer, idx) for layer in layers for idx in range(encoders)]
+
+        entries: Dict[int, Tuple[int, int]] = {}
+        if self.capabilities.has(FEATURE_ENCODER_READ) and len(pairs) > 1:
+            # Tagged replies can be matched out of a pipeline
+            requests = {}
+            for layer, idx in pairs:
+                report = bytearray(64)
+                report[1] = 0xFC
+                report[2] = CMD_GET_ENCODER
+                report[3] = layer
+                report[4] = idx
+                requests[bytes([0xFC, ACK, CMD_GET_ENCODER, layer, idx])] = report
+            for tag, response in self._transact_pipelined(0xFC, requests).items():
+                payload = strip_report_id(response)
+                entries[tag[3] * encoders + tag[4]] = (
+                    (payload[5] << 8) | payload[6],
+                    (payload[7] << 8) | payload[8],
+                )
+
+        for layer, idx in pairs:
+            if layer * encoders + idx not in entries:
+                keycodes = self.get_encoder_keycodes(layer, idx)
+                if keycodes is None:
+                    return None
+                entries[layer * encoders + idx] = keycodes
+        return entries
+
+    def _is_vial_response(self, payload: bytes) -> bool:
+        """Match a Vial response (get_encoder, keyboard ID, definition size).
+
+        vial.c answers in place, e.g.:
+            case vial_get_encoder:
+               msg[0] = ccw >> 8; msg[1] = ccw & 0xFF;
+               msg[2] = cw >> 8;  msg[3] = cw & 0xFF;
+
+        So it OVERWRITES the 0xFE prefix and the response cannot be
+        identified by command ID. Since we hold the request/response cycle
+        alone, we assume the next packet that is not an event (0xFB), an
+        ack (0xFC 0xFD) or a keymap buffer response (0x12) is ours.
+        """
+        if len(payload) < 4:
+            return False
+        if payload[0] in (0xFB, self.VIA_CMD_GET_KEYMAP_BUFFER):
+            return False
+        return not (payload[0] == 0xFC and payload[1] == 0xFD)
+
+    # --- Vial keyboard definition ---
+    def _vial_request(self, command: int, argument: bytes = b"") -> Optional[bytes]:
+        """Send a Vial command; returns the payload, None if unanswered or unhandled."""
+        report = bytearray(64)
+        report[1] = self.VIA_CMD_VIAL_PREFIX
+        report[2] = command
+        report[3 : 3 + len(argument)] = argument
+        resp = self._transact(self.VIA_CMD_VIAL_PREFIX, report, self._is_vial_response)
+        if resp is None:
+            return None
+        payload = strip_report_id(resp)
+        if payload[0] == VIA_UNHANDLED and payload[1] == command:
+            # Firmware without Vial
+            return None
+        return payload
+
+    def get_vial_keyboard_id(self) -> Optional[Tuple[int, str]]:
+        """Vial protocol version and keyboard UID (hex, VIAL_KEYBOARD_UID byte order)."""
+        payload = self._vial_request(VIAL_CMD_GET_KEYBOARD_ID)
+        if payload is None or len(payload) < 12:
+            return None
+        version = int.from_bytes(payload[0:4], "little")
+        return version, payload[4:12].hex().upper()
+
+    def get_vial_definition_size(self) -> Optional[int]:
+        """Size of the compressed definition in bytes."""
+        payload = self._vial_request(VIAL_CMD_GET_SIZE)
+        if payload is None:
+            return None
+        size = int.from_bytes(payload[0:4], "little")
+        return size if 0 < size <= MAX_DEFINITION_SIZE else None
+
+    def read_vial_definition(self, size: int) -> Optional[bytes]:
+        """Download the compressed definition block by block and decompress it.
+
+        Blocks are untagged, so they are requested one at a time; events
+        arriving in between are recognized by their zero padding.
+        """
+        decoder = DefinitionDecoder(size)
+        block = 0
+        while not decoder.done:
+            report = bytearray(64)
+            report[1] = self.VIA_CMD_VIAL_PREFIX
+            report[2] = VIAL_CMD_GET_DEFINITION
+            report[3:7] = block.to_bytes(4, "little")
+            resp = self._transact(
+                self.VIA_CMD_VIAL_PREFIX,
+                report,
+                lambda payload: len(payload) >= VIAL_DEFINITION_BLOCK
+                and not is_event_report(payload),
+            )
+            if resp is None:
+                return None
+            try:
+                decoder.feed(strip_report_id(resp)[:VIAL_DEFINITION_BLOCK])
+            except lzma.LZMAError as e:
+                print(f"Corrupt keyboard definition: {e}")
+                return None
+            block += 1
+        try:
+            return decoder.result()
+        except lzma.LZMAError as e:
+            print(f"Corrupt keyboard definition: {e}")
+            return None
+
+    def load_vial_definition(self, cache: Optional[DefinitionCache] = None) -> Optional[bytes]:
+        """Fetch the firmware's vial.json, from the cache when the pad is known.
+
+        Returns None (and leaves vial_definition unset) for firmware
+        without Vial or when the download fails.
+        """
+        ident = self.get_vial_keyboard_id()
+        size = self.get_vial_definition_size() if ident else None
+        if size is None:
+            return None
+        _, uid = ident
+
+        definition = cache.get(uid, size) if cache is not None else None
+        if definition is None:
+            definition = self.read_vial_definition(size)
+            if definition is None:
+                return None
+            if cache is not None:
+                cache.put(uid, size, definition)
+        self.vial_definition = definition
+        return definition
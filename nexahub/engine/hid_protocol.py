@@ -0,0 +1,168 @@
+"""NexaPad raw HID report layout and event decoding.
+
+Shared by the app controller, capture replay and traffic statistics so all
+of them interpret reports the same way.
+"""
+
+from typing import List, Tuple
+
+# Host -> device custom command packet: [0xFC][Command][Data...]
+COMMAND_PREFIX = 0xFC
+# Device acknowledge replaces the command byte: [0xFC][0xFD][Data...]
+ACK = 0xFD
+
+# NexaHub commands (raw_hid_receive_kb in keymap.c)
+CMD_SWITCH_LAYER = 0x01
+CMD_GET_LAYER = 0x02  # -> [0xFC][0xFD][layer]
+CMD_SET_OLED_TIMEOUT = 0x03
+CMD_GET_OLED_TIMEOUT = 0x04
+CMD_GET_CAPABILITIES = 0x05  # Handshake, see engine/capabilities.py
+CMD_GET_ENCODER = 0x06  # [layer, encoder] -> [0xFC][0xFD][0x06][layer][encoder][ccw][cw]
+CMD_SUBSCRIBE_EVENTS = 0x07  # [mask]; kept in RAM until the pad restarts
+CMD_LOAD_PROFILES = 0x08  # [count, layer per slot...]
+CMD_ACTIVATE_PROFILE = 0x09  # [slot]; not acknowledged
+# [first, count] -> [0xFC][0xFD][0x0A][first][count][ccw, cw (u16 BE)] * count;
+# entry i is layer i // encoders, encoder i % encoders
+CMD_GET_ENCODER_MAP = 0x0A
+# Most encoder map entries per reply (32-byte report minus 5 header bytes)
+ENCODER_MAP_CHUNK = 6
+
+# Acks of 0x01-0x04, 0x07 and 0x08 do not name their command, and the
+# firmware echoes every byte it does not write. The host puts a tag of the
+# command in the last bytes of the 32-byte report, past anything a reply
+# writes, so an ack can be told apart from another command's.
+COMMAND_TAG_OFFSET = 29
+
+
+def command_tag(command: int) -> bytes:
+    """Tag of a command, echoed back at COMMAND_TAG_OFFSET in its ack."""
+    return bytes([0x4E, 0x58, command])  # "NX" + command
+
+
+def is_command_ack(payload: bytes, command: int) -> bool:
+    """Whether a report (without report ID) acknowledges ``command``."""
+    return (
+        len(payload) >= COMMAND_TAG_OFFSET + 3
+        and payload[0] == COMMAND_PREFIX
+        and payload[1] == ACK
+        and payload[COMMAND_TAG_OFFSET : COMMAND_TAG_OFFSET + 3] == command_tag(command)
+    )
+
+
+# Event classes for CMD_SUBSCRIBE_EVENTS
+EVENT_MASK_LAYER = 1 << 0
+EVENT_MASK_KEY = 1 << 1
+EVENT_MASK_KEY_BATCH = 1 << 2  # Key events packed into EVENT_KEY_BATCH reports
+# Firmware default, and what legacy firmware always sends
+EVENT_MASK_DEFAULT = EVENT_MASK_LAYER | EVENT_MASK_KEY
+
+# Device -> host event packet: [0xFB][EventType][Data...]
+EVENT_PREFIX = 0xFB
+EVENT_LAYER = 0x01  # [0xFB, 0x01, layer]
+EVENT_KEY = 0x02  # [0xFB, 0x02, row, col, pressed]
+EVENT_KEY_BATCH = 0x03  # [0xFB, 0x03, count, (row, col | pressed << 7) * count]
+KEY_BATCH_PRESSED = 0x80
+
+# Decoded event tuples
+LAYER_EVENT = "layer"  # ("layer", layer_id)
+KEY_EVENT = "key"  # ("key", row, col, pressed)
+
+# VIA / Vial command IDs used by the host
+VIA_CMD_GET_KEYMAP_BUFFER = 0x12
+# Largest keymap chunk per 0x12 request (32-byte report minus 4 header bytes)
+VIA_MAX_CHUNK = 28
+VIA_CMD_VIAL_PREFIX = 0xFE
+# Vial commands (after the 0xFE prefix); answers overwrite the request
+VIAL_CMD_GET_KEYBOARD_ID = 0x00  # -> protocol version (u32 LE), keyboard UID (8 bytes)
+VIAL_CMD_GET_SIZE = 0x01  # -> compressed definition size (u32 LE)
+VIAL_CMD_GET_DEFINITION = 0x02  # [block (u32 LE)] -> 32 bytes of the definition
+VIAL_DEFINITION_BLOCK = 32
+# VIA's answer to a command it does not handle: 0xFF over the command byte
+VIA_UNHANDLED = 0xFF
+
+
+def strip_report_id(data) -> bytes:
+    """Return the report payload without the leading 0x00 report ID."""
+    if len(data) > 0 and data[0] == 0x00:
+        return bytes(data[1:])
+    return bytes(data)
+
+
+def is_event_report(payload: bytes) -> bool:
+    """True if ``payload`` (report ID stripped) is a whole 0xFB event report.
+
+    Events are zero padded, which tells them apart from untagged Vial
+    answers that merely start with 0xFB.
+    """
+    if len(payload) < 3 or payload[0] != EVENT_PREFIX:
+        return False
+    kind = payload[1]
+    if kind == EVENT_LAYER:
+        size = 3
+    elif kind == EVENT_KEY:
+        size = 5
+    elif kind == EVENT_KEY_BATCH:
+        size = 3 + 2 * payload[2]
+    else:
+        return False
+    return not any(payload[size:])
+
+
+def decode_events(data) -> List[Tuple]:
+    """Decode all events carried by a raw HID report.
+
+    Returns:
+        List of ("layer", layer_id) / ("key", row, col, pressed) tuples
+    """
+    payload = strip_report_id(data)
+    if len(payload) < 3 or payload[0] != EVENT_PREFIX:
+        return []
+
+    # Layer Change Event: [0xFB, 0x01, LayerID]
+    if payload[1] == EVENT_LAYER:
+        return [(LAYER_EVENT, payload[2])]
+
+    # Key Event: [0xFB, 0x02, row, col, pressed]
+    if payload[1] == EVENT_KEY and len(payload) > 4:
+        return [(KEY_EVENT, payload[2], payload[3], payload[4] == 1)]
+
+    # Key Events packed in one report, in the order they happened
+    if payload[1] == EVENT_KEY_BATCH:
+        count = min(payload[2], (len(payload) - 3) // 2)
+        return [
+            (
+                KEY_EVENT,
+                payload[3 + 2 * i],
+                payload[4 + 2 * i] & ~KEY_BATCH_PRESSED,
+                bool(payload[4 + 2 * i] & KEY_BATCH_PRESSED),
+            )
+            for i in range(count)
+        ]
+
+    return []
+
+
+def classify_report(payload: bytes, outgoing: bool) -> str:
+    """Return a short type name for traffic statistics."""
+    if not payload:
+        return "empty"
+
+    head = payload[0]
+    if head == COMMAND_PREFIX and len(payload) > 1:
+        if not outgoing and payload[1] == ACK:
+            return "ack"
+        return f"cmd_{payload[1]:02X}"
+    if head == EVENT_PREFIX and len(payload) > 1:
+        if payload[1] == EVENT_LAYER:
+            return "layer_event"
+        if payload[1] == EVENT_KEY:
+            return "key_event"
+        if payload[1] == EVENT_KEY_BATCH:
+            return "key_batch_event"
+        return f"event_{payload[1]:02X}"
+    if head == VIA_CMD_GET_KEYMAP_BUFFER:
+        return "via_get_buffer"
+    if outgoing and head == VIA_CMD_VIAL_PREFIX and len(payload) > 1:
+        return f"vial_{payload[1]:02X}"
+    # Vial responses overwrite the command bytes, so they cannot be typed
+    return "other"
@@ -0,0 +1,116 @@
+"""Adaptive timeouts, retry backoff and a circuit breaker for HID transactions.
+
+Round-trips to the pad are normally a few milliseconds, so a fixed 500 ms
+timeout both detects failures late and treats every glitch like an unplug.
+"""
+
+import random
+import threading
+import time
+from typing import Optional
+
+
+class RttEstimator:
+    """Smoothed round-trip time and derived timeout (RFC 6298 style EWMA)."""
+
+    ALPHA = 1 / 8  # Gain of the smoothed RTT
+    BETA = 1 / 4  # Gain of the RTT variation
+    K = 4  # Timeout = srtt + K * rttvar
+
+    def __init__(self, initial: float = 0.1, min_timeout: float = 0.02, max_timeout: float = 0.5):
+        self.initial = initial
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.srtt: Optional[float] = None
+        self.rttvar = 0.0
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def seed_from(self, other: "RttEstimator"):
+        """Start from another request type's estimate instead of ``initial``."""
+        if other.srtt is not None and self.srtt is None:
+            with self._lock:
+                self.srtt = other.srtt
+                self.rttvar = other.rttvar
+
+    def observe(self, rtt: float):
+        """Add a round-trip sample in seconds (never from a retried request)."""
+        with self._lock:
+            if self.srtt is None:
+                self.srtt = rtt
+                self.rttvar = rtt / 2
+            else:
+                self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+                self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+            self.samples += 1
+
+    def timeout(self, attempt: int = 0) -> float:
+        """Timeout for a request; doubled for each retry."""
+        with self._lock:
+            if self.srtt is None:
+                base = self.initial
+            else:
+                base = self.srtt + self.K * self.rttvar
+        return min(max(base, self.min_timeout) * (2 ** attempt), self.max_timeout)
+
+
+def backoff_delay(attempt: int, base: float = 0.005, cap: float = 0.1) -> float:
+    """Jittered exponential delay before retry number ``attempt`` (1-based)."""
+    delay = min(cap, base * (2 ** (attempt - 1)))
+    # Equal jitter: at least half the delay, so retries never fire back to back
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class CircuitBreaker:
+    """Fails requests fast while a pad stops answering.
+
+    Opens after ``failure_threshold`` consecutive failed requests (each after
+    its retries). While open, requests are refused until ``reset_timeout``
+    has passed; then a single probe is let through (half-open) and its
+    outcome closes or re-opens the breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 1.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Return whether a request may be sent now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            # Open, or half-open with the probe still in flight
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.state = self.CLOSED
+
+    def record_failure(self) -> bool:
+        """Record a failed request; returns True if this opened the breaker."""
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self.failures >= self.failure_threshold
+            ):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def reset(self):
+        with self._lock:
+            self.failures = 0
+            self.state = self.CLOSED
@@ -0,0 +1,79 @@
+"""HID traffic counters for diagnostics."""
+
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Tuple
+
+from engine.hid_protocol import classify_report
+
+
+class HIDStats:
+    """Counts reports by type, timeouts, retries and throughput."""
+
+    # Window used for the bytes-per-second estimate
+    RATE_WINDOW = 5.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Reset all counters."""
+        with self._lock:
+            self.sent: Counter = Counter()
+            self.received: Counter = Counter()
+            self.timeouts = 0
+            self.retries = 0
+            self.bytes_sent = 0
+            self.bytes_received = 0
+            self._samples: Deque[Tuple[float, int]] = deque(maxlen=8192)
+
+    def record_sent(self, payload: bytes):
+        """Count an outgoing report (payload without report ID)."""
+        kind = classify_report(payload, outgoing=True)
+        with self._lock:
+            self.sent[kind] += 1
+            self.bytes_sent += len(payload)
+            self._samples.append((time.monotonic(), len(payload)))
+
+    def record_received(self, payload: bytes):
+        """Count an incoming report (payload without report ID)."""
+        kind = classify_report(payload, outgoing=False)
+        with self._lock:
+            self.received[kind] += 1
+            self.bytes_received += len(payload)
+            self._samples.append((time.monotonic(), len(payload)))
+
+    def record_timeout(self):
+        """Count a transaction that got no response in time."""
+        with self._lock:
+            self.timeouts += 1
+
+    def record_retry(self):
+        """Count a retried transaction."""
+        with self._lock:
+            self.retries += 1
+
+    def bytes_per_second(self) -> float:
+        """Combined in+out throughput over the last RATE_WINDOW seconds."""
+        cutoff = time.monotonic() - self.RATE_WINDOW
+        with self._lock:
+            while self._samples and self._samples[0][0] < cutoff:
+                self._samples.popleft()
+            total = sum(n for _, n in self._samples)
+        return total / self.RATE_WINDOW
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a copy of all counters."""
+        rate = self.bytes_per_second()
+        with self._lock:
+            return {
+                "sent": dict(self.sent),
+                "received": dict(self.received),
+                "timeouts": self.timeouts,
+                "retries": self.retries,
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received,
+                "bytes_per_second": rate,
+            }
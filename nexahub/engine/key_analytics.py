@@ -0,0 +1,296 @@
+"""Key press counts per layer, matrix position and foreground application.
+
+Presses are counted in one flat array per application and layer, indexed
+by matrix position, so recording a press costs well under a microsecond.
+Counts are flushed periodically as a block appended to the history file.
+
+File format (little endian, append-only):
+
+    header:  b"NXKA" + version (u8)
+    block:   kind (u8) + period (u32) + name count (u16) + entry count (u32)
+             names:   length (u8) followed by that many UTF-8 bytes; they
+                      continue the file's application name table
+             entries: application (u16) + layer (u8) + row (u8) + col (u8)
+                      + count (u32)
+
+Blocks of kind HOUR count hours since the epoch, DAY blocks days. A flush
+appends the presses since the previous flush to the current hour. At load,
+blocks of the same period are merged and hours older than ROLLUP_HOURS are
+rolled up into days; the file is rewritten when that made it smaller.
+"""
+
+import struct
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+MAGIC = b"NXKA"
+VERSION = 1
+HEADER = struct.Struct("<4sB")
+BLOCK = struct.Struct("<BIHI")
+ENTRY = struct.Struct("<HBBBI")
+
+# Block kinds
+HOUR = 0
+DAY = 1
+
+# Hourly detail is kept this long, then rolled up into days
+ROLLUP_HOURS = 48
+
+# Application index 0 collects presses with no (or too many) known applications
+UNKNOWN_APP = ""
+MAX_APPS = 0xFFFF
+
+# Counter arrays cover MATRIX_SIDE x MATRIX_SIDE positions; larger ones are ignored
+MATRIX_SHIFT = 5
+MATRIX_SIDE = 1 << MATRIX_SHIFT
+
+
+def _cell(app: int, layer: int, row: int, col: int) -> int:
+    """Pack a counter key: application, layer, row and column."""
+    return (app << 24) | (layer << 16) | (row << 8) | col
+
+
+def _unpack_cell(cell: int) -> Tuple[int, int, int, int]:
+    return cell >> 24, (cell >> 16) & 0xFF, (cell >> 8) & 0xFF, cell & 0xFF
+
+
+class KeyAnalytics:
+    """Counts key presses and keeps hourly and daily totals on disk.
+
+    Not thread safe: record() and flush() are called on the GUI thread.
+    """
+
+    def __init__(self, file_path: Optional[Path] = None):
+        self.file_path = Path(file_path) if file_path else None
+        # Application names; the index is stored in counter keys
+        self.apps: List[str] = [UNKNOWN_APP]
+        self._app_index: Dict[str, int] = {UNKNOWN_APP: 0}
+        self._apps_written = 1
+        # Presses since the last flush: application -> layer -> counts by
+        # (row << MATRIX_SHIFT) | col; _layers is the current application's
+        self._pending: Dict[int, Dict[int, array]] = {0: {}}
+        self._layers = self._pending[0]
+        # (kind, period) -> cell -> count, flushed presses included
+        self.periods: Dict[Tuple[int, int], Dict[int, int]] = {}
+        if self.file_path is not None:
+            self.load()
+
+    # --- Recording ---
+    def set_app(self, process_name: Optional[str]):
+        """Attribute the following presses to ``process_name``."""
+        name = process_name or UNKNOWN_APP
+        index = self._app_index.get(name)
+        if index is None:
+            if len(self.apps) >= MAX_APPS:
+                index = 0
+            else:
+                index = self._app_index[name] = len(self.apps)
+                self.apps.append(name)
+        self._layers = self._pending.setdefault(index, {})
+
+    def record(self, layer: int, row: int, col: int):
+        """Count a key press on ``layer`` at matrix position (row, col)."""
+        if row >= MATRIX_SIDE or col >= MATRIX_SIDE:
+            return
+        counts = self._layers.get(layer)
+        if counts is None:
+            counts = self._layers[layer] = array("I", bytes(4 * MATRIX_SIDE * MATRIX_SIDE))
+        counts[(row << MATRIX_SHIFT) | col] += 1
+
+    @property
+    def pending(self) -> int:
+        """Presses recorded since the last flush."""
+        return sum(sum(counts) for layers in self._pending.values() for counts in layers.values())
+
+    def _pending_cells(self) -> Dict[int, int]:
+        """Presses since the last flush by counter key."""
+        cells = {}
+        for app, layers in self._pending.items():
+            for layer, counts in layers.items():
+                for position, count in enumerate(counts):
+                    if count:
+                        row, col = position >> MATRIX_SHIFT, position & (MATRIX_SIDE - 1)
+                        cells[_cell(app, layer, row, col)] = count
+        return cells
+
+    # --- Queries ---
+    def heatmap(
+        self, layer: int, rows: int, cols: int, app: Optional[str] = None
+    ) -> List[int]:
+        """Presses per matrix position (row major) of a layer, flushed or not.
+
+        Args:
+            app: Only presses in this application (default: all)
+        """
+        counts = [0] * (rows * cols)
+        only = self._app_index.get(app, -1) if app is not None else None
+        for cell, count in self._all_cells():
+            index, cell_layer, row, col = _unpack_cell(cell)
+            if cell_layer == layer and row < rows and col < cols and only in (None, index):
+                counts[row * cols + col] += count
+        return counts
+
+    def totals(self, kind: int = HOUR) -> Dict[int, int]:
+        """Presses per period (hours or days since the epoch), flushed only."""
+        totals: Dict[int, int] = {}
+        for (block_kind, period), cells in self.periods.items():
+            if block_kind == kind:
+                totals[period] = totals.get(period, 0) + sum(cells.values())
+        return totals
+
+    def app_totals(self) -> Dict[str, int]:
+        """Presses per application, flushed or not."""
+        totals: Dict[str, int] = {}
+        for cell, count in self._all_cells():
+            name = self.apps[cell >> 24]
+            totals[name] = totals.get(name, 0) + count
+        return totals
+
+    def _all_cells(self):
+        for cells in self.periods.values():
+            yield from cells.items()
+        yield from self._pending_cells().items()
+
+    # --- Persistence ---
+    def flush(self, now: Optional[float] = None) -> bool:
+        """Append the presses since the last flush to the current hour.
+
+        Returns:
+            True if anything was written
+        """
+        cells = self._pending_cells()
+        if not cells:
+            return False
+        hour = int((time.time() if now is None else now) // 3600)
+        # Zeroed in place: the arrays of the current application stay in use
+        for layers in self._pending.values():
+            for counts in layers.values():
+                counts[:] = array("I", bytes(len(counts) * 4))
+
+        merged = self.periods.setdefault((HOUR, hour), {})
+        for cell, count in cells.items():
+            merged[cell] = merged.get(cell, 0) + count
+
+        if self.file_path is None:
+            return True
+        new_apps = self.apps[self._apps_written :]
+        block = self._encode_block(HOUR, hour, new_apps, cells)
+        try:
+            self.file_path.parent.mkdir(parents=True, exist_ok=True)
+            new_file = not self.file_path.exists()
+            with open(self.file_path, "ab") as f:
+                if new_file:
+                    f.write(HEADER.pack(MAGIC, VERSION))
+                f.write(block)
+        except OSError as e:
+            print(f"Could not save key analytics: {e}")
+            return False
+        self._apps_written += len(new_apps)
+        return True
+
+    def load(self, now: Optional[float] = None):
+        """Read the history, roll up old hours and compact the file if needed."""
+        try:
+            data = self.file_path.read_bytes()
+        except OSError:
+            return
+        try:
+            apps, blocks, complete = self._decode(data)
+        except (struct.error, UnicodeDecodeError, ValueError) as e:
+            # Moved aside: flush() appends blocks, which would be lost after
+            # the unreadable part; the next flush starts a new file
+            print(f"Ignoring unreadable key analytics: {e}")
+            try:
+                self.file_path.replace(self.file_path.with_suffix(".bad"))
+            except OSError as e:
+                print(f"Could not move unreadable key analytics aside: {e}")
+            return
+
+        self.apps = apps
+        self._app_index = {name: index for index, name in enumerate(self.apps)}
+        self._apps_written = len(self.apps)
+        self.periods = {}
+        for kind, period, cells in blocks:
+            self._merge(kind, period, cells)
+
+        oldest_hour = int((time.time() if now is None else now) // 3600) - ROLLUP_HOURS
+        for kind, period in [key for key in self.periods if key[0] == HOUR]:
+            if period < oldest_hour:
+                self._merge(DAY, period // 24, self.periods.pop((kind, period)))
+
+        if not complete or len(self.periods) < len(blocks):
+            self._rewrite()
+
+    def _merge(self, kind: int, period: int, cells: Dict[int, int]):
+        merged = self.periods.setdefault((kind, period), {})
+        for cell, count in cells.items():
+            merged[cell] = merged.get(cell, 0) + count
+
+    def _rewrite(self):
+        """Replace the file with one block per period."""
+        parts = [HEADER.pack(MAGIC, VERSION)]
+        apps = self.apps[1:]
+        # Days first, so periods stay in chronological order
+        order = sorted(self.periods, key=lambda key: (key[0] != DAY, key[1]))
+        for kind, period in order:
+            cells = self.periods[kind, period]
+            parts.append(self._encode_block(kind, period, apps, cells))
+            apps = []
+        try:
+            # Replace atomically so a crash never leaves half a file
+            tmp_path = self.file_path.with_suffix(".tmp")
+            tmp_path.write_bytes(b"".join(parts))
+            tmp_path.replace(self.file_path)
+        except OSError as e:
+            print(f"Could not compact key analytics: {e}")
+            return
+        # The name table travels in the first block
+        self._apps_written = len(self.apps) if order else 1
+
+    @staticmethod
+    def _encode_block(kind: int, period: int, apps: List[str], cells: Dict[int, int]) -> bytes:
+        parts = [BLOCK.pack(kind, period, len(apps), len(cells))]
+        for name in apps:
+            raw = name.encode("utf-8")[:255]
+            parts.append(bytes([len(raw)]) + raw)
+        parts.extend(
+            ENTRY.pack(*_unpack_cell(cell), min(count, 0xFFFFFFFF))
+            for cell, count in cells.items()
+        )
+        return b"".join(parts)
+
+    @staticmethod
+    def _decode(data: bytes) -> Tuple[List[str], List[Tuple[int, int, Dict[int, int]]], bool]:
+        """Name table, blocks and whether the file ended on a block boundary."""
+        magic, version = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a key analytics file")
+        offset = HEADER.size
+
+        apps = [UNKNOWN_APP]
+        blocks = []
+        while offset < len(data):
+            try:
+                kind, period, app_count, entry_count = BLOCK.unpack_from(data, offset)
+                position = offset + BLOCK.size
+                names = []
+                for _ in range(app_count):
+                    length = data[position]
+                    names.append(data[position + 1 : position + 1 + length].decode("utf-8"))
+                    position += 1 + length
+                cells = {}
+                for _ in range(entry_count):
+                    app, layer, row, col, count = ENTRY.unpack_from(data, position)
+                    position += ENTRY.size
+                    if app >= len(apps) + len(names):
+                        raise ValueError("unknown application index")
+                    cells[_cell(app, layer, row, col)] = count
+            except (struct.error, IndexError, UnicodeDecodeError, ValueError):
+                # A flush interrupted mid-write; everything before it counts
+                return apps, blocks, False
+            apps.extend(names)
+            blocks.append((kind, period, cells))
+            offset = position
+        return apps, blocks, True
@@ -0,0 +1,168 @@
+"""Last known keymaps of each pad, so the overlay can draw them at startup.
+
+File format, one file per pad (little endian header, keycodes big endian
+as in the VIA keymap buffer):
+
+    header:   b"NXKS" + version (u8) + key length (u8) + key (UTF-8)
+              + layer (u8) + rows (u8) + cols (u8) + layers (u8)
+              + encoders (u8) + checksum (u32)
+    per layer: rows * cols keycodes (u16), then ccw and cw (u16) of each
+              encoder
+
+The checksum is the CRC-32 of the layer data. It identifies the keymap
+generation: an unchanged keymap is not rewritten, and a damaged file is
+ignored.
+"""
+
+import hashlib
+import struct
+import threading
+import zlib
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+MAGIC = b"NXKS"
+VERSION = 1
+PREFIX = struct.Struct("<4sBB")
+HEADER = struct.Struct("<BBBBBI")
+
+Keymap = Tuple[list, Optional[tuple]]
+
+
+class KeymapSnapshot:
+    """Every layer's keycodes and encoder keycodes of one pad."""
+
+    def __init__(self, layer: int, rows: int, cols: int, keymaps: Dict[int, Keymap]):
+        self.layer = layer
+        self.rows = rows
+        self.cols = cols
+        # layer -> (keycodes, encoder_keycodes), layers 0..n-1
+        self.keymaps = keymaps
+
+    @property
+    def encoders(self) -> int:
+        return max((len(encoder or ()) // 2 for _, encoder in self.keymaps.values()), default=0)
+
+    def _layer_data(self) -> bytes:
+        num_keys = self.rows * self.cols
+        encoder_values = 2 * self.encoders
+        parts = []
+        for layer in range(len(self.keymaps)):
+            keycodes, encoder_keycodes = self.keymaps[layer]
+            values = list(keycodes[:num_keys]) + [0] * (num_keys - len(keycodes))
+            if encoder_values:
+                encoder_keycodes = list(encoder_keycodes or ())
+                values += encoder_keycodes + [0] * (encoder_values - len(encoder_keycodes))
+            parts.append(struct.pack(f">{len(values)}H", *values))
+        return b"".join(parts)
+
+    @property
+    def checksum(self) -> int:
+        return zlib.crc32(self._layer_data())
+
+    def encode(self, key: str) -> bytes:
+        raw_key = key.encode("utf-8")[:255]
+        data = self._layer_data()
+        return b"".join([
+            PREFIX.pack(MAGIC, VERSION, len(raw_key)),
+            raw_key,
+            HEADER.pack(
+                self.layer, self.rows, self.cols, len(self.keymaps),
+                self.encoders, zlib.crc32(data),
+            ),
+            data,
+        ])
+
+    @classmethod
+    def decode(cls, data: bytes) -> Tuple[str, "KeymapSnapshot"]:
+        magic, version, key_length = PREFIX.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a keymap snapshot")
+        offset = PREFIX.size
+        key = data[offset : offset + key_length].decode("utf-8")
+        offset += key_length
+        layer, rows, cols, layers, encoders, checksum = HEADER.unpack_from(data, offset)
+        offset += HEADER.size
+
+        body = data[offset:]
+        if zlib.crc32(body) != checksum:
+            raise ValueError("checksum mismatch")
+        num_keys = rows * cols
+        per_layer = num_keys + 2 * encoders
+        keymaps = {}
+        for index in range(layers):
+            values = struct.unpack_from(f">{per_layer}H", body, index * per_layer * 2)
+            keymaps[index] = (list(values[:num_keys]), tuple(values[num_keys:]) if encoders else None)
+        return key, cls(layer, rows, cols, keymaps)
+
+
+class SnapshotStore:
+    """Keymap snapshots on disk, one file per pad key."""
+
+    SUFFIX = ".nxks"
+
+    def __init__(self, directory: Optional[Path] = None):
+        self.directory = Path(directory) if directory else Path.home() / ".nexahub" / "snapshots"
+        self._lock = threading.Lock()
+        # key -> (checksum, layer) on disk, to skip unchanged writes
+        self._written: Dict[str, Tuple[int, int]] = {}
+
+    def _path(self, key: str) -> Path:
+        # Pad keys may hold characters that are not valid in file names
+        return self.directory / (hashlib.sha1(key.encode("utf-8")).hexdigest()[:16] + self.SUFFIX)
+
+    def _read(self, path: Path) -> Optional[Tuple[str, KeymapSnapshot]]:
+        try:
+            key, snapshot = KeymapSnapshot.decode(path.read_bytes())
+        except OSError:
+            return None
+        except (struct.error, UnicodeDecodeError, ValueError) as e:
+            print(f"Ignoring unreadable keymap snapshot {path.name}: {e}")
+            return None
+        with self._lock:
+            self._written[key] = (snapshot.checksum, snapshot.layer)
+        return key, snapshot
+
+    def load(self, key: str) -> Optional[KeymapSnapshot]:
+        """Snapshot of a pad, None if there is none (or it is damaged)."""
+        entry = self._read(self._path(key))
+        if entry is None or entry[0] != key:
+            return None
+        return entry[1]
+
+    def load_latest(self) -> Optional[Tuple[str, KeymapSnapshot]]:
+        """Most recently written snapshot and its pad key (the last pad used)."""
+        try:
+            paths = sorted(
+                self.directory.glob(f"*{self.SUFFIX}"),
+                key=lambda path: path.stat().st_mtime,
+                reverse=True,
+            )
+        except OSError:
+            return None
+        for path in paths:
+            entry = self._read(path)
+            if entry is not None:
+                return entry
+        return None
+
+    def save(self, key: str, snapshot: KeymapSnapshot) -> bool:
+        """Write a snapshot unless the same keymap and layer are already stored."""
+        if not snapshot.keymaps:
+            return False
+        state = (snapshot.checksum, snapshot.layer)
+        with self._lock:
+            if self._written.get(key) == state:
+                return False
+            try:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                path = self._path(key)
+                # Replace atomically so a crash never leaves half a file
+                tmp_path = path.with_suffix(".tmp")
+                tmp_path.write_bytes(snapshot.encode(key))
+                tmp_path.replace(path)
+            except OSError as e:
+                print(f"Could not save keymap snapshot: {e}")
+                return False
+            self._written[key] = state
+        return True
@@ -0,0 +1,150 @@
+"""Lightweight latency tracing for the focus -> layer switch pipeline.
+
+Call sites guard every mark with ``if tracer.enabled:`` so a disabled tracer
+costs a single attribute check on the hot path.
+"""
+
+import json
+from bisect import bisect_left
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+
+def percentile(sorted_values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence."""
+    if not sorted_values:
+        return 0.0
+    rank = int(round(pct / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[max(0, min(rank, len(sorted_values) - 1))]
+
+
+class LatencyTracer:
+    """Records monotonic stage timestamps in a ring buffer."""
+
+    # Pipeline stages in the order they happen for a single focus change
+    STAGE_FOCUS = "focus"  # WindowMonitor detected a new foreground window
+    STAGE_MATCH = "match"  # _find_matching_layer returned
+    STAGE_SWITCH = "switch"  # HIDManager.switch_layer sent the report
+    STAGE_ACK = "ack"  # 0xFD acknowledge received from the device
+    STAGE_LAYER_EVENT = "layer_event"  # 0xFB 0x01 layer event received
+
+    STAGES = (STAGE_FOCUS, STAGE_MATCH, STAGE_SWITCH, STAGE_ACK, STAGE_LAYER_EVENT)
+    TOTAL = "total"
+
+    # Histogram bucket upper bounds in milliseconds
+    HISTOGRAM_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000)
+
+    def __init__(self, capacity: int = 4096):
+        self.enabled = False
+        self._events: Deque[Tuple[str, int]] = deque(maxlen=capacity)
+
+    def mark(self, stage: str):
+        """Record a timestamp for a stage (callers check ``enabled`` first)."""
+        # deque.append is atomic, so marks from the monitor, HID and GUI
+        # threads need no extra locking.
+        self._events.append((stage, time.perf_counter_ns()))
+
+    def clear(self):
+        """Discard all recorded events."""
+        self._events.clear()
+
+    def _chains(self) -> List[Dict[str, int]]:
+        """Group the flat event stream into per-focus-change chains.
+
+        A stage is only attached to the open chain if the stage before it
+        has already been seen, so unrelated acks (pings, OLED commands) do
+        not pollute the measurement.
+        """
+        chains: List[Dict[str, int]] = []
+        current: Optional[Dict[str, int]] = None
+        for stage, ts in list(self._events):
+            if stage == self.STAGE_FOCUS:
+                current = {stage: ts}
+                chains.append(current)
+                continue
+            if current is None or stage in current:
+                continue
+            idx = self.STAGES.index(stage)
+            if self.STAGES[idx - 1] in current:
+                current[stage] = ts
+        return chains
+
+    def samples(self) -> Dict[str, List[float]]:
+        """Per-stage latencies in milliseconds, measured from the previous stage."""
+        result: Dict[str, List[float]] = {s: [] for s in self.STAGES[1:]}
+        result[self.TOTAL] = []
+        for chain in self._chains():
+            prev = chain[self.STAGE_FOCUS]
+            last = prev
+            for stage in self.STAGES[1:]:
+                ts = chain.get(stage)
+                if ts is None:
+                    break
+                result[stage].append((ts - prev) / 1e6)
+                prev = last = ts
+            if self.STAGE_LAYER_EVENT in chain:
+                result[self.TOTAL].append((last - chain[self.STAGE_FOCUS]) / 1e6)
+        return result
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Return count, p50, p95, p99 and max (ms) for each stage."""
+        summary = {}
+        for stage, values in self.samples().items():
+            values.sort()
+            summary[stage] = {
+                "count": len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "max": values[-1] if values else 0.0,
+            }
+        return summary
+
+    def histograms(self) -> Dict[str, List[int]]:
+        """Sample counts per HISTOGRAM_BUCKETS_MS bucket for each stage.
+
+        Bucket i counts values up to bound i (and above bound i - 1); one
+        more bucket at the end counts values above the last bound.
+        """
+        histograms = {}
+        for stage, values in self.samples().items():
+            counts = [0] * (len(self.HISTOGRAM_BUCKETS_MS) + 1)
+            for value in values:
+                counts[bisect_left(self.HISTOGRAM_BUCKETS_MS, value)] += 1
+            histograms[stage] = counts
+        return histograms
+
+    def to_chrome_trace(self) -> Dict:
+        """Build a Chrome trace (chrome://tracing / Perfetto) document."""
+        pid = os.getpid()
+        events = []
+        for tid, chain in enumerate(self._chains(), start=1):
+            prev = chain[self.STAGE_FOCUS]
+            for stage in self.STAGES[1:]:
+                ts = chain.get(stage)
+                if ts is None:
+                    break
+                events.append(
+                    {
+                        "name": stage,
+                        "cat": "nexahub",
+                        "ph": "X",
+                        "ts": prev / 1000.0,
+                        "dur": (ts - prev) / 1000.0,
+                        "pid": pid,
+                        "tid": tid,
+                    }
+                )
+                prev = ts
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, file_path: str):
+        """Write the recorded chains as Chrome trace JSON."""
+        with open(file_path, "w") as f:
+            json.dump(self.to_chrome_trace(), f)
+
+
+# Shared tracer used by the monitor, HID manager and app controller
+tracer = LatencyTracer()
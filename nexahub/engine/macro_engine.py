@@ -0,0 +1,336 @@
+"""Host actions (macros) triggered by pad keys.
+
+Macros are configured in settings ("macros"). Each one is bound to a matrix
+position, optionally on a single layer, or to a keycode such as a Vial
+custom keycode (KC_APP_0), which is looked up in the pad's keymaps:
+
+    {"layer": 1, "row": 2, "col": 0, "action": "launch", "target": "notepad.exe"}
+    {"keycode": "KC_APP_0", "action": "keys", "target": "ctrl+shift+esc"}
+    {"row": 3, "col": 3, "action": "command", "target": "backup.bat", "on": "release"}
+
+Actions: "launch" starts a program (optional "args" list), "command" runs a
+shell command line, "keys" sends key chords separated by commas
+("ctrl+c, alt+tab", Windows only). Macros fire on press unless "on" is
+"release".
+
+Bindings are compiled into one table per pad, keyed by layer, row, column
+and press/release packed into an int, so a key event costs one dictionary
+lookup on the HID thread. Actions run on a small thread pool: a slow one
+never delays HID decoding or other macros.
+"""
+
+import subprocess
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from engine.latency_tracer import percentile
+
+MAX_WORKERS = 4
+# Trigger to action latency samples kept for diagnostics
+LATENCY_SAMPLES = 1024
+
+# Keycode resolved through layer 0 where a layer is transparent
+KC_TRANSPARENT = 0x0001
+
+# Windows virtual-key codes of the key names accepted by "keys" macros
+VIRTUAL_KEYS = {
+    "ctrl": 0x11, "shift": 0x10, "alt": 0x12, "win": 0x5B,
+    "enter": 0x0D, "esc": 0x1B, "tab": 0x09, "space": 0x20, "backspace": 0x08,
+    "delete": 0x2E, "insert": 0x2D, "home": 0x24, "end": 0x23,
+    "pgup": 0x21, "pgdn": 0x22, "left": 0x25, "up": 0x26, "right": 0x27, "down": 0x28,
+    "printscreen": 0x2C, "mute": 0xAD, "voldown": 0xAE, "volup": 0xAF,
+    "next": 0xB0, "prev": 0xB1, "play": 0xB3,
+}
+VIRTUAL_KEYS.update({chr(c): c for c in range(ord("0"), ord("9") + 1)})
+VIRTUAL_KEYS.update({chr(c).lower(): c for c in range(ord("A"), ord("Z") + 1)})
+VIRTUAL_KEYS.update({f"f{n}": 0x6F + n for n in range(1, 25)})
+# Sent with KEYEVENTF_EXTENDEDKEY so they are not read as keypad keys
+EXTENDED_KEYS = {0x21, 0x22, 0x23, 0x24, 0x25, 0x26, 0x27, 0x28, 0x2D, 0x2E, 0x5B}
+
+KEYEVENTF_EXTENDEDKEY = 0x0001
+KEYEVENTF_KEYUP = 0x0002
+
+if sys.platform == "win32":
+    import ctypes
+
+    _keybd_event = ctypes.windll.user32.keybd_event
+else:
+    _keybd_event = None
+
+
+def table_key(layer: int, row: int, col: int, pressed: bool) -> int:
+    """Pack an action table key."""
+    return (layer << 17) | (row << 9) | (col << 1) | pressed
+
+
+class MacroAction(ABC):
+    """An action compiled from a macro entry."""
+
+    __slots__ = ("description",)
+
+    def __init__(self, description: str):
+        self.description = description
+
+    @abstractmethod
+    def run(self):
+        """Perform the action (on a pool thread)."""
+
+
+class LaunchAction(MacroAction):
+    """Start a program without waiting for it."""
+
+    __slots__ = ("argv",)
+
+    def __init__(self, target: str, args: Iterable[str] = ()):
+        super().__init__(f"launch {target}")
+        self.argv = [target, *map(str, args)]
+
+    def run(self):
+        subprocess.Popen(self.argv)
+
+
+class CommandAction(MacroAction):
+    """Run a shell command line without waiting for it."""
+
+    __slots__ = ("command",)
+
+    def __init__(self, command: str):
+        super().__init__(f"command {command}")
+        self.command = command
+
+    def run(self):
+        subprocess.Popen(self.command, shell=True)
+
+
+class KeysAction(MacroAction):
+    """Send a sequence of key chords to the foreground window."""
+
+    __slots__ = ("chords",)
+
+    def __init__(self, sequence: str):
+        super().__init__(f"keys {sequence}")
+        self.chords = [self.parse_chord(chord) for chord in sequence.split(",") if chord.strip()]
+        if not self.chords:
+            raise ValueError("empty key sequence")
+
+    @staticmethod
+    def parse_chord(chord: str) -> Tuple[int, ...]:
+        """Virtual-key codes of "ctrl+shift+t", pressed in that order."""
+        codes = []
+        for name in chord.strip().lower().split("+"):
+            code = VIRTUAL_KEYS.get(name.strip())
+            if code is None:
+                raise ValueError(f"unknown key {name.strip()!r}")
+            codes.append(code)
+        return tuple(codes)
+
+    def run(self):
+        if _keybd_event is None:
+            print(f"Keystroke macros need Windows; skipped {self.description}")
+            return
+        for chord in self.chords:
+            for code in chord:
+                _keybd_event(code, 0, KEYEVENTF_EXTENDEDKEY if code in EXTENDED_KEYS else 0, 0)
+            for code in reversed(chord):
+                flags = KEYEVENTF_KEYUP | (KEYEVENTF_EXTENDEDKEY if code in EXTENDED_KEYS else 0)
+                _keybd_event(code, 0, flags, 0)
+
+
+ACTIONS = {"launch", "command", "keys"}
+
+
+def build_action(entry: Dict[str, Any]) -> MacroAction:
+    """Compile the action of a macro entry.
+
+    Raises:
+        ValueError: If the action or its target is invalid
+    """
+    kind = entry.get("action")
+    target = entry.get("target")
+    if kind not in ACTIONS:
+        raise ValueError(f"unknown action {kind!r}")
+    if not isinstance(target, str) or not target:
+        raise ValueError("missing target")
+    if kind == "launch":
+        return LaunchAction(target, entry.get("args") or ())
+    if kind == "command":
+        return CommandAction(target)
+    return KeysAction(target)
+
+
+class MacroEngine:
+    """Action tables of the connected pads and the pool running the actions.
+
+    compile() runs on the GUI thread and replaces a pad's table in one
+    assignment; dispatch() and set_layer() run on the pads' HID threads.
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS):
+        self.max_workers = max_workers
+        self.entries: List[Dict[str, Any]] = []
+        # (entry, action, pressed) of the valid entries, lowest priority first
+        self._bindings: List[Tuple[Dict[str, Any], MacroAction, bool]] = []
+        # pad key -> table_key() -> action
+        self._tables: Dict[str, Dict[int, MacroAction]] = {}
+        # pad key -> layer, as last reported by the pad's layer events
+        self._layers: Dict[str, int] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        # Milliseconds from receiving the key event to the action having run
+        self._latencies: deque = deque(maxlen=LATENCY_SAMPLES)
+        self.dispatched = 0
+        self.failures = 0
+
+    @property
+    def active(self) -> bool:
+        """Whether any macro is configured (key events are needed)."""
+        return bool(self._bindings)
+
+    @property
+    def uses_keycodes(self) -> bool:
+        """Whether a binding depends on keymaps, so keymap reads recompile."""
+        return any("keycode" in entry for entry, _, _ in self._bindings)
+
+    def configure(self, entries: List[Dict[str, Any]]):
+        """Macro entries from settings; compile() builds the tables.
+
+        Position bindings override keycode bindings, and ones with a layer
+        override those without.
+        """
+        self.entries = [entry for entry in entries or [] if isinstance(entry, dict)]
+        bindings = []
+        for entry in self.entries:
+            try:
+                action = build_action(entry)
+            except ValueError as e:
+                print(f"Ignoring invalid macro {entry}: {e}")
+                continue
+            if "keycode" in entry:
+                priority = 0
+            else:
+                priority = 2 if entry.get("layer") is not None else 1
+            bindings.append((priority, entry, action, entry.get("on", "press") != "release"))
+        bindings.sort(key=lambda binding: binding[0])
+        self._bindings = [binding[1:] for binding in bindings]
+
+    # --- Compilation (GUI thread) ---
+    def compile(
+        self,
+        key: str,
+        layers: int,
+        keymaps: Dict[int, Tuple[list, Optional[tuple]]],
+        cols: int,
+        keycode_name=None,
+    ) -> int:
+        """Build the action table of a pad.
+
+        Keycode bindings fire where the keycode sits in ``keymaps`` (keys
+        transparent on a layer use layer 0's keycode).
+
+        Args:
+            layers: Number of layers of the pad
+            keymaps: The pad's cached keymaps (layer -> (keycodes, encoders))
+            cols: Matrix columns, to turn keymap indexes into positions
+            keycode_name: Callable naming a keycode (the pad's keycode namespace)
+
+        Returns:
+            Number of table entries
+        """
+        table: Dict[int, MacroAction] = {}
+        for entry, action, pressed in self._bindings:
+            for layer, row, col in self._positions(entry, layers, keymaps, cols, keycode_name):
+                table[table_key(layer, row, col, pressed)] = action
+        self._tables[key] = table
+        return len(table)
+
+    @staticmethod
+    def _positions(entry, layers, keymaps, cols, keycode_name):
+        """(layer, row, col) bound by a macro entry."""
+        if "keycode" in entry:
+            if keycode_name is None or cols <= 0:
+                return
+            base = keymaps.get(0, ([], None))[0]
+            for layer in range(layers):
+                keymap = keymaps.get(layer)
+                if keymap is None:
+                    continue
+                for index, keycode in enumerate(keymap[0]):
+                    if keycode == KC_TRANSPARENT and index < len(base):
+                        keycode = base[index]
+                    if keycode_name(keycode) == entry["keycode"]:
+                        yield (layer,) + divmod(index, cols)
+            return
+        try:
+            row, col = int(entry["row"]), int(entry["col"])
+        except (KeyError, TypeError, ValueError):
+            print(f"Ignoring macro without a key: {entry}")
+            return
+        layer = entry.get("layer")
+        for bound_layer in range(layers) if layer is None else [int(layer)]:
+            yield bound_layer, row, col
+
+    def remove(self, key: str):
+        """Forget a disconnected pad."""
+        self._tables.pop(key, None)
+        self._layers.pop(key, None)
+
+    # --- Dispatch (HID threads) ---
+    def set_layer(self, key: str, layer: int):
+        self._layers[key] = layer
+
+    def dispatch(self, key: str, row: int, col: int, pressed: bool) -> bool:
+        """Run the action bound to a key event, if any.
+
+        Returns:
+            True if an action was queued
+        """
+        received = time.perf_counter_ns()
+        table = self._tables.get(key)
+        if not table:
+            return False
+        layer = self._layers.get(key)
+        if layer is None:
+            return False
+        action = table.get(table_key(layer, row, col, pressed))
+        if action is None:
+            return False
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix="macro"
+                    )
+        self.dispatched += 1
+        self._executor.submit(self._run, action, received)
+        return True
+
+    def _run(self, action: MacroAction, received: int):
+        try:
+            action.run()
+        except Exception as e:
+            self.failures += 1
+            print(f"Macro {action.description} failed: {e}")
+            return
+        self._latencies.append((time.perf_counter_ns() - received) / 1e6)
+
+    # --- Reporting ---
+    def latency_summary(self) -> Dict[str, float]:
+        """Trigger to action latency in milliseconds over the recent samples."""
+        samples = sorted(self._latencies)
+        return {
+            "count": len(samples),
+            "p50": percentile(samples, 50),
+            "p95": percentile(samples, 95),
+            "max": samples[-1] if samples else 0.0,
+        }
+
+    def close(self):
+        """Stop the pool; actions already running finish in the background."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
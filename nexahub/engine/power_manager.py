@@ -0,0 +1,282 @@
+"""Power-state tracking that suspends periodic work when it is not needed.
+
+Tracks session lock, display power, device presence and window visibility,
+and starts or stops each registered periodic activity (timers, the window
+monitor) so an idle or locked workstation sees no wakeups from NexaHub.
+"""
+
+import sys
+import time
+import ctypes
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+from PySide6.QtCore import QObject, QEvent, QTimer, QAbstractNativeEventFilter, Signal
+
+# Win32 message constants
+WM_WTSSESSION_CHANGE = 0x02B1
+WTS_SESSION_LOCK = 0x7
+WTS_SESSION_UNLOCK = 0x8
+NOTIFY_FOR_THIS_SESSION = 0
+
+WM_POWERBROADCAST = 0x0218
+PBT_APMSUSPEND = 0x0004
+PBT_APMRESUMEAUTOMATIC = 0x0012
+PBT_POWERSETTINGCHANGE = 0x8013
+DEVICE_NOTIFY_WINDOW_HANDLE = 0
+
+WM_DEVICECHANGE = 0x0219
+DBT_DEVNODES_CHANGED = 0x0007
+DBT_DEVICEARRIVAL = 0x8000
+DBT_DEVICEREMOVECOMPLETE = 0x8004
+
+if sys.platform == "win32":
+    from ctypes import wintypes
+
+    class GUID(ctypes.Structure):
+        _fields_ = [
+            ("Data1", wintypes.DWORD),
+            ("Data2", wintypes.WORD),
+            ("Data3", wintypes.WORD),
+            ("Data4", ctypes.c_ubyte * 8),
+        ]
+
+    class POWERBROADCAST_SETTING(ctypes.Structure):
+        _fields_ = [
+            ("PowerSetting", GUID),
+            ("DataLength", wintypes.DWORD),
+            ("Data", ctypes.c_ubyte * 1),
+        ]
+
+    # GUID_CONSOLE_DISPLAY_STATE {6FE69556-704A-47A0-8F24-C28D936FDA47}
+    GUID_CONSOLE_DISPLAY_STATE = GUID(
+        0x6FE69556,
+        0x704A,
+        0x47A0,
+        (ctypes.c_ubyte * 8)(0x8F, 0x24, 0xC2, 0x8D, 0x93, 0x6F, 0xDA, 0x47),
+    )
+
+
+class _NativeEventFilter(QAbstractNativeEventFilter):
+    """Forwards Windows messages to the power manager."""
+
+    def __init__(self, manager: "PowerStateManager"):
+        super().__init__()
+        self.manager = manager
+
+    def nativeEventFilter(self, event_type, message):
+        if event_type == b"windows_generic_MSG":
+            try:
+                msg = wintypes.MSG.from_address(int(message))
+                self.manager._on_native_message(msg.message, msg.wParam, msg.lParam)
+            except Exception:
+                pass
+        return False, 0
+
+
+class PowerStateManager(QObject):
+    """Starts and suspends periodic activities based on power state."""
+
+    state_changed = Signal()
+    # Emitted (debounced) when Windows reports a device arrival/removal
+    devices_changed = Signal()
+
+    # Window for the wakeups-per-minute metric
+    WAKEUP_WINDOW = 60.0
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.session_locked = False
+        self.display_off = False
+        self.device_present = False
+        self.windows_visible = False
+        # True once Windows device-change notifications are available, so
+        # reconnect polling can be suspended while the pad is absent
+        self.device_notifications = False
+
+        # name -> (start, stop, should_run, running)
+        self._activities: Dict[str, List] = {}
+        self._visible_widgets: Dict[QObject, bool] = {}
+        self._wakeups: Deque[float] = deque(maxlen=10000)
+        self._native_filter: Optional[_NativeEventFilter] = None
+        self._power_notify_handle = None
+
+        self._device_change_timer = QTimer(self)
+        self._device_change_timer.setSingleShot(True)
+        self._device_change_timer.timeout.connect(self.devices_changed.emit)
+
+    # --- Activities ---
+    def register(
+        self,
+        name: str,
+        start: Callable[[], None],
+        stop: Callable[[], None],
+        should_run: Callable[["PowerStateManager"], bool],
+    ):
+        """Register a periodic activity and apply the current state to it."""
+        self._activities[name] = [start, stop, should_run, False]
+        self._apply()
+
+    def register_timer(
+        self, name: str, timer: QTimer, interval: int,
+        should_run: Callable[["PowerStateManager"], bool],
+    ):
+        """Register a QTimer; its timeouts are counted as wakeups."""
+        timer.timeout.connect(self.note_wakeup)
+        self.register(name, lambda: timer.start(interval), timer.stop, should_run)
+
+    def is_running(self, name: str) -> bool:
+        """Return whether a registered activity is currently running."""
+        activity = self._activities.get(name)
+        return bool(activity and activity[3])
+
+    def _apply(self):
+        """Start or stop activities whose desired state changed."""
+        for activity in list(self._activities.values()):
+            start, stop, should_run, running = activity
+            wanted = bool(should_run(self))
+            if wanted != running:
+                # Update first so a start/stop callback can re-enter safely
+                activity[3] = wanted
+                if wanted:
+                    start()
+                else:
+                    stop()
+
+    def refresh(self):
+        """Re-evaluate activities after a condition outside this manager changed."""
+        self._apply()
+
+    @property
+    def active(self) -> bool:
+        """True when the user session is usable (unlocked, display on)."""
+        return not self.session_locked and not self.display_off
+
+    # --- State inputs ---
+    def _set(self, attr: str, value: bool):
+        if getattr(self, attr) != value:
+            setattr(self, attr, value)
+            self._apply()
+            self.state_changed.emit()
+
+    def set_session_locked(self, locked: bool):
+        self._set("session_locked", locked)
+
+    def set_display_off(self, off: bool):
+        self._set("display_off", off)
+
+    def set_device_present(self, present: bool):
+        self._set("device_present", present)
+
+    def watch_visibility(self, widget):
+        """Track Show/Hide of a window for the windows_visible flag."""
+        self._visible_widgets[widget] = widget.isVisible()
+        widget.installEventFilter(self)
+        self._update_visibility()
+
+    def is_visible(self, widget) -> bool:
+        """Visibility of a watched window as last seen by the event filter."""
+        return self._visible_widgets.get(widget, False)
+
+    def _update_visibility(self):
+        visible = any(self._visible_widgets.values())
+        if visible == self.windows_visible:
+            # Flag unchanged, but a specific window may have changed
+            self._apply()
+        self._set("windows_visible", visible)
+
+    def eventFilter(self, obj, event):
+        if obj in self._visible_widgets and event.type() in (
+            QEvent.Type.Show,
+            QEvent.Type.Hide,
+        ):
+            self._visible_widgets[obj] = event.type() == QEvent.Type.Show
+            self._update_visibility()
+        return False
+
+    # --- Wakeup metric ---
+    def note_wakeup(self):
+        """Record one periodic wakeup (timer tick, monitor poll)."""
+        self._wakeups.append(time.monotonic())
+
+    def wakeups_per_minute(self) -> float:
+        """Wakeups over the last minute."""
+        cutoff = time.monotonic() - self.WAKEUP_WINDOW
+        while self._wakeups and self._wakeups[0] < cutoff:
+            self._wakeups.popleft()
+        return len(self._wakeups) * 60.0 / self.WAKEUP_WINDOW
+
+    def snapshot(self) -> Dict[str, object]:
+        """Current flags, running activities and wakeup rate."""
+        return {
+            "session_locked": self.session_locked,
+            "display_off": self.display_off,
+            "device_present": self.device_present,
+            "windows_visible": self.windows_visible,
+            "running": sorted(n for n, a in self._activities.items() if a[3]),
+            "wakeups_per_minute": self.wakeups_per_minute(),
+        }
+
+    # --- Windows notifications ---
+    def install(self, app, hwnd: int):
+        """Register for session, display and device notifications (Windows only)."""
+        if sys.platform != "win32":
+            return
+
+        try:
+            self._native_filter = _NativeEventFilter(self)
+            app.installNativeEventFilter(self._native_filter)
+
+            wtsapi32 = ctypes.windll.wtsapi32
+            wtsapi32.WTSRegisterSessionNotification(
+                wintypes.HWND(hwnd), NOTIFY_FOR_THIS_SESSION
+            )
+
+            user32 = ctypes.windll.user32
+            user32.RegisterPowerSettingNotification.restype = wintypes.HANDLE
+            self._power_notify_handle = user32.RegisterPowerSettingNotification(
+                wintypes.HANDLE(hwnd),
+                ctypes.byref(GUID_CONSOLE_DISPLAY_STATE),
+                DEVICE_NOTIFY_WINDOW_HANDLE,
+            )
+
+            # Top-level windows receive DBT_DEVNODES_CHANGED without registration
+            self._set("device_notifications", True)
+        except Exception as e:
+            print(f"Power notifications unavailable: {e}")
+
+    def uninstall(self, app, hwnd: int):
+        """Unregister Windows notifications."""
+        if self._native_filter is None:
+            return
+        app.removeNativeEventFilter(self._native_filter)
+        self._native_filter = None
+        try:
+            ctypes.windll.wtsapi32.WTSUnRegisterSessionNotification(wintypes.HWND(hwnd))
+            if self._power_notify_handle:
+                ctypes.windll.user32.UnregisterPowerSettingNotification(
+                    wintypes.HANDLE(self._power_notify_handle)
+                )
+        except Exception:
+            pass
+
+    def _on_native_message(self, message: int, wparam: int, lparam: int):
+        """Handle a Windows message forwarded by the native event filter."""
+        if message == WM_WTSSESSION_CHANGE:
+            if wparam == WTS_SESSION_LOCK:
+                self.set_session_locked(True)
+            elif wparam == WTS_SESSION_UNLOCK:
+                self.set_session_locked(False)
+        elif message == WM_POWERBROADCAST:
+            if wparam == PBT_POWERSETTINGCHANGE and lparam:
+                setting = POWERBROADCAST_SETTING.from_address(lparam)
+                # 0 = off, 1 = on, 2 = dimmed
+                self.set_display_off(setting.Data[0] == 0)
+            elif wparam == PBT_APMSUSPEND:
+                self.set_display_off(True)
+            elif wparam == PBT_APMRESUMEAUTOMATIC:
+                self.set_display_off(False)
+        elif message == WM_DEVICECHANGE:
+            if wparam in (DBT_DEVNODES_CHANGED, DBT_DEVICEARRIVAL, DBT_DEVICEREMOVECOMPLETE):
+                # Notifications arrive in bursts; coalesce them
+                self._device_change_timer.start(500)
@@ -0,0 +1,73 @@
+"""Pre-resolved per-application layer profiles.
+
+In profile mode the layers of the most used applications are resolved ahead
+of time and loaded into the pad's profile slots (0xFC 0x08). A focus change
+to one of them is then a single 0xFC 0x09 [slot] report: the firmware
+switches layer without acknowledging it, and the overlay draws the keymap
+prefetched for that layer.
+"""
+
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional
+
+# Profile slots of the firmware (NEXAHUB_PROFILE_SLOTS in keymap.c)
+MAX_PROFILE_SLOTS = 16
+
+
+class AppUsage:
+    """Counts how often each application gained focus."""
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+
+    def record(self, process_name: str):
+        self.counts[process_name] += 1
+
+    def top(self, n: int, fill: Iterable[str] = ()) -> List[str]:
+        """The ``n`` most focused applications, padded from ``fill``."""
+        apps = [name for name, _ in self.counts.most_common(n)]
+        for name in fill:
+            if len(apps) >= n:
+                break
+            if name not in apps:
+                apps.append(name)
+        return apps
+
+
+class ProfileTable:
+    """Application -> profile slot of one pad, and the layer of each slot."""
+
+    def __init__(self, slots: Dict[str, int], layers: List[int]):
+        self.slots = slots
+        self.layers = layers
+
+    @classmethod
+    def build(
+        cls, apps: Iterable[str], resolve: Callable[[str], Optional[int]]
+    ) -> "ProfileTable":
+        """Resolve each application's layer; unresolvable ones are left out."""
+        slots: Dict[str, int] = {}
+        layers: List[int] = []
+        for app in apps:
+            if len(layers) >= MAX_PROFILE_SLOTS:
+                break
+            layer = resolve(app)
+            if layer is None:
+                continue
+            slots[app] = len(layers)
+            layers.append(layer)
+        return cls(slots, layers)
+
+    def lookup(self, process_name: str) -> Optional[int]:
+        """Slot of an application, or None when it is not profiled."""
+        return self.slots.get(process_name)
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, ProfileTable)
+            and self.slots == other.slots
+            and self.layers == other.layers
+        )
+
+    def __repr__(self):
+        return f"ProfileTable({len(self.layers)} slots)"
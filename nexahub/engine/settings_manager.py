@@ -1,16 +1,22 @@
 import json
 import os
 import sys
-import winreg
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+
+from engine.window_filter import DEFAULT_IGNORE_WINDOWS
+
+if sys.platform == "win32":
+    import winreg
+else:  # Headless runs (benchmarks) on non-Windows hosts
+    winreg = None
 
 
 class SettingsManager:
     """Manages application settings persistence."""
 
-    def __init__(self):
-        self.config_dir = Path.home() / ".nexahub"
+    def __init__(self, config_dir: Optional[Path] = None):
+        self.config_dir = Path(config_dir) if config_dir else Path.home() / ".nexahub"
         self.config_file = self.config_dir / "config.json"
         self.config: Dict[str, Any] = {}
         self._load_default_config()
@@ -29,6 +35,14 @@ class SettingsManager:
             "show_overlay": True,
             "auto_switch_layer": True,
             "click_through_mode": False,
+            "async_core": False,
+            "profile_mode": False,
+            "profile_size": 8,
+            "layout_file": None,
+            "key_analytics": False,
+            "macros": [],
+            "title_rules": ["unsaved", "counters"],
+            "ignore_windows": list(DEFAULT_IGNORE_WINDOWS),
             "layer_mappings": [],
         }
 
@@ -59,20 +73,27 @@ class SettingsManager:
     def get_layer_mappings(self) -> List[Dict[str, Any]]:
         """Get layer mappings sorted by priority (specific first)."""
         mappings = self.config.get("layer_mappings", [])
-        # Sort: window_title present first, then by layer number
+        # Sort: window_title present first, then device-specific, then by layer
         return sorted(
-            mappings, key=lambda x: (x.get("window_title") is None, x.get("layer", 0))
+            mappings,
+            key=lambda x: (
+                x.get("window_title") is None,
+                not x.get("device"),
+                x.get("layer", 0),
+            ),
         )
 
     def add_layer_mapping(
-        self, layer: int, process_name: str, window_title: str = None
+        self, layer: int, process_name: str, window_title: str = None, device: str = None
     ):
-        """Add a new layer mapping."""
+        """Add a new layer mapping (device: pad key, None for every pad)."""
         mapping = {
             "layer": layer,
             "process_name": process_name,
             "window_title": window_title,
         }
+        if device:
+            mapping["device"] = device
         self.config["layer_mappings"].append(mapping)
 
     def remove_layer_mapping(self, index: int):
@@ -85,6 +106,8 @@ class SettingsManager:
         # Only run if frozen (compiled app) to avoid registering python interpreter during dev
         if not getattr(sys, "frozen", False) and "__compiled__" not in globals():
             return
+        if winreg is None:
+            return
 
         key_path = r"Software\Microsoft\Windows\CurrentVersion\Run"
         app_name = "NexaHub"
@@ -165,6 +188,76 @@ class SettingsManager:
     def click_through_mode(self, value: bool):
         self.config["click_through_mode"] = value
 
+    @property
+    def async_core(self) -> bool:
+        """Use the asyncio HID core (requires qasync; read at startup)."""
+        return self.config.get("async_core", False)
+
+    @async_core.setter
+    def async_core(self, value: bool):
+        self.config["async_core"] = value
+
+    @property
+    def profile_mode(self) -> bool:
+        return self.config.get("profile_mode", False)
+
+    @profile_mode.setter
+    def profile_mode(self, value: bool):
+        self.config["profile_mode"] = value
+
+    @property
+    def profile_size(self) -> int:
+        return self.config.get("profile_size", 8)
+
+    @profile_size.setter
+    def profile_size(self, value: int):
+        self.config["profile_size"] = value
+
+    @property
+    def layout_file(self) -> Optional[str]:
+        """vial.json or keyboard.json describing the pad layout (None = built-in)."""
+        return self.config.get("layout_file")
+
+    @layout_file.setter
+    def layout_file(self, value: Optional[str]):
+        self.config["layout_file"] = value
+
+    @property
+    def key_analytics(self) -> bool:
+        """Count key presses per layer, key and application (key_analytics.bin)."""
+        return self.config.get("key_analytics", False)
+
+    @key_analytics.setter
+    def key_analytics(self, value: bool):
+        self.config["key_analytics"] = value
+
+    @property
+    def macros(self) -> List[Dict[str, Any]]:
+        """Host actions bound to pad keys (see engine/macro_engine.py)."""
+        return self.config.get("macros", [])
+
+    @macros.setter
+    def macros(self, value: List[Dict[str, Any]]):
+        self.config["macros"] = value
+
+    @property
+    def title_rules(self) -> List[Any]:
+        """Strip rules applied to window titles (see engine/title_normalizer.py)."""
+        return self.config.get("title_rules", ["unsaved", "counters"])
+
+    @title_rules.setter
+    def title_rules(self, value: List[Any]):
+        self.config["title_rules"] = value
+
+    @property
+    def ignore_windows(self) -> List[Dict[str, Any]]:
+        """Windows that never count as focus changes (see engine/window_filter.py)."""
+        return self.config.get("ignore_windows", DEFAULT_IGNORE_WINDOWS)
+
+    @ignore_windows.setter
+    def ignore_windows(self, value: List[Dict[str, Any]]):
+        self.config["ignore_windows"] = value
+
     def export_config(self, file_path: str):
         """Export configuration to a file."""
         with open(file_path, "w") as f:
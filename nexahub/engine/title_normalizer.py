@@ -0,0 +1,88 @@
+"""Normalized window titles, so noisy titles match and compare stably.
+
+A title is split into segments at " - " (also en/em dashes and " | "),
+the strip rules are applied, and the remaining segments are joined with
+" - " again. Rules (settings "title_rules"):
+
+    "unsaved"   unsaved-changes markers: "● main.py", "*Untitled", "main.py •"
+    "counters"  notification counts: "(3) Inbox", "Inbox [12]"
+    "document"  the first segment when there are several, which is the
+                document or page in "main.py - project - Visual Studio Code"
+    {"pattern": regex, "replace": ""}
+                substitution on the raw title, before the other rules
+
+Normalized titles are interned and cached by raw title, so a repeated title
+costs one dictionary lookup and equal keys compare by identity.
+"""
+
+import re
+import sys
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+DEFAULT_RULES = ["unsaved", "counters"]
+BUILTIN_RULES = {"unsaved", "counters", "document"}
+
+# Raw titles cached; the cache is dropped when it grows past this
+CACHE_SIZE = 1024
+
+SEPARATOR = re.compile(r"\s+[-–—|]\s+")
+UNSAVED = re.compile(r"^[●•*]\s*|\s*[●•*]$")
+COUNTER = re.compile(r"^[(\[]\d+\+?[)\]]\s*|\s*[(\[]\d+\+?[)\]]$")
+
+Rule = Union[str, Dict[str, Any]]
+
+_MISSING = object()
+
+
+class TitleNormalizer:
+    """Maps raw window titles to interned keys according to strip rules."""
+
+    def __init__(self, rules: Optional[Sequence[Rule]] = None):
+        rules = DEFAULT_RULES if rules is None else rules
+        self.rules = set()
+        # (compiled pattern, replacement) of the custom rules
+        self.substitutions: List[Tuple[re.Pattern, str]] = []
+        for rule in rules:
+            if isinstance(rule, str) and rule in BUILTIN_RULES:
+                self.rules.add(rule)
+            elif isinstance(rule, dict) and rule.get("pattern"):
+                try:
+                    pattern = re.compile(rule["pattern"])
+                except re.error as e:
+                    print(f"Ignoring invalid title rule {rule}: {e}")
+                    continue
+                self.substitutions.append((pattern, str(rule.get("replace", ""))))
+            else:
+                print(f"Ignoring unknown title rule {rule!r}")
+        self._cache: Dict[str, Optional[str]] = {}
+
+    def normalize(self, title: Optional[str]) -> Optional[str]:
+        """Normalized key of a title; None for no title or nothing left."""
+        if not title:
+            return None
+        key = self._cache.get(title, _MISSING)
+        if key is not _MISSING:
+            return key
+        tokens = self.tokenize(title)
+        key = sys.intern(" - ".join(tokens)) if tokens else None
+        if len(self._cache) >= CACHE_SIZE:
+            self._cache.clear()
+        self._cache[title] = key
+        return key
+
+    def tokenize(self, title: str) -> List[str]:
+        """Title segments left after applying the rules."""
+        for pattern, replacement in self.substitutions:
+            title = pattern.sub(replacement, title)
+        tokens = []
+        for token in SEPARATOR.split(title.strip()):
+            if "unsaved" in self.rules:
+                token = UNSAVED.sub("", token)
+            if "counters" in self.rules:
+                token = COUNTER.sub("", token)
+            token = token.strip()
+            if token:
+                tokens.append(token)
+        if "document" in self.rules and len(tokens) > 1:
+            del tokens[0]
+        return tokens
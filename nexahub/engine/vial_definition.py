@@ -0,0 +1,84 @@
+"""Vial keyboard definition: streaming decompression and per-keyboard cache.
+
+Vial firmware embeds its vial.json LZMA-compressed. The host asks for the
+keyboard ID (UID from VIAL_KEYBOARD_UID in config.h) and the compressed
+size, then reads the payload in 32-byte blocks. Decompressed definitions
+are cached per UID and compressed size, so a known pad costs two reports
+instead of one per block.
+"""
+
+import lzma
+import threading
+from pathlib import Path
+from typing import Iterable, Optional
+
+# Larger sizes are treated as garbage (no real definition comes close)
+MAX_DEFINITION_SIZE = 64 * 1024
+
+
+class DefinitionDecoder:
+    """Decompresses definition blocks as they arrive."""
+
+    def __init__(self, size: int):
+        self.remaining = size
+        self._decompressor = lzma.LZMADecompressor()
+        self._parts = []
+
+    def feed(self, block: bytes):
+        """Add the next block; bytes past the compressed size are ignored."""
+        block = block[: self.remaining]
+        self.remaining -= len(block)
+        if block:
+            self._parts.append(self._decompressor.decompress(block))
+
+    @property
+    def done(self) -> bool:
+        return self.remaining <= 0
+
+    def result(self) -> bytes:
+        """The decompressed definition (raises lzma.LZMAError if truncated)."""
+        if not self._decompressor.eof:
+            raise lzma.LZMAError("definition stream ended early")
+        return b"".join(self._parts)
+
+
+def decompress_definition(blocks: Iterable[bytes], size: int) -> bytes:
+    """Decompress a definition from its blocks in order."""
+    decoder = DefinitionDecoder(size)
+    for block in blocks:
+        decoder.feed(block)
+        if decoder.done:
+            break
+    return decoder.result()
+
+
+class DefinitionCache:
+    """Decompressed definitions on disk, one file per keyboard UID."""
+
+    def __init__(self, cache_dir: Optional[Path] = None):
+        self.cache_dir = Path(cache_dir) if cache_dir else Path.home() / ".nexahub" / "definitions"
+        self._lock = threading.Lock()
+
+    def _path(self, uid: str, size: int) -> Path:
+        return self.cache_dir / f"{uid}-{size}.json"
+
+    def get(self, uid: str, size: int) -> Optional[bytes]:
+        """Cached definition of a keyboard, if its compressed size still matches."""
+        try:
+            return self._path(uid, size).read_bytes()
+        except OSError:
+            return None
+
+    def put(self, uid: str, size: int, definition: bytes):
+        """Store a definition, replacing older ones of the same keyboard."""
+        with self._lock:
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                for old in self.cache_dir.glob(f"{uid}-*.json"):
+                    old.unlink()
+                path = self._path(uid, size)
+                tmp_path = path.with_suffix(".tmp")
+                tmp_path.write_bytes(definition)
+                tmp_path.replace(path)
+            except OSError as e:
+                print(f"Could not cache keyboard definition: {e}")
@@ -0,0 +1,90 @@
+"""Foreground windows that do not count as focus changes.
+
+Transient shell windows (task switcher, notification toasts, IME popups,
+the taskbar) briefly take the foreground. Matching them would flip the pad
+to the default layer and back; ignoring them keeps the current layer.
+
+Rules (settings "ignore_windows") match one field exactly, or by prefix
+when the value ends with "*":
+
+    {"class": "MultitaskingViewFrame"}   window class
+    {"class": "IME*"}                    window class prefix
+    {"process": "SearchHost.exe"}        process name (case-insensitive)
+    {"title": "Task Switching"}          raw window title
+
+Window classes are checked first: reading the class of the foreground
+window is far cheaper than the process lookup it then avoids.
+"""
+
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+DEFAULT_IGNORE_WINDOWS = [
+    {"class": "MultitaskingViewFrame"},  # Alt+Tab (Windows 10)
+    {"class": "XamlExplorerHostIslandWindow"},  # Alt+Tab, Task View (Windows 11)
+    {"class": "TaskSwitcherWnd"},
+    {"class": "ForegroundStaging"},
+    {"class": "Shell_TrayWnd"},  # Taskbar
+    {"class": "Shell_SecondaryTrayWnd"},
+    {"class": "NotifyIconOverflowWindow"},
+    {"class": "IME*"},
+    {"class": "MSCTFIME*"},
+    {"process": "ShellExperienceHost.exe"},  # Notifications, action center
+    {"process": "StartMenuExperienceHost.exe"},
+    {"process": "SearchHost.exe"},
+    {"process": "SearchApp.exe"},
+]
+
+FIELDS = ("class", "process", "title")
+
+
+class _Matcher:
+    """Exact values and prefixes of one field."""
+
+    __slots__ = ("exact", "prefixes")
+
+    def __init__(self):
+        self.exact = set()
+        self.prefixes: Tuple[str, ...] = ()
+
+    def add(self, value: str):
+        if value.endswith("*"):
+            self.prefixes += (value[:-1],)
+        else:
+            self.exact.add(value)
+
+    def __bool__(self) -> bool:
+        return bool(self.exact or self.prefixes)
+
+    def matches(self, value: Optional[str]) -> bool:
+        if not value:
+            return False
+        # str.startswith takes a tuple: one call for every prefix
+        return value in self.exact or (bool(self.prefixes) and value.startswith(self.prefixes))
+
+
+class WindowFilter:
+    """Ignore-list of foreground windows, compiled from settings rules."""
+
+    def __init__(self, rules: Optional[Sequence[Dict[str, Any]]] = None):
+        rules = DEFAULT_IGNORE_WINDOWS if rules is None else rules
+        self._matchers: Dict[str, _Matcher] = {field: _Matcher() for field in FIELDS}
+        for rule in rules:
+            fields = [field for field in FIELDS if isinstance(rule, dict) and rule.get(field)]
+            if len(fields) != 1:
+                print(f"Ignoring invalid window filter rule {rule!r}")
+                continue
+            value = str(rule[fields[0]])
+            # Process names are compared case-insensitively, like Windows does
+            self._matchers[fields[0]].add(value.lower() if fields[0] == "process" else value)
+        self.classes = self._matchers["class"]
+        self.processes = self._matchers["process"]
+        self.titles = self._matchers["title"]
+
+    def ignores_class(self, class_name: Optional[str]) -> bool:
+        return self.classes.matches(class_name)
+
+    def ignores(self, process_name: Optional[str], window_title: Optional[str]) -> bool:
+        """Whether a window is ignored by its process name or title."""
+        return self.titles.matches(window_title) or (
+            bool(self.processes) and self.processes.matches(process_name and process_name.lower())
+        )
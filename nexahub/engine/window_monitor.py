@@ -1,92 +1,132 @@
-import time
+import os
 import threading
 from typing import Optional, Callable
-import pygetwindow as gw
-import psutil
+
+from engine.latency_tracer import tracer
+from engine.foreground_state import ForegroundState
+from engine.title_normalizer import TitleNormalizer
+from engine.window_filter import WindowFilter
+from engine.window_tree import WindowResolver, default_window_tree
+
+# Returned by a window source for a window on the ignore-list: unlike None
+# (no window), it is counted, and like it, it publishes nothing
+IGNORED = ("", None)
 
 
 class WindowMonitor:
-    """Monitors active window changes and triggers callbacks."""
+    """Monitors active window changes and publishes them to a ForegroundState.
+
+    Titles are published normalized, so a title that changes without
+    changing its normalized key (an unsaved marker, a message count) is not
+    a window change. Windows on the ignore-list are not published at all:
+    the previous window stays current, so the pad keeps its layer.
+    """
     
-    def __init__(self, callback: Callable[[str, Optional[str]], None]):
-        self.callback = callback
+    def __init__(
+        self,
+        state: ForegroundState,
+        source: Optional[Callable[[], Optional[tuple]]] = None,
+        normalizer: Optional[TitleNormalizer] = None,
+        window_filter: Optional[WindowFilter] = None,
+        tree=None,
+    ):
+        self.state = state
+        # Desktop windows read by the default source (see engine/window_tree.py);
+        # a fake tree runs it headless
+        self.tree = tree if tree is not None else default_window_tree()
+        self.resolver = WindowResolver(self.tree)
+        # Foreground window source; replaceable for headless runs
+        self.source = source or self._get_active_window_info
+        # Replaced when the strip rules change
+        self.normalizer = normalizer or TitleNormalizer()
+        self.window_filter = window_filter or WindowFilter()
+        # Samples that found an ignored window
+        self.ignored = 0
         self.running = False
         self.monitor_thread: Optional[threading.Thread] = None
-        self.last_process: Optional[str] = None
-        self.last_title: Optional[str] = None
         self.poll_interval = 0.5  # Check every 500ms
+        # Wakes the loop immediately on stop() instead of waiting out a poll
+        self._stop_event = threading.Event()
+        # Optional hook called once per poll (idle wakeup accounting)
+        self.wakeup_callback: Optional[Callable[[], None]] = None
     
     def start(self):
         """Start monitoring window changes."""
         if not self.running:
             self.running = True
+            self._stop_event.clear()
             self.monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
             self.monitor_thread.start()
     
     def stop(self):
         """Stop monitoring window changes."""
         self.running = False
+        self._stop_event.set()
         if self.monitor_thread:
             self.monitor_thread.join(timeout=1.0)
     
     def _monitor_loop(self):
         """Main monitoring loop."""
         while self.running:
-            try:
-                active_window = self._get_active_window_info()
-                if active_window:
-                    process_name, window_title = active_window
-                    
-                    # Only trigger callback if window changed
-                    if (process_name != self.last_process or 
-                        window_title != self.last_title):
-                        self.last_process = process_name
-                        self.last_title = window_title
-                        self.callback(process_name, window_title)
-                        
-            except Exception:
-                pass
-            
-            time.sleep(self.poll_interval)
+            if self.wakeup_callback:
+                self.wakeup_callback()
+            self.poll()
+            self._stop_event.wait(self.poll_interval)
+    
+    def poll(self):
+        """Sample the foreground window and publish it if it changed."""
+        try:
+            active_window = self.source()
+            if active_window is IGNORED or (
+                active_window and self.window_filter.ignores(*active_window)
+            ):
+                self.ignored += 1
+            elif active_window:
+                process_name, raw_title = active_window
+                window_title = self.normalizer.normalize(raw_title)
+                
+                # Only publish (and notify subscribers) if window changed
+                if not self.state.is_current(process_name, window_title):
+                    if tracer.enabled:
+                        tracer.mark(tracer.STAGE_FOCUS)
+                    self.state.publish(process_name, window_title, raw_title)
+
+        except Exception:
+            pass
     
     def _get_active_window_info(self) -> Optional[tuple]:
         """Get the currently active window's process name and title."""
+        tree = self.tree
+        if tree is None:
+            return None
+
         try:
-            # Get active window
-            active_window = gw.getActiveWindow()
-            if not active_window:
+            hwnd = tree.foreground()
+            if not hwnd:
                 return None
             
-            window_title = active_window.title
-            
-            # Get process name from window handle
-            import ctypes
-            from ctypes import wintypes
-            
-            user32 = ctypes.windll.user32
-            kernel32 = ctypes.windll.kernel32
-            
-            # Get window thread process ID
-            pid = wintypes.DWORD()
-            user32.GetWindowThreadProcessId(active_window._hWnd, ctypes.byref(pid))
+            # Window class first: ignored windows never reach the process lookup
+            if self.window_filter.classes and self.window_filter.ignores_class(
+                tree.class_name(hwnd)
+            ):
+                return IGNORED
             
             # Ignore our own process to avoid feedback loops
-            import os
-            if pid.value == os.getpid():
+            pid = tree.process_id(hwnd)
+            if pid == os.getpid():
                 return None
             
-            # Get process name
-            try:
-                process = psutil.Process(pid.value)
-                process_name = process.name()
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
+            # The application behind the window, cached per window
+            process_name = self.resolver.process_name(hwnd, pid)
+            if process_name is None:
                 return None
             
+            window_title = tree.title(hwnd)
             return (process_name, window_title if window_title else None)
             
         except Exception:
             return None
     
     def get_current_window(self) -> Optional[tuple]:
-        """Get current window info without monitoring."""
-        return self._get_active_window_info()
+        """Get the last foreground window seen by the monitor (no Win32 query)."""
+        return self.state.current()
@@ -0,0 +1,132 @@
+"""Foreground window lookups and the application behind a window.
+
+WindowMonitor reads the desktop through a window tree with this interface
+(Win32WindowTree on Windows; engine/fake_windows.py has an in-memory
+one that runs anywhere):
+
+    foreground() -> int               foreground window handle, 0 for none
+    class_name(hwnd) -> str
+    title(hwnd) -> str
+    process_id(hwnd) -> int
+    children(hwnd) -> List[int]       all descendant windows
+    process_name(pid) -> str | None
+
+UWP applications run inside a frame window owned by ApplicationFrameHost.exe;
+the application's own process owns a child window of that frame. The
+resolver walks to it, and caches the result per top-level window so the
+walk (and the process lookup) happens once per window, not on every sample.
+"""
+
+import sys
+from typing import Dict, List, Optional, Tuple
+
+import psutil
+
+# Processes whose top-level windows host another process's window
+HOST_PROCESSES = {"applicationframehost.exe"}
+
+if sys.platform == "win32":
+    import ctypes
+    from ctypes import wintypes
+
+    _user32 = ctypes.windll.user32
+    _user32.GetForegroundWindow.restype = wintypes.HWND
+    _user32.GetClassNameW.argtypes = [wintypes.HWND, wintypes.LPWSTR, ctypes.c_int]
+    _user32.GetWindowTextLengthW.argtypes = [wintypes.HWND]
+    _user32.GetWindowTextW.argtypes = [wintypes.HWND, wintypes.LPWSTR, ctypes.c_int]
+    _user32.GetWindowThreadProcessId.argtypes = [wintypes.HWND, ctypes.POINTER(wintypes.DWORD)]
+    WNDENUMPROC = ctypes.WINFUNCTYPE(wintypes.BOOL, wintypes.HWND, wintypes.LPARAM)
+    _user32.EnumChildWindows.argtypes = [wintypes.HWND, WNDENUMPROC, wintypes.LPARAM]
+else:
+    _user32 = None
+
+
+class Win32WindowTree:
+    """Window tree of the Windows desktop (user32 and psutil)."""
+
+    def foreground(self) -> int:
+        return _user32.GetForegroundWindow() or 0
+
+    def class_name(self, hwnd: int) -> str:
+        buffer = ctypes.create_unicode_buffer(256)
+        _user32.GetClassNameW(hwnd, buffer, 256)
+        return buffer.value
+
+    def title(self, hwnd: int) -> str:
+        length = _user32.GetWindowTextLengthW(hwnd)
+        if length <= 0:
+            return ""
+        buffer = ctypes.create_unicode_buffer(length + 1)
+        _user32.GetWindowTextW(hwnd, buffer, length + 1)
+        return buffer.value
+
+    def process_id(self, hwnd: int) -> int:
+        pid = wintypes.DWORD()
+        _user32.GetWindowThreadProcessId(hwnd, ctypes.byref(pid))
+        return pid.value
+
+    def children(self, hwnd: int) -> List[int]:
+        found = []
+
+        def collect(child, _):
+            found.append(child)
+            return True
+
+        _user32.EnumChildWindows(hwnd, WNDENUMPROC(collect), 0)
+        return found
+
+    def process_name(self, pid: int) -> Optional[str]:
+        try:
+            return psutil.Process(pid).name()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return None
+
+
+def default_window_tree() -> Optional[Win32WindowTree]:
+    """The desktop's window tree, None where there is no Win32."""
+    return Win32WindowTree() if _user32 is not None else None
+
+
+class WindowResolver:
+    """Process names of top-level windows, resolved through host frames and cached."""
+
+    CACHE_SIZE = 256
+
+    def __init__(self, tree):
+        self.tree = tree
+        # hwnd -> (pid owning the window, process name of the application)
+        self._cache: Dict[int, Tuple[int, str]] = {}
+
+    def process_name(self, hwnd: int, pid: int) -> Optional[str]:
+        """Application behind a top-level window owned by ``pid``.
+
+        The owner is part of the cache key: a handle reused by another
+        process after its window closed resolves again.
+        """
+        entry = self._cache.get(hwnd)
+        if entry is not None and entry[0] == pid:
+            return entry[1]
+
+        name = self.tree.process_name(pid)
+        if name is None:
+            return None
+        if name.lower() in HOST_PROCESSES:
+            hosted = self._hosted_process(hwnd, pid)
+            if hosted is None:
+                # The application has not attached its window yet (still
+                # starting): report the host and resolve again next time
+                return name
+            name = hosted
+
+        if len(self._cache) >= self.CACHE_SIZE:
+            self._cache.clear()
+        self._cache[hwnd] = (pid, name)
+        return name
+
+    def _hosted_process(self, hwnd: int, host_pid: int) -> Optional[str]:
+        """Process owning a child window of a host frame, if any."""
+        for child in self.tree.children(hwnd):
+            pid = self.tree.process_id(child)
+            if pid and pid != host_pid:
+                return self.tree.process_name(pid)
+        return None
@@ -1,6 +1,9 @@
 import sys
 import os
-from typing import Optional
+import asyncio
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
 
 from PySide6.QtWidgets import QApplication
 from PySide6.QtGui import QIcon
@@ -11,26 +14,73 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from engine.settings_manager import SettingsManager
 from engine.hid_manager import HIDManager
+from engine.device_pool import DevicePool, PadState
+from engine.capabilities import CapabilityCache
+from engine.vial_definition import DefinitionCache
+from engine.keymap_snapshot import SnapshotStore
+from engine.profiles import AppUsage, ProfileTable
+from engine.focus_predictor import FocusPredictor
+from engine.key_analytics import KeyAnalytics
+from engine.macro_engine import MacroEngine
 from engine.window_monitor import WindowMonitor
+from engine.title_normalizer import TitleNormalizer
+from engine.window_filter import WindowFilter
+from engine.foreground_state import ForegroundState
+from engine.latency_tracer import tracer
+from engine.power_manager import PowerStateManager
+from engine.async_hid import AsyncHIDClient, install_event_loop, focus_changes
+from engine.hid_protocol import (
+    strip_report_id,
+    decode_events,
+    LAYER_EVENT,
+    KEY_EVENT,
+    EVENT_MASK_LAYER,
+    EVENT_MASK_KEY,
+)
 from ui.main_window import MainWindow
 from ui.tray_icon import TrayIcon
 from ui.overlay_window import OverlayWindow
+from ui.diagnostics_window import DiagnosticsWindow
+from utils.layout_loader import BUILTIN_LAYOUT, KeyboardLayout, LayoutLoader, grid_layout
+from utils.qmk_keycodes import keycode_namespace
 
 
 class HIDSignalBridge(QObject):
     """Bridge to handle HID events in the GUI thread."""
 
-    layer_event = Signal(int)
-    keymap_event = Signal(list, object)  # keycodes, encoder_keycodes (tuple)
-    key_press_event = Signal(int, int, bool)  # row, col, pressed
+    # All HID events carry the key of the pad they came from
+    layer_event = Signal(str, int)
+    keymap_event = Signal(str, list, object)  # keycodes, encoder_keycodes (tuple)
+    key_press_event = Signal(str, int, int, bool)  # row, col, pressed
     window_event = Signal(str, object)
 
 
 class NexaHubApp:
     """Main application controller."""
 
-    def __init__(self):
-        self.app = QApplication(sys.argv)
+    # Without Windows device notifications, look for additional pads every
+    # N reconnect ticks while at least one pad is connected
+    RESCAN_TICKS = 15
+
+    # Keymap prefetch for the likely next applications: wait this long after
+    # a focus change, then read once the HID link has been idle for a while
+    PREFETCH_DELAY_MS = 300
+    PREFETCH_IDLE_GAP = 0.1  # seconds
+    PREFETCH_RETRIES = 5
+    PREDICTED_APPS = 2
+    # Cached keymaps younger than this are shown without re-reading them
+    KEYMAP_MAX_AGE = 10.0  # seconds
+    HISTORY_SAVE_INTERVAL = 300.0  # seconds
+    # Key usage counts are appended to disk this often while recording
+    ANALYTICS_FLUSH_MS = 60000
+
+    def __init__(
+        self,
+        settings: Optional[SettingsManager] = None,
+        pool: Optional[DevicePool] = None,
+        window_source=None,
+    ):
+        self.app = QApplication.instance() or QApplication(sys.argv)
         self.app.setQuitOnLastWindowClosed(False)
 
         # Set application icon
@@ -41,23 +91,80 @@ class NexaHubApp:
             self.app.setWindowIcon(QIcon(icon_path))
 
         # Initialize components
-        self.settings = SettingsManager()
-        self.hid = HIDManager()
+        # Settings, device pool and window source can be injected for
+        # headless runs (see benchmarks/run_benchmarks.py)
+        self.settings = settings or SettingsManager()
+        self.pool = pool or DevicePool(
+            capability_cache=CapabilityCache(self.settings.config_dir / "capabilities.json"),
+            definition_cache=DefinitionCache(self.settings.config_dir / "definitions"),
+            snapshot_store=SnapshotStore(self.settings.config_dir / "snapshots"),
+        )
+
+        # Optional asyncio core, run inside the Qt event loop
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        if self.settings.async_core:
+            self.loop = install_event_loop(self.app)
+            if self.loop is None:
+                print("async_core is enabled but qasync is not installed; using threads")
+        self._async_clients: Dict[str, AsyncHIDClient] = {}
+        self._switch_tasks: Dict[str, asyncio.Task] = {}
+        self._keymap_task: Optional[asyncio.Task] = None
+        # Threaded core: the keymap read queued by the last poll
+        self._keymap_future: Optional[Future] = None
+        self._focus_task: Optional[asyncio.Task] = None
         self.window_monitor: Optional[WindowMonitor] = None
+        self._window_source = window_source
+        # Published by WindowMonitor; the matcher and settings window subscribe
+        self.foreground = ForegroundState()
+        # Published titles and mapping titles are compared normalized
+        self.title_normalizer = TitleNormalizer(self.settings.title_rules)
+
+        # Pad geometry drawn by the overlay: the configured layout file or the
+        # built-in NexaPad layout; parsed tables are cached by file hash
+        self.layout_loader = LayoutLoader(self.settings.config_dir / "layouts")
+        self.layout = self._load_layout()
 
         # Initialize UI
-        self.main_window = MainWindow(self.settings, self.hid)
+        self.main_window = MainWindow(self.settings, self.pool)
         self.tray_icon = TrayIcon(self.settings)
         self.overlay_window = OverlayWindow()
+        self.overlay_window.set_layout(self.layout)
+        self.power = PowerStateManager()
+        # Host actions bound to pad keys, dispatched on the HID threads
+        self.macros = MacroEngine()
+        self.macros.configure(self.settings.macros)
+        self.diagnostics_window = DiagnosticsWindow(
+            self.pool, self.power, self.overlay_window, self.macros
+        )
 
         # Show overlay based on persistent setting and apply click-through mode
         if self.settings.show_overlay:
             self.overlay_window.show()
         self.overlay_window.set_click_through(self.settings.click_through_mode)
-
-        # Current state
-        self.current_layer: Optional[int] = None
-        self._cached_keycodes: Optional[list] = None
+        self._show_last_snapshot()
+
+        # Focus counts choose the applications given profile slots
+        self.app_usage = AppUsage()
+        self._profile_apps: Optional[List[str]] = None
+
+        # Focus transitions drive background keymap prefetch
+        self.predictor = FocusPredictor(self.settings.config_dir / "focus_history.bin")
+        self._history_saved_at = time.monotonic()
+        self._prefetch_timer = QTimer()
+        self._prefetch_timer.setSingleShot(True)
+        self._prefetch_timer.timeout.connect(self._prefetch_predicted)
+        self._prefetch_attempts = 0
+
+        # Key presses per layer, key and application (opt-in) and whether the
+        # overlay shows them as a heatmap
+        self.key_analytics = KeyAnalytics(self.settings.config_dir / "key_analytics.bin")
+        self._heatmap_shown = False
+        # Counts shown by the heatmap, bumped in place while typing
+        self._heat_counts: Optional[List[int]] = None
+
+        # Pad shown by the overlay: the one whose keys were pressed last
+        self.active_pad: Optional[str] = None
+        self._rescan_countdown = self.RESCAN_TICKS
 
         self._setup_connections()
         self._setup_timers()
@@ -66,12 +173,20 @@ class NexaHubApp:
         self.hid_bridge.layer_event.connect(self._on_layer_event)
         self.hid_bridge.keymap_event.connect(self._on_keymap_event)
         self.hid_bridge.key_press_event.connect(self._on_key_press_event)
-        self.hid_bridge.window_event.connect(self._on_window_changed)
+        self.hid_bridge.window_event.connect(self._update_window_info)
+        if self.loop is None:
+            self.hid_bridge.window_event.connect(self._on_window_changed)
+        else:
+            # Layer matching consumes focus changes as an async stream
+            self._focus_task = self.loop.create_task(self._consume_focus_changes())
+
+        # Forward foreground changes from the monitor thread to the GUI thread
+        self.foreground.subscribe(self.hid_bridge.window_event.emit)
 
         # Register HID callback
-        self.hid.register_callback(self._on_hid_data)
+        self.pool.register_callback(self._on_hid_data)
 
-        # Connect to device after setting up signals and callbacks
+        # Connect to devices after setting up signals and callbacks
         self._connect_to_device()
 
     def _setup_connections(self):
@@ -79,6 +194,9 @@ class NexaHubApp:
         # Tray icon signals
         self.tray_icon.show_window_requested.connect(self._show_main_window)
         self.tray_icon.quit_requested.connect(self._quit)
+        self.tray_icon.diagnostics_requested.connect(self._show_diagnostics_window)
+        self.tray_icon.key_analytics_toggle_requested.connect(self._on_tray_key_analytics_toggle)
+        self.tray_icon.heatmap_toggle_requested.connect(self._on_tray_heatmap_toggle)
         self.tray_icon.overlay_toggle_requested.connect(self._on_tray_overlay_toggle)
         self.tray_icon.click_through_toggle_requested.connect(
             self._on_tray_click_through_toggle
@@ -88,174 +206,587 @@ class NexaHubApp:
         self.main_window.settings_changed.connect(self._on_settings_changed)
         self.main_window.quit_requested.connect(self._quit)
 
+        # Power state: visibility of the windows that consume periodic work
+        self.power.watch_visibility(self.main_window)
+        self.power.watch_visibility(self.overlay_window)
+        self.power.devices_changed.connect(self._on_devices_changed)
+        self.power.install(self.app, int(self.main_window.winId()))
+
     def _setup_timers(self):
-        """Setup periodic timers."""
-        # Reconnection timer
+        """Setup periodic timers.
+
+        Timers are started and suspended by the power manager: nothing runs
+        while the session is locked or the display is off, and each timer
+        only runs while its consumer (device, window) is present.
+        """
+        # Reconnection timer. While the pad is absent and Windows device
+        # notifications are available, plug-in is detected by devices_changed.
         self.reconnect_timer = QTimer()
         self.reconnect_timer.timeout.connect(self._check_connection)
-        self.reconnect_timer.start(2000)  # Check connection every 2 seconds
-
-        # Window info update timer
-        self.window_info_timer = QTimer()
-        self.window_info_timer.timeout.connect(self._update_window_info)
-        self.window_info_timer.start(500)  # Update window info every 500ms
+        self.power.register_timer(
+            "reconnect",
+            self.reconnect_timer,
+            2000,  # Check connection every 2 seconds
+            lambda p: p.active and (p.device_present or not p.device_notifications),
+        )
 
-        # Keymap polling timer
+        # Keymap polling timer (only useful while the overlay is shown)
         self.keymap_poll_timer = QTimer()
         self.keymap_poll_timer.timeout.connect(self._poll_keymap)
-        self.keymap_poll_timer.start(2000)  # Poll every 2 seconds
-
-    def _check_connection(self):
-        """Check if device is still connected and update UI."""
-        was_connected = self.hid.connected
-
-        # Try to verify connection by sending a ping command
-        if self.hid.connected:
-            # Try to get current layer as a ping
-            if not self.hid.send_command(0x02):
-                # Command failed, device disconnected
-                self.hid.connected = False
-                self.hid.disconnect()
-                print("Device disconnected detected")
-
-        # If not connected, try to reconnect
-        if not self.hid.connected:
-            if was_connected:
-                # Was connected but now disconnected
-                self.main_window.update_connection_status(False, "Device disconnected")
-                self.tray_icon.show_notification("NexaHub", "Device disconnected")
-            # Try to connect
+        self.power.register_timer(
+            "keymap_poll",
+            self.keymap_poll_timer,
+            2000,  # Poll every 2 seconds
+            lambda p: p.active and p.device_present and p.is_visible(self.overlay_window),
+        )
+
+        # Key events light up keys in the overlay, trigger macros and feed
+        # key usage recording; otherwise the pads send layer events alone
+        self.pool.subscribe_events(EVENT_MASK_LAYER)
+        self.power.register(
+            "key_events",
+            lambda: self.pool.subscribe_events(EVENT_MASK_LAYER | EVENT_MASK_KEY),
+            lambda: self.pool.subscribe_events(EVENT_MASK_LAYER),
+            lambda p: p.active
+            and p.device_present
+            and (
+                p.is_visible(self.overlay_window)
+                or self.settings.key_analytics
+                or self.macros.active
+            ),
+        )
+
+        self.analytics_flush_timer = QTimer()
+        self.analytics_flush_timer.timeout.connect(self.key_analytics.flush)
+        self.power.register_timer(
+            "analytics_flush",
+            self.analytics_flush_timer,
+            self.ANALYTICS_FLUSH_MS,
+            lambda p: p.active and self.settings.key_analytics,
+        )
+
+        # Foreground window monitoring drives layer switching and the
+        # settings window's active-window label
+        self.power.register(
+            "window_monitor",
+            self._start_window_monitoring,
+            self._stop_window_monitoring,
+            lambda p: p.active and (p.device_present or p.is_visible(self.main_window)),
+        )
+
+    def _check_connection(self, rescan: bool = False):
+        """Check that the pads are still connected and look for new ones."""
+        # Ping every pad (get current layer) and drop the silent ones
+        for pad in self.pool.check():
+            print(f"Device disconnected detected: {pad.key}")
+            self.tray_icon.show_notification("NexaHub", f"{pad.name} disconnected")
+            if pad.key == self.active_pad:
+                self.active_pad = None
+            self.macros.remove(pad.key)
+            client = self._async_clients.pop(pad.key, None)
+            if client is not None:
+                client.close()
+
+        if not self.pool.pads:
+            rescan = True
+        elif not self.power.device_notifications:
+            # Plug-in of another pad is not reported; rescan now and then
+            self._rescan_countdown -= 1
+            if self._rescan_countdown <= 0:
+                rescan = True
+
+        if rescan:
+            self._rescan_countdown = self.RESCAN_TICKS
             self._connect_to_device()
+        else:
+            self._update_pads()
+
+    def _on_devices_changed(self):
+        """Windows reported a device arrival or removal."""
+        self._check_connection(rescan=True)
 
     def _connect_to_device(self):
-        """Attempt to connect to the QMK device."""
-        if not self.hid.connected:
-            if self.hid.find_device():
-                self.main_window.update_connection_status(True)
-                self.tray_icon.show_notification("NexaHub", "Connected to QMK keyboard")
-                self._start_window_monitoring()
-                self._apply_current_settings()
-                # Fetch initial layer immediately to update UI
-                self.hid.get_current_layer()
+        """Connect every QMK device that is not connected yet."""
+        timeout_option = self._timeout_to_option(self.settings.oled_timeout)
+        added = self.pool.discover()
+        for pad in added:
+            self.tray_icon.show_notification("NexaHub", f"Connected to {pad.name}")
+            self.pool.submit(pad.key, HIDManager.set_oled_timeout, timeout_option)
+            # Fetch initial layer; the answer replaces any snapshot on screen
+            future = self.pool.submit(pad.key, HIDManager.get_current_layer)
+            if future is not None:
+                future.add_done_callback(
+                    lambda future, key=pad.key: self._on_initial_layer(key, future)
+                )
+        # Position bindings work right away; the tables are rebuilt with the
+        # negotiated layers and keymaps when the first layer is reported
+        self._compile_macros(added)
+        if added and self.settings.profile_mode:
+            if self._profile_apps is None:
+                self._update_profiles()
             else:
-                # Pass error message to UI
-                error_msg = self.hid.last_error[:50] if self.hid.last_error else ""
-                self.main_window.update_connection_status(False, error_msg)
+                self._load_profiles(added)
+        self._update_pads()
+
+    def _update_pads(self):
+        """Reflect the set of connected pads in the UI and power state."""
+        pads = self.pool.pad_list()
+        # Starts or suspends window monitoring and keymap polling
+        self.power.set_device_present(bool(pads))
+        if pads:
+            self.main_window.update_connection_status(True, device_count=len(pads))
+        else:
+            # Pass error message to UI
+            error = self.pool.last_error
+            self.main_window.update_connection_status(False, error[:50] if error else "")
+        self.main_window.update_devices([pad.key for pad in pads])
+
+        if self.pool.get(self.active_pad) is None:
+            self.active_pad = None
+            if pads:
+                self._set_active_pad(pads[0].key)
+        self._update_overlay_title()
+
+    def _active_pad_state(self) -> Optional[PadState]:
+        return self.pool.get(self.active_pad)
+
+    def _set_active_pad(self, key: str):
+        """Show another pad's layer and keymap in the overlay."""
+        if key == self.active_pad or self.pool.get(key) is None:
+            return
+        self.active_pad = key
+        self._update_overlay_title()
+        if self.overlay_window.isVisible():
+            self._refresh_overlay()
+
+    def _update_overlay_title(self):
+        """Name the active pad in the overlay when more than one is connected."""
+        many = len(self.pool.pads) > 1
+        self.overlay_window.set_pad_name(self.active_pad if many else None)
+
+    def _load_layout(self) -> KeyboardLayout:
+        """Layout from settings.layout_file, falling back to the built-in one."""
+        if self.settings.layout_file:
+            layout = self.layout_loader.load(self.settings.layout_file)
+            if layout is not None:
+                return layout
+        return BUILTIN_LAYOUT
+
+    def _layout_for(self, pad: PadState) -> KeyboardLayout:
+        """Layout matching a pad's negotiated matrix."""
+        caps = pad.hid.capabilities
+        return self._match_layout(caps.rows, caps.cols, pad.hid.vial_definition, pad.name)
+
+    def _match_layout(
+        self, rows: int, cols: int, definition: Optional[bytes] = None, name: str = ""
+    ) -> KeyboardLayout:
+        """Layout for a rows x cols matrix.
+
+        Preference: configured layout file, the definition embedded in the
+        pad's Vial firmware, the built-in layout, then a plain grid.
+        """
+        layouts = [] if self.layout is BUILTIN_LAYOUT else [self.layout]
+        if definition is not None:
+            # Memoized by content hash in the loader
+            device_layout = self.layout_loader.load_bytes(definition, name)
+            if device_layout is not None:
+                layouts.append(device_layout)
+        layouts.append(BUILTIN_LAYOUT)
+
+        for layout in layouts:
+            if (layout.rows, layout.cols) == (rows, cols):
+                return layout
+        return grid_layout(rows, cols)
+
+    def _show_last_snapshot(self):
+        """Draw the last used pad's persisted keymap before any pad answers."""
+        store = self.pool.snapshot_store
+        entry = store.load_latest() if store is not None else None
+        if entry is None:
+            return
+        _, snapshot = entry
+        keymap = snapshot.keymaps.get(snapshot.layer)
+        if keymap is None:
+            return
+        self.overlay_window.set_layout(self._match_layout(snapshot.rows, snapshot.cols))
+        self.overlay_window.update_layer(snapshot.layer)
+        self.overlay_window.update_keymap(*keymap)
 
-    def _update_window_info(self):
-        """Update the current window info display."""
-        if self.window_monitor:
-            window_info = self.window_monitor.get_current_window()
-            if window_info:
-                process_name, window_title = window_info
-                self.main_window.update_window_info(process_name, window_title)
+    def _on_initial_layer(self, key: str, future):
+        """Layer read after connecting (pad worker thread)."""
+        if future.cancelled() or future.exception() is not None:
+            return
+        layer = future.result()
+        if layer is not None:
+            self.macros.set_layer(key, layer)
+            self.hid_bridge.layer_event.emit(key, layer)
+
+    def _refresh_overlay(self):
+        """Show the active pad's layer, cached keymap first, then poll."""
+        pad = self._active_pad_state()
+        if pad is None or pad.current_layer is None:
+            return
+        self.overlay_window.set_layout(self._layout_for(pad))
+        self.overlay_window.update_layer(pad.current_layer)
+        self._refresh_heatmap()
+        keymap = pad.cached_keymap(pad.current_layer)
+        if keymap:
+            self.overlay_window.update_keymap(*keymap)
+            if pad.keymap_age(pad.current_layer) < self.KEYMAP_MAX_AGE:
+                # Fresh (prefetched); the poll timer re-reads it later anyway
+                return
+        self._poll_keymap()
+
+    def _update_window_info(self, process_name: str, window_title: Optional[str]):
+        """Update the current window info display while settings are shown."""
+        if self.main_window.isVisible():
+            self.main_window.update_window_info(
+                process_name, window_title, self.foreground.raw_title()
+            )
 
     def _start_window_monitoring(self):
         """Start monitoring active window changes."""
         if self.window_monitor is None:
-            # Pass a lambda that emits the signal from the monitor's thread
             self.window_monitor = WindowMonitor(
-                lambda p, t: self.hid_bridge.window_event.emit(p, t)
+                self.foreground,
+                self._window_source,
+                self.title_normalizer,
+                WindowFilter(self.settings.ignore_windows),
             )
+            self.window_monitor.wakeup_callback = self.power.note_wakeup
 
         if not self.window_monitor.running:
             self.window_monitor.start()
 
-    def _on_hid_data(self, data: bytes):
-        """Handle raw HID data from device."""
+    def _stop_window_monitoring(self):
+        """Suspend monitoring active window changes."""
+        if self.window_monitor:
+            self.window_monitor.stop()
+
+    def _on_hid_data(self, key: str, data: bytes):
+        """Handle raw HID data from a pad (called on its HID thread)."""
         # Handle Report ID if present (usually 0x00 at start)
-        payload = data
-        if len(data) > 0 and data[0] == 0x00:
-            payload = data[1:]
-
-        # Check for Layer Change Event: [0xFB, 0x01, LayerID]
-        if len(payload) > 2 and payload[0] == 0xFB and payload[1] == 0x01:
-            layer_id = payload[2]
-            self.hid_bridge.layer_event.emit(layer_id)
-
-        # Check for Key Event: [0xFB, 0x02, row, col, pressed]
-        if len(payload) > 4 and payload[0] == 0xFB and payload[1] == 0x02:
-            row = payload[2]
-            col = payload[3]
-            pressed = payload[4] == 1
-            self.hid_bridge.key_press_event.emit(row, col, pressed)
-
-    def _on_layer_event(self, layer_id: int):
+        payload = strip_report_id(data)
+
+        if tracer.enabled and len(payload) > 1:
+            if payload[0] == 0xFC and payload[1] == 0xFD:
+                tracer.mark(tracer.STAGE_ACK)
+            elif payload[0] == 0xFB and payload[1] == 0x01:
+                tracer.mark(tracer.STAGE_LAYER_EVENT)
+
+        for event in decode_events(data):
+            if event[0] == LAYER_EVENT:
+                # Before the GUI thread sees it, so the next key event
+                # already triggers the new layer's macros
+                self.macros.set_layer(key, event[1])
+                self.hid_bridge.layer_event.emit(key, event[1])
+            elif event[0] == KEY_EVENT:
+                # Macros run from here, not after a hop to the GUI thread
+                self.macros.dispatch(key, event[1], event[2], event[3])
+                self.hid_bridge.key_press_event.emit(key, event[1], event[2], event[3])
+
+    def _on_layer_event(self, key: str, layer_id: int):
         """Handle layer change event on GUI thread."""
-        if self.current_layer != layer_id:
-            self.current_layer = layer_id
+        pad = self.pool.get(key)
+        if pad is not None and pad.current_layer != layer_id:
+            if pad.current_layer is None:
+                # First layer reported: the pad's layer count and keymaps
+                # are known now (read at initialization)
+                self._compile_macros([pad])
+            pad.current_layer = layer_id
 
             # Update overlay if visible
-            if self.overlay_window.isVisible():
-                self.overlay_window.update_layer(layer_id)
-                # Fetch keymap for new layer
-                self._poll_keymap()
+            if key == self.active_pad and self.overlay_window.isVisible():
+                self._refresh_overlay()
 
             # Log/debug
-            print(f"Device switched to layer: {layer_id}")
+            print(f"Device {key} switched to layer: {layer_id}")
 
-    def _on_keymap_event(self, keycodes: list, encoder_keycodes: tuple):
+    def _on_keymap_event(self, key: str, keycodes: list, encoder_keycodes: tuple):
         """Handle keymap update event on GUI thread."""
-        # Update always if we have new data
-        self._cached_keycodes = keycodes
+        # Keycode bindings follow keymap edits
+        if self.macros.uses_keycodes:
+            pad = self.pool.get(key)
+            if pad is not None:
+                self._compile_macros([pad])
 
         # Update overlay if visible
-        if self.overlay_window.isVisible():
+        if key == self.active_pad and self.overlay_window.isVisible():
+            pad = self.pool.get(key)
+            if pad is not None:
+                self.overlay_window.set_layout(self._layout_for(pad))
             self.overlay_window.update_keymap(keycodes, encoder_keycodes)
 
-    def _on_key_press_event(self, row: int, col: int, pressed: bool):
+    def _on_key_press_event(self, key: str, row: int, col: int, pressed: bool):
         """Handle key press/release event on GUI thread."""
+        # The pad being typed on becomes the one shown by the overlay
+        self._set_active_pad(key)
+
+        if pressed and self.settings.key_analytics:
+            pad = self.pool.get(key)
+            if pad is not None and pad.current_layer is not None:
+                self.key_analytics.record(pad.current_layer, row, col)
+                if self._heat_counts is not None and key == self.active_pad:
+                    cols = self.overlay_window.keymap_grid.keyboard_layout.cols
+                    if row * cols + col < len(self._heat_counts):
+                        self._heat_counts[row * cols + col] += 1
+                        self.overlay_window.set_heatmap(self._heat_counts)
+
         # Update overlay if visible
         if self.overlay_window.isVisible():
             self.overlay_window.update_key_press(row, col, pressed)
 
+    def _compile_macros(self, pads: Optional[List[PadState]] = None):
+        """Rebuild the macro action tables of ``pads`` (default: every pad)."""
+        for pad in self.pool.pad_list() if pads is None else pads:
+            caps = pad.hid.capabilities
+            layout = self._layout_for(pad)
+            namespace = keycode_namespace(layout.digest, layout.custom_keycodes)
+            self.macros.compile(pad.key, caps.layers, dict(pad.keymaps), caps.cols, namespace.name)
+
+    def _refresh_heatmap(self):
+        """Show the active pad's key usage on its current layer (heatmap mode)."""
+        pad = self._active_pad_state()
+        if not self._heatmap_shown or pad is None or pad.current_layer is None:
+            return
+        layout = self.overlay_window.keymap_grid.keyboard_layout
+        self._heat_counts = self.key_analytics.heatmap(pad.current_layer, layout.rows, layout.cols)
+        self.overlay_window.set_heatmap(self._heat_counts)
+
     def _poll_keymap(self):
-        """Poll keymap from device for current layer."""
-        if not self.hid.connected or self.current_layer is None:
+        """Poll keymap from the active pad for its current layer."""
+        pad = self._active_pad_state()
+        if pad is None or pad.current_layer is None:
+            return
+
+        if self.loop is not None:
+            # Non-blocking; a newer poll supersedes one still in flight
+            if self._keymap_task is not None:
+                self._keymap_task.cancel()
+            self._keymap_task = self.loop.create_task(
+                self._poll_keymap_async(pad, pad.current_layer)
+            )
             return
 
-        # Fetch keycodes for current layer
-        keycodes = self.hid.get_layer_keycodes(self.current_layer)
-        encoder_keycodes = self.hid.get_encoder_keycodes(self.current_layer, 0)
-        if keycodes:
-            self.hid_bridge.keymap_event.emit(keycodes, encoder_keycodes)
+        # Queued behind pending commands of this pad; a newer poll replaces
+        # one that has not started yet
+        if self._keymap_future is not None:
+            self._keymap_future.cancel()
+        future = self.pool.read_keymap(pad.key, pad.current_layer)
+        if future is not None:
+            future.add_done_callback(
+                lambda future, key=pad.key: self._on_keymap_read(key, future)
+            )
+        self._keymap_future = future
+
+    def _on_keymap_read(self, key: str, future):
+        """Keymap read by _poll_keymap (pad worker thread)."""
+        if future.cancelled() or future.exception() is not None:
+            return
+        keymap = future.result()
+        if keymap:
+            self.hid_bridge.keymap_event.emit(key, *keymap)
+
+    def _async_client(self, pad: PadState) -> AsyncHIDClient:
+        """Async transaction client of a pad (asyncio core only)."""
+        client = self._async_clients.get(pad.key)
+        if client is None or client.hid is not pad.hid:
+            if client is not None:
+                client.close()
+            client = AsyncHIDClient(pad.hid, self.loop)
+            self._async_clients[pad.key] = client
+        return client
+
+    async def _poll_keymap_async(self, pad: PadState, layer: int):
+        keymap = await self._async_client(pad).read_keymap(layer)
+        if keymap and self.pool.get(pad.key) is pad:
+            pad.store_keymap(layer, keymap)
+            self.hid_bridge.keymap_event.emit(pad.key, *keymap)
+
+    async def _switch_layer_async(self, pad: PadState, layer: int):
+        # If cancelled (superseded by a newer focus change), current_layer
+        # already holds the newer target
+        pad.current_layer = layer
+        if not await self._async_client(pad).switch_layer(layer):
+            pad.current_layer = None
+
+    async def _consume_focus_changes(self):
+        async for process_name, window_title in focus_changes(self.foreground):
+            self._on_window_changed(process_name, window_title)
+
+    def _switch_layers(self, targets: Dict[str, int]):
+        """Send layer switches to several pads without waiting for any of them."""
+        if self.loop is None:
+            self.pool.switch_layers(targets)
+            return
+
+        for key, layer in targets.items():
+            pad = self.pool.get(key)
+            previous = self._switch_tasks.get(key)
+            if previous is not None:
+                previous.cancel()
+            self._switch_tasks[key] = self.loop.create_task(
+                self._switch_layer_async(pad, layer)
+            )
 
     def _on_window_changed(self, process_name: str, window_title: Optional[str]):
         """Handle window change event."""
-        if not self.hid.connected:
+        self.predictor.record(process_name)
+        self.key_analytics.set_app(process_name)
+        self._prefetch_attempts = 0
+        self._prefetch_timer.start(self.PREFETCH_DELAY_MS)
+
+        if not self.pool.pads:
             return
 
         # Check if auto switch layer is enabled
         if not self.settings.auto_switch_layer:
             return
 
-        # Find matching layer
-        target_layer = self._find_matching_layer(process_name, window_title)
-
-        if target_layer is not None:
-            if target_layer != self.current_layer:
-                if self.hid.switch_layer(target_layer):
-                    self.current_layer = target_layer
-                    # Update overlay if visible
-                    if self.overlay_window.isVisible():
-                        self.overlay_window.update_layer(self.current_layer)
-                        # We don't call _poll_keymap() here anymore because the keyboard
-                        # will send a Layer Event notification (0xFB 0x01) which
-                        # triggers _on_layer_event, ensuring we fetch the keymap
-                        # at the right time without HID collisions.
+        if self.settings.profile_mode:
+            self.app_usage.record(process_name)
+            self._update_profiles()
+
+        # Find matching layer for every pad (rules may be device specific).
+        # Profiled applications need no matching, only their slot.
+        targets = {}
+        profile_targets: Dict[str, Tuple[int, int]] = {}
+        for pad in self.pool.pad_list():
+            slot = pad.profiles.lookup(process_name) if pad.profiles else None
+            if slot is not None:
+                target_layer = pad.profiles.layers[slot]
+                if target_layer != pad.current_layer:
+                    profile_targets[pad.key] = (slot, target_layer)
+                continue
+            target_layer = self._find_matching_layer(process_name, window_title, pad.key)
+            if target_layer is not None and target_layer != pad.current_layer:
+                targets[pad.key] = target_layer
+        if tracer.enabled:
+            tracer.mark(tracer.STAGE_MATCH)
+
+        # Each pad switches independently, so a slow pad delays nobody
+        self._switch_layers(targets)
+        self._activate_profiles(profile_targets)
+        for key, (_, layer) in profile_targets.items():
+            targets[key] = layer
+
+        # Update overlay if visible. The keymap is refreshed by the poll
+        # timer; show the cached one meanwhile.
+        if self.active_pad in targets and self.overlay_window.isVisible():
+            layer = targets[self.active_pad]
+            self.overlay_window.update_layer(layer)
+            keymap = self._active_pad_state().cached_keymap(layer)
+            if keymap:
+                self.overlay_window.update_keymap(*keymap)
+
+    def _prefetch_predicted(self):
+        """Refresh keymaps of the layers the next application likely uses."""
+        current = self.foreground.current()
+        if current is None or not self.settings.auto_switch_layer:
+            return
+        predicted = [app for app, _ in self.predictor.predict(current[0], self.PREDICTED_APPS)]
+
+        busy = False
+        for pad in self.pool.pad_list():
+            layers = {self._find_matching_layer(app, None, pad.key) for app in predicted}
+            layers = sorted(
+                layer
+                for layer in layers - {None, pad.current_layer}
+                if pad.keymap_age(layer) >= self.KEYMAP_MAX_AGE
+            )
+            if not layers:
+                continue
+            # Background reads must not delay layer switches
+            if self.pool.is_idle(pad.key, self.PREFETCH_IDLE_GAP):
+                self.pool.prefetch_keymaps(pad.key, layers)
+            else:
+                busy = True
+
+        if busy and self._prefetch_attempts < self.PREFETCH_RETRIES:
+            self._prefetch_attempts += 1
+            self._prefetch_timer.start(self.PREFETCH_DELAY_MS)
+
+        if time.monotonic() - self._history_saved_at >= self.HISTORY_SAVE_INTERVAL:
+            self._history_saved_at = time.monotonic()
+            self.predictor.save()
+
+    def _activate_profiles(self, targets: Dict[str, Tuple[int, int]]):
+        """Send profile slot switches (pad key -> (slot, layer))."""
+        if not targets:
+            return
+        for key in targets:
+            # A layer switch still in flight would land after the profile one
+            task = self._switch_tasks.pop(key, None)
+            if task is not None:
+                task.cancel()
+        self.pool.activate_profiles(targets)
+
+    def _update_profiles(self, force: bool = False):
+        """Reload profile slots when the set of top applications changed."""
+        if not self.settings.profile_mode:
+            self._profile_apps = None
+            for pad in self.pool.pad_list():
+                pad.profiles = None
+            return
+
+        # Mapped applications fill the slots until usage has been recorded
+        mapped = [mapping["process_name"] for mapping in self.settings.get_layer_mappings()]
+        apps = self.app_usage.top(self.settings.profile_size, fill=mapped)
+        if not force and self._profile_apps is not None and set(apps) == set(self._profile_apps):
+            return
+        self._profile_apps = apps
+        self._load_profiles(self.pool.pad_list())
+
+    def _load_profiles(self, pads: List[PadState]):
+        """Resolve the profiled applications for each pad and load its slots."""
+        for pad in pads:
+            table = ProfileTable.build(
+                self._profile_apps, lambda app: self._profile_layer(app, pad.key)
+            )
+            if table != pad.profiles:
+                self.pool.load_profiles(pad.key, table)
+
+    def _profile_layer(self, process_name: str, device: str) -> Optional[int]:
+        """Layer of an application on a pad, if it does not depend on the title."""
+        for mapping in self.settings.get_layer_mappings():
+            if (
+                mapping["process_name"] == process_name
+                and mapping.get("window_title")
+                and (not mapping.get("device") or mapping["device"] == device)
+            ):
+                return None
+        return self._find_matching_layer(process_name, None, device)
 
     def _find_matching_layer(
-        self, process_name: str, window_title: Optional[str]
+        self, process_name: str, window_title: Optional[str], device: Optional[str] = None
     ) -> Optional[int]:
-        """Find the matching layer for the current window."""
-        mappings = self.settings.get_layer_mappings()
-
-        # Priority 1: Match process + window title (exact, case-sensitive)
+        """Find the matching layer for the current window on a pad.
+
+        Mappings without a "device" apply to every pad; device-specific
+        mappings are listed first by get_layer_mappings and so win.
+        ``window_title`` is normalized (as published by WindowMonitor) and
+        compared with the normalized mapping titles. A mapping title that
+        is already a key matches as is: normalizing a key again can change
+        it (the "document" rule drops another segment).
+        """
+        mappings = [
+            mapping
+            for mapping in self.settings.get_layer_mappings()
+            if not mapping.get("device") or mapping["device"] == device
+        ]
+
+        # Priority 1: Match process + window title (exact after
+        # normalization, case-sensitive)
+        normalize = self.title_normalizer.normalize
         for mapping in mappings:
             if (
-                mapping.get("window_title")
+                window_title is not None
+                and mapping.get("window_title")
                 and mapping["process_name"] == process_name
-                and mapping["window_title"] == window_title
+                and (
+                    mapping["window_title"] == window_title
+                    or normalize(mapping["window_title"]) == window_title
+                )
             ):
                 return mapping["layer"]
 
@@ -270,13 +801,13 @@ class NexaHubApp:
         return self.settings.default_layer
 
     def _apply_current_settings(self):
-        """Apply current settings to the device."""
-        if not self.hid.connected:
-            return
-
+        """Apply current settings to every pad."""
         # Apply OLED timeout
         timeout_option = self._timeout_to_option(self.settings.oled_timeout)
-        self.hid.set_oled_timeout(timeout_option)
+        self.pool.broadcast(HIDManager.set_oled_timeout, timeout_option)
+
+        # Mappings or the default layer may have changed
+        self._update_profiles(force=True)
 
     def _timeout_to_option(self, timeout: int) -> int:
         """Convert timeout seconds to option index."""
@@ -293,9 +824,7 @@ class NexaHubApp:
         """Handle overlay toggle from system tray (setting is now persistent)."""
         if enabled:
             self.overlay_window.show()
-            if self.current_layer is not None:
-                self.overlay_window.update_layer(self.current_layer)
-                self._poll_keymap()
+            self._refresh_overlay()
         else:
             self.overlay_window.hide()
 
@@ -309,17 +838,40 @@ class NexaHubApp:
             f"Click-through mode {mode}. {'Mouse events will pass through.' if enabled else 'You can now drag the overlay.'}",
         )
 
+    def _on_tray_key_analytics_toggle(self, enabled: bool):
+        """Start or stop recording key usage (setting is persistent)."""
+        # Key events and the flush timer depend on it
+        self.power.refresh()
+        if not enabled:
+            self.key_analytics.flush()
+
+    def _on_tray_heatmap_toggle(self, shown: bool):
+        """Color overlay keys by recorded presses, or restore keycode colors."""
+        self._heatmap_shown = shown
+        if shown:
+            self._refresh_heatmap()
+        else:
+            self._heat_counts = None
+            self.overlay_window.set_heatmap(None)
+
     def _on_settings_changed(self):
         """Handle settings changes."""
+        self.title_normalizer = TitleNormalizer(self.settings.title_rules)
+        if self.window_monitor is not None:
+            # The next poll republishes the window if its key changed
+            self.window_monitor.normalizer = self.title_normalizer
+            self.window_monitor.window_filter = WindowFilter(self.settings.ignore_windows)
         self._apply_current_settings()
+        self.macros.configure(self.settings.macros)
+        self._compile_macros()
+        # Key events are needed while macros are configured
+        self.power.refresh()
 
         # Apply overlay visibility based on persistent setting
         if self.settings.show_overlay:
             self.overlay_window.show()
-            if self.current_layer is not None:
-                self.overlay_window.update_layer(self.current_layer)
-                # Fetch keymap when showing overlay
-                self._poll_keymap()
+            # Fetch keymap when showing overlay
+            self._refresh_overlay()
         else:
             self.overlay_window.hide()
 
@@ -331,15 +883,38 @@ class NexaHubApp:
         else:
             self.main_window.show()
 
+        # Catch up with changes published while the window was hidden
+        window_info = self.foreground.current()
+        if window_info:
+            self.main_window.update_window_info(*window_info, self.foreground.raw_title())
+
         self.main_window.raise_()
         self.main_window.activateWindow()
 
+    def _show_diagnostics_window(self):
+        """Show the diagnostics panel."""
+        self.diagnostics_window.show()
+        self.diagnostics_window.raise_()
+        self.diagnostics_window.activateWindow()
+
     def _quit(self):
         """Quit the application."""
+        self.power.uninstall(self.app, int(self.main_window.winId()))
+        self._prefetch_timer.stop()
+        self.predictor.save()
+        self.key_analytics.flush()
+        self.macros.close()
+        for task in [self._focus_task, self._keymap_task, *self._switch_tasks.values()]:
+            if task is not None:
+                task.cancel()
+        for client in self._async_clients.values():
+            client.close()
+        self._async_clients.clear()
         if self.window_monitor:
             self.window_monitor.stop()
-        self.hid.disconnect()
+        self.pool.close()
         self.overlay_window.close()
+        self.diagnostics_window.close()
         self.app.quit()
 
     def run(self):
@@ -350,6 +925,10 @@ class NexaHubApp:
         # Show main window on first run
         self._show_main_window()
 
+        if self.loop is not None:
+            # Runs app.exec() with asyncio tasks scheduled on the Qt loop
+            with self.loop:
+                return self.loop.run_forever()
         return self.app.exec()
 
 
@@ -0,0 +1,60 @@
+"""Replay a HID capture through HIDManager and the app's event decoder.
+
+Usage:
+    python replay_capture.py capture.nxcap [--speed 10] [--quiet]
+
+Runs without a device (and without pywinusb), so event storms recorded in
+the field can be reproduced and profiled offline.
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from engine.hid_manager import HIDManager
+from engine.hid_capture import replay_capture
+from engine.hid_protocol import decode_events
+
+
+def main():
+    """Entry point."""
+    parser = argparse.ArgumentParser(description="Replay a NexaHub HID capture")
+    parser.add_argument("capture", help="Capture file written by the diagnostics panel")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="Playback speed multiplier (0 = as fast as possible)",
+    )
+    parser.add_argument("--quiet", action="store_true", help="Do not print each event")
+    args = parser.parse_args()
+
+    hid = HIDManager()
+    events: Counter = Counter()
+
+    def on_data(data):
+        for event in decode_events(data):
+            events[event[0]] += 1
+            if not args.quiet:
+                print(event)
+
+    hid.register_callback(on_data)
+
+    start = time.perf_counter()
+    count = replay_capture(args.capture, hid._on_data_received, args.speed)
+    elapsed = time.perf_counter() - start
+
+    stats = hid.stats.snapshot()
+    print(f"Replayed {count} reports in {elapsed:.3f}s")
+    if elapsed > 0:
+        print(f"Throughput: {count / elapsed:.0f} reports/s")
+    print(f"Decoded events: {dict(events)}")
+    print(f"Report types: {stats['received']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Titles published by WindowMonitor and the raw titles kept for autofill.
+
+Run from the nexahub directory:
+    python -m pytest tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine.fake_windows import FakeWindowTree
+from engine.foreground_state import ForegroundState
+from engine.title_normalizer import BUILTIN_RULES, TitleNormalizer
+from engine.window_monitor import WindowMonitor
+
+TITLES = [
+    "● main.py - project - Visual Studio Code",
+    "(3) Inbox - Mail",
+    "*Untitled - Notepad",
+    "Calculator",
+]
+
+
+class PublishedTitleTest(unittest.TestCase):
+    def publish(self, rules, title):
+        tree = FakeWindowTree()
+        tree.focus(tree.add_app("Code.exe", title))
+        state = ForegroundState()
+        normalizer = TitleNormalizer(rules)
+        WindowMonitor(state, normalizer=normalizer, tree=tree).poll()
+        return state, normalizer
+
+    def test_raw_title_kept(self):
+        state, _ = self.publish(["unsaved", "document"], TITLES[0])
+        self.assertEqual(state.current(), ("Code.exe", "project - Visual Studio Code"))
+        self.assertEqual(state.raw_title(), TITLES[0])
+
+    def test_raw_title_normalizes_to_the_published_key(self):
+        # What autofill saves must match the window it was taken from
+        for rule in sorted(BUILTIN_RULES):
+            for title in TITLES:
+                with self.subTest(rule=rule, title=title):
+                    state, normalizer = self.publish([rule], title)
+                    self.assertEqual(normalizer.normalize(state.raw_title()), state.current()[1])
+
+    def test_raw_title_defaults_to_the_key(self):
+        state = ForegroundState()
+        state.publish("Code.exe", "project")
+        self.assertEqual(state.raw_title(), "project")
+
+
+if __name__ == "__main__":
+    unittest.main()
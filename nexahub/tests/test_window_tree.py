@@ -0,0 +1,107 @@
+"""WindowResolver and WindowMonitor's window source on the in-memory desktop.
+
+Run from the nexahub directory:
+    python -m pytest tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine.fake_windows import FakeWindowTree
+from engine.foreground_state import ForegroundState
+from engine.window_monitor import IGNORED, WindowMonitor
+from engine.window_tree import WindowResolver
+
+
+class WindowResolverTest(unittest.TestCase):
+    def setUp(self):
+        self.tree = FakeWindowTree()
+        self.resolver = WindowResolver(self.tree)
+
+    def resolve(self, hwnd: int):
+        return self.resolver.process_name(hwnd, self.tree.process_id(hwnd))
+
+    def test_desktop_app(self):
+        hwnd = self.tree.add_app("Code.exe", "main.py - Visual Studio Code")
+        self.assertEqual(self.resolve(hwnd), "Code.exe")
+
+    def test_uwp_frame_resolves_to_hosted_process(self):
+        frame = self.tree.add_uwp_app("Calculator.exe", "Calculator")
+        self.assertEqual(self.resolve(frame), "Calculator.exe")
+
+    def test_host_until_the_application_attaches(self):
+        frame = self.tree.add_uwp_app("Calculator.exe", "Calculator", attached=False)
+        self.assertEqual(self.resolve(frame), FakeWindowTree.APPLICATION_FRAME_HOST)
+        # The fallback is not cached: the next sample finds the application
+        self.tree.attach(frame, "Calculator.exe")
+        self.assertEqual(self.resolve(frame), "Calculator.exe")
+
+    def test_cached_per_window(self):
+        frame = self.tree.add_uwp_app("Calculator.exe", "Calculator")
+        self.resolve(frame)
+        lookups = self.tree.process_lookups
+        self.assertEqual(self.resolve(frame), "Calculator.exe")
+        self.assertEqual(self.tree.process_lookups, lookups)
+
+    def test_reused_handle_resolves_again(self):
+        hwnd = self.tree.add_app("Code.exe", "main.py - Visual Studio Code")
+        self.assertEqual(self.resolve(hwnd), "Code.exe")
+        self.tree.close(hwnd)
+        self.tree.add_window(self.tree.add_process("notepad.exe"), "Notepad", "notes", hwnd=hwnd)
+        self.assertEqual(self.resolve(hwnd), "notepad.exe")
+
+    def test_exited_process(self):
+        hwnd = self.tree.add_app("Code.exe", "main.py - Visual Studio Code")
+        del self.tree.processes[self.tree.process_id(hwnd)]
+        self.assertIsNone(self.resolve(hwnd))
+
+
+class WindowSourceTest(unittest.TestCase):
+    def setUp(self):
+        self.tree = FakeWindowTree()
+        self.sample = WindowMonitor(ForegroundState(), tree=self.tree)._get_active_window_info
+
+    def test_no_foreground_window(self):
+        self.assertIsNone(self.sample())
+
+    def test_uwp_app(self):
+        self.tree.focus(self.tree.add_uwp_app("Calculator.exe", "Calculator"))
+        self.assertEqual(self.sample(), ("Calculator.exe", "Calculator"))
+
+    def test_uwp_app_attaching(self):
+        frame = self.tree.add_uwp_app("Calculator.exe", "Calculator", attached=False)
+        self.tree.focus(frame)
+        self.assertEqual(self.sample(), (FakeWindowTree.APPLICATION_FRAME_HOST, "Calculator"))
+        self.tree.attach(frame, "Calculator.exe")
+        self.assertEqual(self.sample(), ("Calculator.exe", "Calculator"))
+
+    def test_reused_handle(self):
+        hwnd = self.tree.add_app("Code.exe", "main.py - Visual Studio Code")
+        self.tree.focus(hwnd)
+        self.assertEqual(self.sample(), ("Code.exe", "main.py - Visual Studio Code"))
+        self.tree.close(hwnd)
+        self.tree.add_window(self.tree.add_process("notepad.exe"), "Notepad", "notes", hwnd=hwnd)
+        self.tree.focus(hwnd)
+        self.assertEqual(self.sample(), ("notepad.exe", "notes"))
+
+    def test_untitled_window(self):
+        self.tree.focus(self.tree.add_app("Code.exe", ""))
+        self.assertEqual(self.sample(), ("Code.exe", None))
+
+    def test_ignored_class_skips_the_process_lookup(self):
+        explorer = self.tree.add_process("explorer.exe")
+        self.tree.focus(self.tree.add_window(explorer, "MultitaskingViewFrame"))
+        self.assertIs(self.sample(), IGNORED)
+        self.assertEqual(self.tree.process_lookups, 0)
+
+    def test_own_window(self):
+        self.tree.processes[os.getpid()] = "python.exe"
+        self.tree.focus(self.tree.add_window(os.getpid(), "Qt6QWindowIcon", "NexaHub"))
+        self.assertIsNone(self.sample())
+
+
+if __name__ == "__main__":
+    unittest.main()
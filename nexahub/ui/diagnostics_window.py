@@ -0,0 +1,332 @@
+"""Diagnostics panel showing pipeline latency, HID traffic, power state and macros."""
+
+from PySide6.QtWidgets import (
+    QWidget,
+    QVBoxLayout,
+    QHBoxLayout,
+    QLabel,
+    QPushButton,
+    QTableWidget,
+    QTableWidgetItem,
+    QCheckBox,
+    QGroupBox,
+    QHeaderView,
+    QFileDialog,
+    QMessageBox,
+)
+from PySide6.QtCore import Qt, QTimer
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine.latency_tracer import tracer
+
+
+class DiagnosticsWindow(QWidget):
+    """Window exposing runtime diagnostics (latency, HID traffic, power state, macros)."""
+
+    LATENCY_COLUMNS = ["Stage", "Count", "p50 (ms)", "p95 (ms)", "p99 (ms)", "Max (ms)"]
+    HISTOGRAM_COLUMNS = (
+        ["Stage"]
+        + [f"≤{bound:g}" for bound in tracer.HISTOGRAM_BUCKETS_MS]
+        + [f">{tracer.HISTOGRAM_BUCKETS_MS[-1]:g}"]
+    )
+    TRAFFIC_COLUMNS = ["Report Type", "Sent", "Received"]
+
+    def __init__(
+        self, device_pool, power_manager, overlay_window=None, macro_engine=None, parent=None
+    ):
+        super().__init__(parent)
+        self.pool = device_pool
+        self.power = power_manager
+        self.overlay = overlay_window
+        self.macros = macro_engine
+        self.setWindowTitle("NexaHub Diagnostics")
+        self.setMinimumSize(560, 620)
+
+        self._setup_ui()
+
+        # Refresh only while the window is visible
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def _setup_ui(self):
+        """Setup the user interface."""
+        layout = QVBoxLayout(self)
+        layout.setSpacing(10)
+
+        # Latency tracing group
+        latency_group = QGroupBox("Focus to Layer Latency")
+        latency_layout = QVBoxLayout(latency_group)
+
+        self.tracing_checkbox = QCheckBox("Enable latency tracing")
+        self.tracing_checkbox.setChecked(tracer.enabled)
+        self.tracing_checkbox.toggled.connect(self._on_tracing_toggled)
+        latency_layout.addWidget(self.tracing_checkbox)
+
+        self.latency_table = QTableWidget()
+        self.latency_table.setColumnCount(len(self.LATENCY_COLUMNS))
+        self.latency_table.setHorizontalHeaderLabels(self.LATENCY_COLUMNS)
+        self.latency_table.horizontalHeader().setSectionResizeMode(
+            QHeaderView.ResizeMode.Stretch
+        )
+        self.latency_table.verticalHeader().setVisible(False)
+        self.latency_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        latency_layout.addWidget(self.latency_table)
+
+        # Samples per latency bucket (ms), one row per stage
+        self.histogram_table = QTableWidget()
+        self.histogram_table.setColumnCount(len(self.HISTOGRAM_COLUMNS))
+        self.histogram_table.setHorizontalHeaderLabels(self.HISTOGRAM_COLUMNS)
+        self.histogram_table.horizontalHeader().setSectionResizeMode(
+            QHeaderView.ResizeMode.ResizeToContents
+        )
+        self.histogram_table.verticalHeader().setVisible(False)
+        self.histogram_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        latency_layout.addWidget(self.histogram_table)
+
+        button_layout = QHBoxLayout()
+
+        self.clear_button = QPushButton("Clear")
+        self.clear_button.clicked.connect(self._clear_trace)
+        button_layout.addWidget(self.clear_button)
+
+        self.export_button = QPushButton("Export Chrome Trace...")
+        self.export_button.clicked.connect(self._export_trace)
+        button_layout.addWidget(self.export_button)
+
+        button_layout.addStretch()
+        latency_layout.addLayout(button_layout)
+
+        layout.addWidget(latency_group)
+
+        # HID traffic group
+        traffic_group = QGroupBox("HID Traffic")
+        traffic_layout = QVBoxLayout(traffic_group)
+
+        self.traffic_summary_label = QLabel("")
+        traffic_layout.addWidget(self.traffic_summary_label)
+
+        # Round-trip estimate, timeout, breaker state and protocol per pad
+        self.reliability_label = QLabel("")
+        self.reliability_label.setStyleSheet("color: gray; font-size: 11px;")
+        traffic_layout.addWidget(self.reliability_label)
+
+        self.traffic_table = QTableWidget()
+        self.traffic_table.setColumnCount(len(self.TRAFFIC_COLUMNS))
+        self.traffic_table.setHorizontalHeaderLabels(self.TRAFFIC_COLUMNS)
+        self.traffic_table.horizontalHeader().setSectionResizeMode(
+            QHeaderView.ResizeMode.Stretch
+        )
+        self.traffic_table.verticalHeader().setVisible(False)
+        self.traffic_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        traffic_layout.addWidget(self.traffic_table)
+
+        capture_layout = QHBoxLayout()
+
+        self.reset_stats_button = QPushButton("Reset Counters")
+        self.reset_stats_button.clicked.connect(self._reset_stats)
+        capture_layout.addWidget(self.reset_stats_button)
+
+        self.capture_button = QPushButton("Start Capture...")
+        self.capture_button.clicked.connect(self._toggle_capture)
+        capture_layout.addWidget(self.capture_button)
+
+        self.capture_label = QLabel("")
+        self.capture_label.setStyleSheet("color: gray; font-size: 11px;")
+        capture_layout.addWidget(self.capture_label)
+
+        capture_layout.addStretch()
+        traffic_layout.addLayout(capture_layout)
+
+        layout.addWidget(traffic_group)
+
+        # Power state group
+        power_group = QGroupBox("Power State")
+        power_layout = QVBoxLayout(power_group)
+
+        self.power_state_label = QLabel("")
+        power_layout.addWidget(self.power_state_label)
+
+        self.wakeups_label = QLabel("")
+        power_layout.addWidget(self.wakeups_label)
+
+        layout.addWidget(power_group)
+
+        # Macro group: trigger to action latency
+        macro_group = QGroupBox("Macros")
+        macro_layout = QVBoxLayout(macro_group)
+
+        self.macro_label = QLabel("")
+        macro_layout.addWidget(self.macro_label)
+
+        layout.addWidget(macro_group)
+
+    def refresh(self):
+        """Refresh all diagnostics views."""
+        summary = tracer.summary()
+        self.latency_table.setRowCount(len(summary))
+        for row, (stage, stats) in enumerate(summary.items()):
+            values = [
+                stage,
+                str(stats["count"]),
+                f"{stats['p50']:.2f}",
+                f"{stats['p95']:.2f}",
+                f"{stats['p99']:.2f}",
+                f"{stats['max']:.2f}",
+            ]
+            for col, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if col > 0:
+                    item.setTextAlignment(
+                        Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+                    )
+                self.latency_table.setItem(row, col, item)
+
+        histograms = tracer.histograms()
+        self.histogram_table.setRowCount(len(histograms))
+        for row, (stage, counts) in enumerate(histograms.items()):
+            self.histogram_table.setItem(row, 0, QTableWidgetItem(stage))
+            for col, count in enumerate(counts, start=1):
+                # Empty buckets stay blank so the shape stands out
+                item = QTableWidgetItem(str(count) if count else "")
+                item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+                self.histogram_table.setItem(row, col, item)
+
+        self._refresh_traffic()
+        self._refresh_power()
+        self._refresh_macros()
+
+    def _refresh_macros(self):
+        """Refresh macro counts and trigger to action latency."""
+        if self.macros is None:
+            self.macro_label.setText("n/a")
+            return
+        latency = self.macros.latency_summary()
+        self.macro_label.setText(
+            f"Configured: {len(self.macros.entries)} | Run: {self.macros.dispatched} | "
+            f"Failed: {self.macros.failures} | Trigger to action p50/p95/max: "
+            f"{latency['p50']:.1f}/{latency['p95']:.1f}/{latency['max']:.1f} ms"
+        )
+
+    def _refresh_power(self):
+        """Refresh power state flags, the idle wakeup and overlay relayout metrics."""
+        state = self.power.snapshot()
+        self.power_state_label.setText(
+            f"Session locked: {state['session_locked']} | "
+            f"Display off: {state['display_off']} | "
+            f"Device present: {state['device_present']} | "
+            f"Windows visible: {state['windows_visible']}"
+        )
+        running = ", ".join(state["running"]) or "none"
+        relayouts = ""
+        if self.overlay is not None:
+            relayouts = f" | Overlay relayouts/min: {self.overlay.relayouts_per_minute():.0f}"
+        self.wakeups_label.setText(
+            f"Wakeups/min: {state['wakeups_per_minute']:.0f}{relayouts} | Running: {running}"
+        )
+
+    def _refresh_traffic(self):
+        """Refresh HID traffic counters and capture state."""
+        stats = self.pool.stats.snapshot()
+        self.traffic_summary_label.setText(
+            f"Timeouts: {stats['timeouts']} | Retries: {stats['retries']} | "
+            f"Sent: {stats['bytes_sent']} B | Received: {stats['bytes_received']} B | "
+            f"Rate: {stats['bytes_per_second']:.0f} B/s"
+        )
+
+        lines = []
+        for pad in self.pool.pad_list():
+            rtts = ", ".join(
+                f"0x{request_id:02X} {rtt.srtt * 1000:.1f}/{rtt.timeout() * 1000:.0f} ms"
+                for request_id, rtt in sorted(pad.hid.rtt.items())
+                if rtt.srtt is not None
+            )
+            caps = pad.hid.capabilities
+            lines.append(
+                f"{pad.key}: RTT/timeout {rtts or 'n/a'} | Breaker: {pad.hid.breaker.state} | "
+                f"Protocol: {f'v{caps.protocol_version}' if caps.negotiated else 'legacy'}, "
+                f"{caps.rows}x{caps.cols}, {caps.layers} layers"
+            )
+        self.reliability_label.setText("\n".join(lines))
+
+        kinds = sorted(set(stats["sent"]) | set(stats["received"]))
+        self.traffic_table.setRowCount(len(kinds))
+        for row, kind in enumerate(kinds):
+            values = [
+                kind,
+                str(stats["sent"].get(kind, 0)),
+                str(stats["received"].get(kind, 0)),
+            ]
+            for col, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if col > 0:
+                    item.setTextAlignment(
+                        Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+                    )
+                self.traffic_table.setItem(row, col, item)
+
+        capture = self.pool.capture
+        if capture is not None:
+            self.capture_button.setText("Stop Capture")
+            self.capture_label.setText(
+                f"{capture.records} reports, {capture.size} B, {capture.dropped} dropped"
+            )
+        else:
+            self.capture_button.setText("Start Capture...")
+            self.capture_label.setText("")
+
+    def _reset_stats(self):
+        """Reset HID traffic counters."""
+        self.pool.stats.reset()
+        self._refresh_traffic()
+
+    def _toggle_capture(self):
+        """Start or stop capturing raw HID reports."""
+        if self.pool.capture is not None:
+            self.pool.stop_capture()
+        else:
+            file_path, _ = QFileDialog.getSaveFileName(
+                self, "Capture HID Reports", "nexahub_capture.nxcap",
+                "NexaHub Captures (*.nxcap)"
+            )
+            if not file_path:
+                return
+            try:
+                self.pool.start_capture(file_path)
+            except Exception as e:
+                QMessageBox.critical(self, "Error", f"Failed to start capture: {str(e)}")
+        self._refresh_traffic()
+
+    def _on_tracing_toggled(self, checked: bool):
+        """Enable or disable the shared latency tracer."""
+        tracer.enabled = checked
+
+    def _clear_trace(self):
+        """Discard recorded latency samples."""
+        tracer.clear()
+        self.refresh()
+
+    def _export_trace(self):
+        """Export recorded latency chains as Chrome trace JSON."""
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "Export Chrome Trace", "nexahub_trace.json", "JSON Files (*.json)"
+        )
+        if file_path:
+            try:
+                tracer.export_chrome_trace(file_path)
+            except Exception as e:
+                QMessageBox.critical(self, "Error", f"Failed to export trace: {str(e)}")
+
+    def showEvent(self, event):
+        """Start periodic refresh when shown."""
+        self.refresh()
+        self.refresh_timer.start(1000)
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        """Stop periodic refresh when hidden."""
+        self.refresh_timer.stop()
+        super().hideEvent(event)
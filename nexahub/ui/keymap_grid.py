@@ -1,140 +1,236 @@
 """Keymap grid widget for displaying QMK keycodes."""
 
-from PySide6.QtWidgets import QWidget, QLabel, QGridLayout, QVBoxLayout, QHBoxLayout
-from PySide6.QtCore import Qt
-from PySide6.QtGui import QColor, QPalette, QFont
-from typing import List, Optional
+from PySide6.QtWidgets import QWidget
+from PySide6.QtCore import Qt, QRect, QSize
+from PySide6.QtGui import QColor, QFont, QPainter, QPen, QPixmap
+from typing import Dict, List, Optional, Sequence, Tuple
 
 import sys
 import os
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from utils.qmk_keycodes import get_keycode_name, shorten_keycode_name
+from utils.qmk_keycodes import (
+    BASE_NAMESPACE,
+    get_keycode_name,
+    keycode_namespace,
+    shorten_keycode_name,
+)
+from utils.keymap_diff import ENCODER_DIRECTIONS, KeymapDiff, encoder_cell
+from utils.layout_loader import BUILTIN_LAYOUT, KeyboardLayout, KeyGeometry
+
+
+class _Cell:
+    """Drawn state of one key or encoder cell."""
+
+    __slots__ = ("rect", "text", "color", "pressed", "circle", "font")
+
+    def __init__(self, rect: QRect, text: str, color: QColor, circle: bool, font: QFont):
+        self.rect = rect
+        self.text = text
+        self.color = color
+        self.pressed = False
+        self.circle = circle
+        self.font = font
 
 
 class KeymapGrid(QWidget):
-    """Visual grid display of QMK keycodes matching NexaPad layout."""
-
-    # NexaPad physical layout (4x4)
-    # Total: 16 keys in matrix
-
-    # Matrix positions in order they appear in EEPROM (Row Major)
-    KEY_POSITIONS = [
-        (0, 0),
-        (0, 1),
-        (0, 2),
-        (0, 3),  # Row 0
-        (1, 0),
-        (1, 1),
-        (1, 2),
-        (1, 3),  # Row 1
-        (2, 0),
-        (2, 1),
-        (2, 2),
-        (2, 3),  # Row 2
-        (3, 0),
-        (3, 1),
-        (3, 2),
-        (3, 3),  # Row 3
-    ]
+    """Visual grid display of QMK keycodes drawn from a pad's layout.
+
+    The grid is drawn into a cached backing pixmap at the screen's device
+    pixel ratio. A keycode, encoder or press change redraws only its cell in
+    the pixmap and schedules a repaint of that cell; paintEvent just blits
+    the exposed part of the pixmap.
+
+    Keycode updates are diffed against the last displayed snapshot, so only
+    keys whose keycode changed are relabelled. Press highlighting is kept
+    apart from the snapshot and survives keycode updates.
+
+    Cells come from a KeyboardLayout geometry table (see
+    utils/layout_loader.py); switching layouts only recomputes cell
+    rectangles and the pixmap. Matrix keys are keyed by their index in the
+    keycode list, encoder cells as in utils.keymap_diff.encoder_cell.
+    """
+
+    # Geometry (pixels); one key unit is KEY_SIZE plus SPACING
+    MARGIN = 8
+    SPACING = 4
+    KEY_SIZE = QSize(60, 40)
 
     # Color coding for different keycode types
     COLORS = {
-        "layer": "rgba(74, 144, 217, 160)",  # Blue - layer functions (TO, MO, etc.)
-        "basic": "rgba(92, 184, 92, 160)",   # Green - basic keys
-        "mod": "rgba(240, 173, 78, 160)",    # Orange - modifiers
-        "special": "rgba(217, 83, 79, 160)",  # Red - special functions
-        "transparent": "rgba(119, 119, 119, 140)", # Gray - KC_TRNS
-        "none": "rgba(51, 51, 51, 140)",      # Dark gray - KC_NO
-        "pressed": "rgba(255, 255, 255, 220)", # White - pressed key highlight
+        "layer": QColor(74, 144, 217, 160),  # Blue - layer functions (TO, MO, etc.)
+        "basic": QColor(92, 184, 92, 160),  # Green - basic keys
+        "mod": QColor(240, 173, 78, 160),  # Orange - modifiers
+        "special": QColor(217, 83, 79, 160),  # Red - special functions
+        "transparent": QColor(119, 119, 119, 140),  # Gray - KC_TRNS
+        "none": QColor(51, 51, 51, 140),  # Dark gray - KC_NO
+        "pressed": QColor(255, 255, 255, 220),  # White - pressed key highlight
     }
-
-    def __init__(self, parent=None):
+    # Heatmap: least to most pressed key
+    HEAT_COLD = QColor(40, 80, 160, 160)
+    HEAT_HOT = QColor(230, 60, 40, 210)
+    UNKNOWN_COLOR = QColor("#555555")
+    ENCODER_COLOR = QColor("#333333")
+    BACKGROUND = QColor(40, 40, 40, 160)
+    BORDER = QColor(255, 255, 255, 30)
+    PRESSED_BORDER = QColor("#FFFFFF")
+    TEXT_COLOR = QColor("#FFFFFF")
+
+    def __init__(self, parent=None, layout: Optional[KeyboardLayout] = None):
         super().__init__(parent)
-        self.key_labels: List[QLabel] = []
         self._pressed_keys: set = set()  # Track pressed keys as (row, col) tuples
-        self._keycode_colors: dict = {}  # Store original colors for each key index
-        self._setup_ui()
-
-    def _setup_ui(self):
-        """Setup the keymap grid UI."""
-        # Main layout
-        layout = QVBoxLayout(self)
-        layout.setSpacing(4)
-        layout.setContentsMargins(8, 8, 8, 8)
-        layout.setSizeConstraint(QVBoxLayout.SizeConstraint.SetFixedSize)
-
-        # Create grid layout
-        grid = QGridLayout()
-        grid.setSpacing(4)
-        grid.setSizeConstraint(QGridLayout.SizeConstraint.SetFixedSize)
-
-        # Create encoder labels (CW/CCW) (Circle)
-        self.enc_ccw_label = QLabel("CCW")
-        self.enc_ccw_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        self.enc_ccw_label.setFont(QFont("Segoe UI", 7, QFont.Weight.Bold))
-        self.enc_ccw_label.setFixedSize(50, 50)  # Circle size
-        self.enc_ccw_label.setStyleSheet(self._get_label_style("#333333", is_circle=True))
-        grid.addWidget(self.enc_ccw_label, 0, 0, Qt.AlignmentFlag.AlignCenter)
-
-        self.enc_cw_label = QLabel("CW")
-        self.enc_cw_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        self.enc_cw_label.setFont(QFont("Segoe UI", 7, QFont.Weight.Bold))
-        self.enc_cw_label.setFixedSize(50, 50)  # Circle size
-        self.enc_cw_label.setStyleSheet(self._get_label_style("#333333", is_circle=True))
-        grid.addWidget(self.enc_cw_label, 0, 3, Qt.AlignmentFlag.AlignCenter)
-
-        # Create labels for each key position
-        for idx, (row, col) in enumerate(self.KEY_POSITIONS):
-            label = QLabel("-")
-            label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-            label.setFont(QFont("Segoe UI", 8, QFont.Weight.Bold))
-            label.setFixedSize(60, 40)
-            
-            # Knob is now square, same as others
-            label.setStyleSheet(self._get_label_style("#555555", is_circle=False))
-
-            # Add to grid with proper positioning
-            if idx == 0:
-                # Knob button - center in middle columns
-                grid.addWidget(label, 0, 1, 1, 2, Qt.AlignmentFlag.AlignCenter)
-            elif idx in (1, 2, 3):
-                # Hidden keys - don't add to grid to prevent layout issues
-                label.hide()
+        self._last_keycodes: Optional[List[int]] = None
+        self._last_encoder: Optional[Tuple[int, ...]] = None
+        # Encoder cell -> direction label ("CCW", "CW 1", ...)
+        self._encoder_labels: Dict[object, str] = {}
+        # Presses per key while the heatmap is shown
+        self._heat: Optional[List[int]] = None
+        self._heat_max = 1
+        self._backing: Optional[QPixmap] = None
+        self._key_font = QFont("Segoe UI", 8, QFont.Weight.Bold)
+        self._encoder_font = QFont("Segoe UI", 7, QFont.Weight.Bold)
+        self._cells: Dict[object, _Cell] = {}
+        self.keyboard_layout: Optional[KeyboardLayout] = None
+        # Keycode names including the layout's custom keycodes
+        self._namespace = BASE_NAMESPACE
+        self.set_layout(layout or BUILTIN_LAYOUT)
+
+    def set_layout(self, layout: KeyboardLayout) -> bool:
+        """Rebuild the cells for another layout; True if it changed."""
+        if layout == self.keyboard_layout:
+            return False
+        self.keyboard_layout = layout
+        self._namespace = keycode_namespace(layout.digest, layout.custom_keycodes)
+        self._pressed_keys.clear()
+        self._last_keycodes = None
+        self._last_encoder = None
+
+        self._cells = {}
+        self._encoder_labels = {}
+        for geometry in layout.keys:
+            rect = self._unit_rect(geometry)
+            if geometry.encoder is not None:
+                index, direction = geometry.encoder
+                label = ENCODER_DIRECTIONS[direction % 2].upper()
+                key = encoder_cell(index, direction % 2)
+                if index:
+                    label = f"{label} {index}"
+                self._encoder_labels.setdefault(key, label)
+                cell = _Cell(rect, label, self.ENCODER_COLOR, True, self._encoder_font)
             else:
-                # Other keys - normal positioning
-                grid.addWidget(label, row, col, Qt.AlignmentFlag.AlignCenter)
-
-            self.key_labels.append(label)
-
-        layout.addLayout(grid)
-
-        # Set container style
-        self.setStyleSheet("""
-            KeymapGrid {
-                background-color: rgba(40, 40, 40, 160);
-                border-radius: 8px;
-            }
-        """)
-
-    def _get_label_style(
-        self, bg_color: str, text_color: str = "#FFFFFF", pressed: bool = False, is_circle: bool = False
-    ) -> str:
-        """Generate stylesheet for a key label."""
-        border = "2px solid #FFFFFF" if pressed else "1px solid rgba(255, 255, 255, 30)"
-        border_radius = "25px" if is_circle else "4px"
-        return f"""
-            QLabel {{
-                background-color: {bg_color};
-                color: {text_color};
-                border: {border};
-                border-radius: {border_radius};
-                padding: 2px;
-            }}
-        """
+                key = layout.matrix_index(*geometry.matrix)
+                cell = _Cell(rect, "-", self.UNKNOWN_COLOR, False, self._key_font)
+            # Layout options can repeat a matrix position; the first one wins
+            self._cells.setdefault(key, cell)
+
+        unit_w = self.KEY_SIZE.width() + self.SPACING
+        unit_h = self.KEY_SIZE.height() + self.SPACING
+        self.setFixedSize(
+            2 * self.MARGIN + round(layout.width * unit_w) - self.SPACING,
+            2 * self.MARGIN + round(layout.height * unit_h) - self.SPACING,
+        )
+        self._backing = None
+        self.update()
+        return True
+
+    # --- Geometry ---
+    def _unit_rect(self, geometry: KeyGeometry) -> QRect:
+        """Pixel rectangle of a layout entry; encoders get a centered square."""
+        unit_w = self.KEY_SIZE.width() + self.SPACING
+        unit_h = self.KEY_SIZE.height() + self.SPACING
+        x = self.MARGIN + round(geometry.x * unit_w)
+        y = self.MARGIN + round(geometry.y * unit_h)
+        width = round(geometry.w * unit_w) - self.SPACING
+        height = round(geometry.h * unit_h) - self.SPACING
+        if geometry.encoder is not None:
+            size = min(width, height)
+            return QRect(x + (width - size) // 2, y + (height - size) // 2, size, size)
+        return QRect(x, y, width, height)
+
+    def cell_rect(self, row: int, col: int) -> QRect:
+        """Widget rectangle of a matrix key (empty if the layout lacks it)."""
+        cell = self._cells.get(self.keyboard_layout.matrix_index(row, col))
+        return QRect(cell.rect) if cell else QRect()
+
+    # --- Rendering ---
+    def _render_all(self):
+        """Recreate the backing pixmap at the current device pixel ratio."""
+        dpr = self.devicePixelRatioF()
+        pixmap = QPixmap(self.size() * dpr)
+        pixmap.setDevicePixelRatio(dpr)
+        pixmap.fill(Qt.GlobalColor.transparent)
+
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.setBrush(self.BACKGROUND)
+        painter.drawRoundedRect(self.rect(), 8, 8)
+        for cell in self._cells.values():
+            self._draw_cell(painter, cell)
+        painter.end()
+        self._backing = pixmap
+
+    def _draw_cell(self, painter: QPainter, cell: _Cell):
+        border = 2 if cell.pressed else 1
+        painter.setPen(QPen(self.PRESSED_BORDER if cell.pressed else self.BORDER, border))
+        painter.setBrush(cell.color)
+        # Keep the border inside the cell rectangle
+        inset = border / 2
+        shape = cell.rect.toRectF().adjusted(inset, inset, -inset, -inset)
+        if cell.circle:
+            painter.drawEllipse(shape)
+        else:
+            painter.drawRoundedRect(shape, 4, 4)
+
+        painter.setPen(self.TEXT_COLOR)
+        painter.setFont(cell.font)
+        painter.drawText(
+            cell.rect.adjusted(2, 2, -2, -2),
+            Qt.AlignmentFlag.AlignCenter | Qt.TextFlag.TextWordWrap,
+            cell.text,
+        )
+
+    def _set_cell(
+        self,
+        key,
+        text: Optional[str] = None,
+        color: Optional[QColor] = None,
+        pressed: Optional[bool] = None,
+    ) -> bool:
+        """Update a cell; redraws it only if something visible changed."""
+        cell = self._cells.get(key)
+        if cell is None:
+            return False
+        text = cell.text if text is None else text
+        color = cell.color if color is None else color
+        pressed = cell.pressed if pressed is None else pressed
+        if (text, color, pressed) == (cell.text, cell.color, cell.pressed):
+            return False
+        cell.text, cell.color, cell.pressed = text, color, pressed
+
+        if self._backing is not None:
+            painter = QPainter(self._backing)
+            painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+            # Replace the cell's pixels with the plain background, then draw
+            painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
+            painter.fillRect(cell.rect, self.BACKGROUND)
+            painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_SourceOver)
+            self._draw_cell(painter, cell)
+            painter.end()
+        self.update(cell.rect)
+        return True
+
+    def paintEvent(self, event):
+        if self._backing is None or self._backing.devicePixelRatio() != self.devicePixelRatioF():
+            # First paint, or the window moved to a screen with another scale
+            self._render_all()
+        painter = QPainter(self)
+        # Clipped to the exposed region by Qt
+        painter.drawPixmap(0, 0, self._backing)
 
-    def _get_keycode_color(self, keycode: int) -> str:
+    # --- Content ---
+    def _get_keycode_color(self, keycode: int) -> QColor:
         """Determine color based on keycode type."""
         if keycode == 0x0000:
             return self.COLORS["none"]
@@ -164,72 +260,89 @@ class KeymapGrid(QWidget):
         # Basic keys
         return self.COLORS["basic"]
 
+    def _heat_color(self, count: int) -> QColor:
+        """Blend from HEAT_COLD to HEAT_HOT by the share of the busiest key."""
+        t = count / self._heat_max
+        cold, hot = self.HEAT_COLD, self.HEAT_HOT
+        return QColor(
+            round(cold.red() + (hot.red() - cold.red()) * t),
+            round(cold.green() + (hot.green() - cold.green()) * t),
+            round(cold.blue() + (hot.blue() - cold.blue()) * t),
+            round(cold.alpha() + (hot.alpha() - cold.alpha()) * t),
+        )
+
+    def _key_look(self, idx: int, keycode: int) -> Tuple[str, QColor]:
+        """Label and color of a key: by keycode type, or by presses in heatmap mode."""
+        # Shorten for display
+        display_name = shorten_keycode_name(get_keycode_name(keycode, self._namespace), max_len=8)
+        if self._heat is None:
+            return display_name, self._get_keycode_color(keycode)
+        count = self._heat[idx] if idx < len(self._heat) else 0
+        return f"{display_name}\n{count}", self._heat_color(count)
+
+    def set_heatmap(self, counts: Optional[Sequence[int]]) -> bool:
+        """Color keys by press count (row major); None restores keycode colors.
+
+        Returns:
+            bool: True if any cell changed
+        """
+        heat = list(counts) if counts is not None else None
+        if heat == self._heat:
+            return False
+        self._heat = heat
+        self._heat_max = max(heat or [0]) or 1
+        if self._last_keycodes is None:
+            return False
+        changed = False
+        for idx, keycode in enumerate(self._last_keycodes):
+            if self._set_cell(idx, *self._key_look(idx, keycode)):
+                changed = True
+        return changed
+
     def update_keycodes(self, keycodes: List[int]) -> bool:
         """Update the displayed keycodes.
 
         Args:
-            keycodes: List of 16 keycode values
+            keycodes: Keycode values, one per matrix position (row major)
 
         Returns:
             bool: True if anything changed, False otherwise
         """
-        if len(keycodes) != 16:
-            print(f"Warning: Expected 16 keycodes, got {len(keycodes)}")
+        expected = self.keyboard_layout.num_keys
+        if len(keycodes) != expected:
+            print(f"Warning: Expected {expected} keycodes, got {len(keycodes)}")
             return False
 
-        # Check if anything actually changed
-        if hasattr(self, "_last_keycodes") and self._last_keycodes == keycodes:
+        diff = KeymapDiff.between(self._last_keycodes, keycodes)
+        if not diff:
             return False
-
         self._last_keycodes = list(keycodes)
-
-        for idx, keycode in enumerate(keycodes):
-            if idx >= len(self.key_labels):
-                break
-
-            label = self.key_labels[idx]
-
-            # Explicitly ignore keys 1, 2, and 3 as requested by the user
-            if idx in (1, 2, 3):
-                label.hide()
+        return self.apply_diff(diff)
+
+    def apply_diff(self, diff: KeymapDiff) -> bool:
+        """Relabel only the keys and encoder directions in ``diff``."""
+        changed = False
+        for idx, keycode in diff.keys.items():
+            if self._set_cell(idx, *self._key_look(idx, keycode)):
+                changed = True
+        for key, keycode in diff.encoder.items():
+            label = self._encoder_labels.get(key)
+            if label is None:
+                # Encoder not drawn by this layout
                 continue
-
-            label.show()
-
-            # Get keycode name
-            name = get_keycode_name(keycode)
-
-            # Shorten for display
-            display_name = shorten_keycode_name(name, max_len=8)
-            label.setText(display_name)
-
-            # Set color based on keycode type
-            color = self._get_keycode_color(keycode)
-            self._keycode_colors[idx] = color
-
-            # Check if this key is currently pressed
-            key_row = idx // 4
-            key_col = idx % 4
-            is_pressed = (key_row, key_col) in self._pressed_keys
-            # Knob is now square (is_circle=False)
-            label.setStyleSheet(self._get_label_style(color, pressed=is_pressed, is_circle=False))
-
-        return True
+            name = shorten_keycode_name(get_keycode_name(keycode, self._namespace), 8)
+            if self._set_cell(key, f"{label}\n{name}", self._get_keycode_color(keycode)):
+                changed = True
+        return changed
 
     def set_key_pressed(self, row: int, col: int, pressed: bool):
         """Set the pressed state of a key.
 
         Args:
-            row: Matrix row (0-3)
-            col: Matrix column (0-3)
+            row: Matrix row
+            col: Matrix column
             pressed: True if pressed, False if released
         """
-        # Calculate key index from row/col
-        key_idx = row * 4 + col
-
-        if key_idx < 0 or key_idx >= len(self.key_labels):
-            return
-
         # Update pressed keys set
         key_pos = (row, col)
         if pressed:
@@ -237,32 +350,25 @@ class KeymapGrid(QWidget):
         else:
             self._pressed_keys.discard(key_pos)
 
-        # Update visual state
-        label = self.key_labels[key_idx]
-
-        # Get the original color for this key
-        color = self._keycode_colors.get(key_idx, "#555555")
-        # Knob is now square (is_circle=False)
-        label.setStyleSheet(self._get_label_style(color, pressed=pressed, is_circle=False))
+        self._set_cell(self.keyboard_layout.matrix_index(row, col), pressed=pressed)
 
-    def update_encoder(self, ccw_keycode: int, cw_keycode: int):
-        """Update encoder CCW/CW labels."""
-        # CCW
-        name = shorten_keycode_name(get_keycode_name(ccw_keycode), 8)
-        self.enc_ccw_label.setText(f"CCW\n{name}")
-        color = self._get_keycode_color(ccw_keycode)
-        self.enc_ccw_label.setStyleSheet(self._get_label_style(color, is_circle=True))
+    def update_encoder(self, encoder_keycodes: Sequence[int]) -> bool:
+        """Update encoder cells; True if anything changed.
 
-        # CW
-        name = shorten_keycode_name(get_keycode_name(cw_keycode), 8)
-        self.enc_cw_label.setText(f"CW\n{name}")
-        color = self._get_keycode_color(cw_keycode)
-        self.enc_cw_label.setStyleSheet(self._get_label_style(color, is_circle=True))
+        Args:
+            encoder_keycodes: (ccw, cw) of every encoder, flattened
+        """
+        encoder = tuple(encoder_keycodes)
+        diff = KeymapDiff.between(None, None, self._last_encoder, encoder)
+        if not diff:
+            return False
+        self._last_encoder = encoder
+        return self.apply_diff(diff)
 
     def clear(self):
-        """Clear all key labels."""
+        """Clear all key cells."""
         self._pressed_keys.clear()
-        self._keycode_colors.clear()
-        for label in self.key_labels:
-            label.setText("-")
-            label.setStyleSheet(self._get_label_style("#555555"))
+        self._last_keycodes = None
+        for key in self._cells:
+            if isinstance(key, int):
+                self._set_cell(key, "-", self.UNKNOWN_COLOR, False)
@@ -30,10 +30,12 @@ class MainWindow(QMainWindow):
     settings_changed = Signal()
     quit_requested = Signal()
 
-    def __init__(self, settings_manager, hid_manager, parent=None):
+    def __init__(self, settings_manager, device_pool, parent=None):
         super().__init__(parent)
         self.settings = settings_manager
-        self.hid = hid_manager
+        self.pool = device_pool
+        # Keys of connected pads, offered in the Device column
+        self.known_devices: List[str] = []
 
         self.setWindowTitle(f"NexaHub v{APP_VERSION} - QMK Companion")
         self.setMinimumSize(600, 500)
@@ -97,9 +99,9 @@ class MainWindow(QMainWindow):
 
         # Table
         self.mappings_table = QTableWidget()
-        self.mappings_table.setColumnCount(3)
+        self.mappings_table.setColumnCount(4)
         self.mappings_table.setHorizontalHeaderLabels(
-            ["Process Name", "Window Title (Optional)", "Layer"]
+            ["Process Name", "Window Title (Optional)", "Layer", "Device"]
         )
         self.mappings_table.horizontalHeader().setSectionResizeMode(
             0, QHeaderView.ResizeMode.Stretch
@@ -111,6 +113,10 @@ class MainWindow(QMainWindow):
             2, QHeaderView.ResizeMode.Fixed
         )
         self.mappings_table.setColumnWidth(2, 60)
+        self.mappings_table.horizontalHeader().setSectionResizeMode(
+            3, QHeaderView.ResizeMode.Fixed
+        )
+        self.mappings_table.setColumnWidth(3, 120)
         self.mappings_table.setSelectionBehavior(
             QTableWidget.SelectionBehavior.SelectRows
         )
@@ -252,6 +258,8 @@ class MainWindow(QMainWindow):
                 layer_combo.setCurrentIndex(index)
             self.mappings_table.setCellWidget(row, 2, layer_combo)
 
+            self._setup_device_combo(row, mapping.get("device"))
+
     def _add_mapping(self):
         """Add a new empty layer mapping row."""
         row = self.mappings_table.rowCount()
@@ -266,6 +274,7 @@ class MainWindow(QMainWindow):
         self.mappings_table.setItem(row, 1, title_item)
 
         self._setup_layer_combo(row)
+        self._setup_device_combo(row)
 
     def _add_active_mapping(self):
         """Add a new layer mapping row using active window info."""
@@ -282,6 +291,7 @@ class MainWindow(QMainWindow):
         self.mappings_table.setItem(row, 1, title_item)
 
         self._setup_layer_combo(row)
+        self._setup_device_combo(row)
 
     def _setup_layer_combo(self, row):
         """Helper to setup the layer combobox for a row."""
@@ -300,6 +310,29 @@ class MainWindow(QMainWindow):
 
         self.mappings_table.setCellWidget(row, 2, layer_combo)
 
+    def _setup_device_combo(self, row, device: Optional[str] = None):
+        """Helper to setup the device combobox for a row (None = all pads)."""
+        device_combo = QComboBox()
+        device_combo.addItem("All devices", None)
+        for key in self.known_devices:
+            device_combo.addItem(key, key)
+        if device and device_combo.findData(device) < 0:
+            # Rule for a pad that is not plugged in right now
+            device_combo.addItem(device, device)
+        device_combo.setCurrentIndex(max(0, device_combo.findData(device)))
+        self.mappings_table.setCellWidget(row, 3, device_combo)
+
+    def update_devices(self, keys: List[str]):
+        """Offer newly connected pads in the Device column."""
+        self.known_devices = list(keys)
+        for row in range(self.mappings_table.rowCount()):
+            device_combo = self.mappings_table.cellWidget(row, 3)
+            if device_combo is None:
+                continue
+            for key in keys:
+                if device_combo.findData(key) < 0:
+                    device_combo.addItem(key, key)
+
     def _remove_mapping(self):
         """Remove selected mapping row."""
         current_row = self.mappings_table.currentRow()
@@ -324,6 +357,7 @@ class MainWindow(QMainWindow):
                 process_item = self.mappings_table.item(row, 0)
                 title_item = self.mappings_table.item(row, 1)
                 layer_widget = self.mappings_table.cellWidget(row, 2)
+                device_widget = self.mappings_table.cellWidget(row, 3)
 
                 if process_item and layer_widget:
                     try:
@@ -337,6 +371,9 @@ class MainWindow(QMainWindow):
                                 "process_name": process_name,
                                 "window_title": window_title if window_title else None,
                             }
+                            device = device_widget.currentData() if device_widget else None
+                            if device:
+                                mapping["device"] = device
                             mappings.append(mapping)
                     except ValueError:
                         continue
@@ -344,11 +381,7 @@ class MainWindow(QMainWindow):
             self.settings.config["layer_mappings"] = mappings
             self.settings.save_config()
 
-            # Apply OLED timeout to device
-            timeout_option = self._timeout_to_option(self.settings.oled_timeout)
-            if self.hid.connected:
-                self.hid.set_oled_timeout(timeout_option)
-
+            # Applied to the pads (OLED timeout included) by the app
             self.settings_changed.emit()
 
             QMessageBox.information(self, "Success", "Settings saved successfully!")
@@ -395,21 +428,15 @@ class MainWindow(QMainWindow):
         self._load_settings()
         self.hide()
 
-    def _timeout_to_option(self, timeout: int) -> int:
-        """Convert timeout seconds to option index."""
-        if timeout == 10:
-            return 0
-        elif timeout == 30:
-            return 1
-        elif timeout == 60:
-            return 2
-        else:
-            return 3  # Never
-
-    def update_connection_status(self, connected: bool, error_msg: str = ""):
+    def update_connection_status(
+        self, connected: bool, error_msg: str = "", device_count: int = 1
+    ):
         """Update the connection status label."""
         if connected:
-            self.status_label.setText("Status: Connected to device")
+            if device_count > 1:
+                self.status_label.setText(f"Status: Connected to {device_count} devices")
+            else:
+                self.status_label.setText("Status: Connected to device")
             self.status_label.setStyleSheet("color: green;")
         else:
             if error_msg:
@@ -418,8 +445,17 @@ class MainWindow(QMainWindow):
                 self.status_label.setText("Status: Not connected")
             self.status_label.setStyleSheet("color: red;")
 
-    def update_window_info(self, process_name: str, window_title: Optional[str]):
-        """Update the current window info display."""
+    def update_window_info(
+        self,
+        process_name: str,
+        window_title: Optional[str],
+        raw_title: Optional[str] = None,
+    ):
+        """Update the current window info display.
+
+        ``window_title`` is the normalized key; autofill saves ``raw_title``,
+        which matching normalizes to the same key.
+        """
         if hasattr(self, "window_info_label"):
             title_str = window_title if window_title else "N/A"
             self.window_info_label.setText(
@@ -434,7 +470,7 @@ class MainWindow(QMainWindow):
 
             if not is_self:
                 self.last_active_process = process_name
-                self.last_active_title = window_title
+                self.last_active_title = raw_title if raw_title is not None else window_title
 
     def closeEvent(self, event):
         """Handle window close event."""
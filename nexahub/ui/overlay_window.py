@@ -11,8 +11,11 @@ from PySide6.QtGui import QColor, QPalette, QFont
 
 import sys
 import os
+import time
 import ctypes
+from collections import deque
 from ctypes import wintypes
+from typing import Deque, Optional
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -41,6 +44,9 @@ if sys.platform == "win32":
 class OverlayWindow(QWidget):
     """Always-on-top frameless window to show current layer and keymap."""
 
+    # Window for the relayouts-per-minute metric
+    RELAYOUT_WINDOW = 60.0
+
     def __init__(self, parent=None):
         super().__init__(parent)
 
@@ -61,6 +67,12 @@ class OverlayWindow(QWidget):
         self.dragging = False
         self.offset = QPoint()
         self._click_through_enabled = False
+        # Name of the active pad, shown only when several are connected
+        self._pad_name: Optional[str] = None
+        # Content state at the last relayout; unchanged state skips geometry work
+        self._layout_state: Optional[tuple] = None
+        self.relayouts = 0
+        self._relayout_times: Deque[float] = deque(maxlen=10000)
 
         # Initialize UI
         self._setup_ui()
@@ -102,8 +114,10 @@ class OverlayWindow(QWidget):
         self.title_label.clicked.connect(self._toggle_keymap)
         container_layout.addWidget(self.title_label, 0, Qt.AlignmentFlag.AlignCenter)
 
-        # Label for Layer ID
+        # Label for Layer ID. Fixed size, so a new digit repaints the label
+        # alone and never changes the window geometry.
         self.layer_label = QLabel("0")
+        self.layer_label.setFixedSize(60, 34)
         self.layer_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.layer_label.setStyleSheet("""
             font-family: 'Segoe UI', sans-serif;
@@ -111,7 +125,7 @@ class OverlayWindow(QWidget):
             font-weight: bold;
             color: #ffffff;
         """)
-        container_layout.addWidget(self.layer_label)
+        container_layout.addWidget(self.layer_label, 0, Qt.AlignmentFlag.AlignCenter)
 
         # Keymap grid (initially visible)
         self.keymap_grid = KeymapGrid()
@@ -122,16 +136,36 @@ class OverlayWindow(QWidget):
         # Resize to fit content
         self.adjustSize()
 
+    def _content_state(self) -> tuple:
+        """Everything that can change the window size."""
+        return (
+            self.title_label.text(),
+            self.title_label.styleSheet(),
+            self.keymap_grid.isVisibleTo(self),
+            self.container.sizeHint(),
+        )
+
     def adjustSize(self, anchor=None):
-        """Override adjustSize to maintain the bottom-right anchor."""
+        """Override adjustSize to maintain the bottom-right anchor.
+
+        Skipped when no label text, style or size hint changed since the
+        last relayout and the window already sits at the anchor.
+        """
         if not self.isVisible():
             super().adjustSize()
+            self._layout_state = None
             return
 
         # Capture current bottom-right anchor if none provided
         if anchor is None:
             anchor = self.geometry().bottomRight()
-        
+
+        if (
+            self._content_state() == self._layout_state
+            and self.geometry().bottomRight() == anchor
+        ):
+            return
+
         # Invalidate layouts to ensure fresh size hints
         if self.layout():
             self.layout().invalidate()
@@ -139,17 +173,30 @@ class OverlayWindow(QWidget):
         if self.container.layout():
             self.container.layout().invalidate()
             self.container.layout().activate()
-        
+
         # Get the required size to fit the container
         target_size = self.layout().sizeHint()
-        
+
         # Use setFixedSize to force the window to shrink and stay that size
-        self.setFixedSize(target_size)
-        
+        if target_size != self.size():
+            self.setFixedSize(target_size)
+
         # Move back to anchor
         new_geom = self.geometry()
         new_geom.moveBottomRight(anchor)
-        self.move(new_geom.topLeft())
+        if new_geom != self.geometry():
+            self.move(new_geom.topLeft())
+
+        self._layout_state = self._content_state()
+        self.relayouts += 1
+        self._relayout_times.append(time.monotonic())
+
+    def relayouts_per_minute(self) -> float:
+        """Geometry recalculations over the last minute (zero when idle)."""
+        cutoff = time.monotonic() - self.RELAYOUT_WINDOW
+        while self._relayout_times and self._relayout_times[0] < cutoff:
+            self._relayout_times.popleft()
+        return len(self._relayout_times) * 60.0 / self.RELAYOUT_WINDOW
 
     def _toggle_keymap(self):
         """Toggle visibility of keymap grid."""
@@ -158,27 +205,48 @@ class OverlayWindow(QWidget):
         
         if self.keymap_grid.isVisible():
             self.keymap_grid.hide()
-            self.title_label.setText("NEXAPAD ▶")
         else:
             self.keymap_grid.show()
-            self.title_label.setText("NEXAPAD ▼")
+        self._update_title_text()
         
         # Apply resize anchored to the pre-change position
         self.adjustSize(anchor=anchor)
 
-    def update_keymap(self, keycodes: list, encoder_keycodes: tuple = None):
-        """Update the displayed keymap."""
+    def _update_title_text(self):
+        """Title button text: pad name and keymap expanded/collapsed marker."""
+        title = "NEXAPAD"
+        if self._pad_name:
+            title = f"NEXAPAD · {self._pad_name}"
+        arrow = "▼" if self.keymap_grid.isVisibleTo(self) else "▶"
+        self.title_label.setText(f"{title} {arrow}")
+
+    def set_pad_name(self, name: Optional[str]):
+        """Show which pad the overlay reflects (None hides the name)."""
+        if name == self._pad_name:
+            return
         anchor = self.geometry().bottomRight()
-        changed = False
-        if self.keymap_grid.update_keycodes(keycodes):
-            changed = True
-        
+        self._pad_name = name
+        self._update_title_text()
+        self.adjustSize(anchor=anchor)
+
+    def update_keymap(self, keycodes: list, encoder_keycodes: tuple = None):
+        """Update the displayed keymap.
+
+        The grid has a fixed size and repaints only the cells that changed,
+        so no relayout is needed.
+        """
+        self.keymap_grid.update_keycodes(keycodes)
         if encoder_keycodes:
-            self.keymap_grid.update_encoder(encoder_keycodes[0], encoder_keycodes[1])
-            changed = True  # Assuming update_encoder updates UI labels
+            self.keymap_grid.update_encoder(encoder_keycodes)
+
+    def set_heatmap(self, counts):
+        """Color keys by press count (list per matrix position), None to stop."""
+        self.keymap_grid.set_heatmap(counts)
 
-        if changed:
-            self.adjustSize(anchor=anchor)
+    def set_layout(self, layout):
+        """Draw the keymap with another pad layout (KeyboardLayout)."""
+        if self.keymap_grid.set_layout(layout):
+            self.adjustSize()
 
     def update_key_press(self, row: int, col: int, pressed: bool):
         """Update the visual state of a key press."""
@@ -196,11 +264,8 @@ class OverlayWindow(QWidget):
 
     def update_layer(self, layer_id: int):
         """Update the displayed layer."""
-        if self.layer_label.text() == str(layer_id):
-            return
-        anchor = self.geometry().bottomRight()
-        self.layer_label.setText(str(layer_id))
-        self.adjustSize(anchor=anchor)
+        if self.layer_label.text() != str(layer_id):
+            self.layer_label.setText(str(layer_id))
 
     def _update_title_style(self, click_through: bool):
         """Update the title label style based on click-through state."""
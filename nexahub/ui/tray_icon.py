@@ -10,6 +10,9 @@ class TrayIcon(QSystemTrayIcon):
     quit_requested = Signal()
     overlay_toggle_requested = Signal(bool)
     click_through_toggle_requested = Signal(bool)
+    diagnostics_requested = Signal()
+    key_analytics_toggle_requested = Signal(bool)
+    heatmap_toggle_requested = Signal(bool)
 
     def __init__(self, settings_manager, parent=None):
         super().__init__(parent)
@@ -87,6 +90,27 @@ class TrayIcon(QSystemTrayIcon):
 
         menu.addSeparator()
 
+        # Key usage recording (persistent) and its overlay heatmap
+        self.key_analytics_action = QAction("Record Key Usage", self)
+        self.key_analytics_action.setCheckable(True)
+        self.key_analytics_action.setChecked(self.settings.key_analytics)
+        self.key_analytics_action.triggered.connect(self._on_key_analytics_toggled)
+        menu.addAction(self.key_analytics_action)
+
+        self.heatmap_action = QAction("Show Key Heatmap", self)
+        self.heatmap_action.setCheckable(True)
+        self.heatmap_action.triggered.connect(self.heatmap_toggle_requested.emit)
+        menu.addAction(self.heatmap_action)
+
+        menu.addSeparator()
+
+        # Diagnostics panel action
+        diagnostics_action = QAction("Diagnostics...", self)
+        diagnostics_action.triggered.connect(self.diagnostics_requested.emit)
+        menu.addAction(diagnostics_action)
+
+        menu.addSeparator()
+
         # Quit action
         quit_action = QAction("Quit", self)
         quit_action.triggered.connect(self.quit_requested.emit)
@@ -114,6 +138,12 @@ class TrayIcon(QSystemTrayIcon):
         self.settings.save_config()
         self.click_through_toggle_requested.emit(checked)
 
+    def _on_key_analytics_toggled(self, checked: bool):
+        """Handle key usage recording toggle and persist the setting."""
+        self.settings.key_analytics = checked
+        self.settings.save_config()
+        self.key_analytics_toggle_requested.emit(checked)
+
     def _on_activated(self, reason):
         """Handle tray icon activation."""
         if reason in (
@@ -0,0 +1,68 @@
+"""Differences between keymap snapshots.
+
+The overlay keeps the last keycodes and encoder keycodes it displayed and
+applies only the entries a new snapshot changes. Key press highlighting is
+separate view state and is never part of a snapshot.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+# Encoder cells, in the order the firmware reports them
+ENCODER_DIRECTIONS = ("ccw", "cw")
+
+
+def diff_keycodes(old: Optional[Sequence[int]], new: Sequence[int]) -> List[int]:
+    """Indices whose keycode differs between two snapshots.
+
+    Every index is returned when there is no previous snapshot or its length
+    differs (a different layout).
+    """
+    if old is None or len(old) != len(new):
+        return list(range(len(new)))
+    return [idx for idx, (before, after) in enumerate(zip(old, new)) if before != after]
+
+
+def encoder_cell(index: int, direction: int) -> Union[str, Tuple[int, int]]:
+    """Cell of an encoder direction: "ccw"/"cw" for the first encoder,
+    (index, direction) for the others."""
+    return ENCODER_DIRECTIONS[direction] if index == 0 else (index, direction)
+
+
+class KeymapDiff:
+    """Changed keys and encoder directions between two keymap snapshots."""
+
+    __slots__ = ("keys", "encoder")
+
+    def __init__(self, keys: Dict[int, int], encoder: Dict[object, int]):
+        # key index -> new keycode
+        self.keys = keys
+        # encoder cell (see encoder_cell) -> new keycode
+        self.encoder = encoder
+
+    @classmethod
+    def between(
+        cls,
+        old_keycodes: Optional[Sequence[int]],
+        new_keycodes: Optional[Sequence[int]],
+        old_encoder: Optional[Sequence[int]] = None,
+        new_encoder: Optional[Sequence[int]] = None,
+    ) -> "KeymapDiff":
+        """Diff two snapshots; a missing new part (None) is left alone."""
+        keys: Dict[int, int] = {}
+        if new_keycodes is not None:
+            for idx in diff_keycodes(old_keycodes, new_keycodes):
+                keys[idx] = new_keycodes[idx]
+        encoder: Dict[object, int] = {}
+        if new_encoder is not None:
+            for idx in diff_keycodes(old_encoder, new_encoder):
+                encoder[encoder_cell(idx // 2, idx % 2)] = new_encoder[idx]
+        return cls(keys, encoder)
+
+    def __bool__(self) -> bool:
+        return bool(self.keys or self.encoder)
+
+    def __len__(self) -> int:
+        return len(self.keys) + len(self.encoder)
+
+    def __repr__(self):
+        return f"KeymapDiff(keys={self.keys}, encoder={self.encoder})"
@@ -0,0 +1,352 @@
+"""Physical key layout from Vial (vial.json) or QMK (keyboard.json) files.
+
+Layouts are parsed once into a flat geometry table: one entry per drawn
+key with its position and size in key units, matrix position and, for
+Vial encoders, encoder index and direction, plus the names of the
+keyboard's custom keycodes. Tables are cached on disk
+under the hash of the source file, so later starts (and switching pads)
+skip JSON and KLE parsing.
+
+Vial layouts use KLE (keyboard-layout-editor) rows. Only raw legend
+positions of the default alignment are interpreted:
+
+    0: "row,col" matrix position ("index,direction" for encoders)
+    3: "option,choice" layout option; choices other than 0 are skipped
+    9: "e" marks an encoder
+"""
+
+import hashlib
+import json
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.qmk_keycodes import parse_custom_keycodes
+
+# Bump when the cached table format or parsing changes
+TABLE_VERSION = 2
+
+# Raw KLE legend positions (default alignment)
+LABEL_MATRIX = 0
+LABEL_OPTION = 3
+LABEL_ENCODER = 9
+
+
+class KeyGeometry:
+    """One drawn key: position and size in key units plus what it shows."""
+
+    __slots__ = ("x", "y", "w", "h", "matrix", "encoder")
+
+    def __init__(
+        self,
+        x: float,
+        y: float,
+        w: float = 1.0,
+        h: float = 1.0,
+        matrix: Optional[Tuple[int, int]] = None,
+        encoder: Optional[Tuple[int, int]] = None,
+    ):
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+        # (row, col) of a matrix key
+        self.matrix = matrix
+        # (encoder index, direction) of an encoder; direction 0 = CCW
+        self.encoder = encoder
+
+    def to_row(self) -> List[float]:
+        row, col = self.matrix if self.matrix else (-1, -1)
+        index, direction = self.encoder if self.encoder else (-1, -1)
+        return [self.x, self.y, self.w, self.h, row, col, index, direction]
+
+    @classmethod
+    def from_row(cls, values: List[float]) -> "KeyGeometry":
+        x, y, w, h, row, col, index, direction = values
+        return cls(
+            float(x),
+            float(y),
+            float(w),
+            float(h),
+            (int(row), int(col)) if row >= 0 else None,
+            (int(index), int(direction)) if index >= 0 else None,
+        )
+
+    def __repr__(self):
+        what = f"matrix={self.matrix}" if self.matrix else f"encoder={self.encoder}"
+        return f"KeyGeometry({self.x}, {self.y}, {self.w}x{self.h}, {what})"
+
+
+class KeyboardLayout:
+    """Geometry table of a pad: matrix size and every drawn key."""
+
+    def __init__(
+        self,
+        name: str,
+        rows: int,
+        cols: int,
+        keys: List[KeyGeometry],
+        digest: str,
+        custom_keycodes: Optional[Dict[int, str]] = None,
+    ):
+        self.name = name
+        self.rows = rows
+        self.cols = cols
+        self.keys = keys
+        # keycode -> name declared by the keyboard (Vial customKeycodes)
+        self.custom_keycodes = custom_keycodes or {}
+        # Identifies the source; equal digests mean equal geometry
+        self.digest = digest
+
+    @property
+    def num_keys(self) -> int:
+        return self.rows * self.cols
+
+    @property
+    def width(self) -> float:
+        """Width in key units."""
+        return max((key.x + key.w for key in self.keys), default=0.0)
+
+    @property
+    def height(self) -> float:
+        """Height in key units."""
+        return max((key.y + key.h for key in self.keys), default=0.0)
+
+    def normalized(self) -> "KeyboardLayout":
+        """Same layout moved so the top-left key touches the origin."""
+        left = min((key.x for key in self.keys), default=0.0)
+        top = min((key.y for key in self.keys), default=0.0)
+        if not left and not top:
+            return self
+        keys = [
+            KeyGeometry(key.x - left, key.y - top, key.w, key.h, key.matrix, key.encoder)
+            for key in self.keys
+        ]
+        return KeyboardLayout(
+            self.name, self.rows, self.cols, keys, self.digest, self.custom_keycodes
+        )
+
+    def matrix_index(self, row: int, col: int) -> int:
+        """Position of a key in the row-major keycode list."""
+        return row * self.cols + col
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": TABLE_VERSION,
+            "name": self.name,
+            "rows": self.rows,
+            "cols": self.cols,
+            "keys": [key.to_row() for key in self.keys],
+            "custom": [[keycode, name] for keycode, name in self.custom_keycodes.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], digest: str) -> "KeyboardLayout":
+        if data.get("version") != TABLE_VERSION:
+            raise ValueError("outdated layout table")
+        return cls(
+            data["name"],
+            int(data["rows"]),
+            int(data["cols"]),
+            [KeyGeometry.from_row(values) for values in data["keys"]],
+            digest,
+            {int(keycode): str(name) for keycode, name in data.get("custom", [])},
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, KeyboardLayout) and self.digest == other.digest
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    def __repr__(self):
+        return f"KeyboardLayout({self.name!r}, {self.rows}x{self.cols}, {len(self.keys)} keys)"
+
+
+def parse_kle(rows: List[Any]) -> List[KeyGeometry]:
+    """Convert KLE rows (as used by Vial's layouts.keymap) into key geometry."""
+    keys = []
+    y = 0.0
+    for row in rows:
+        if not isinstance(row, list):
+            # Keyboard metadata object
+            continue
+        x = 0.0
+        w = h = 1.0
+        decal = False
+        for item in row:
+            if isinstance(item, dict):
+                # Offsets are relative; size and decal apply to the next key
+                x += item.get("x", 0.0)
+                y += item.get("y", 0.0)
+                w = item.get("w", w)
+                h = item.get("h", h)
+                decal = item.get("d", decal)
+                continue
+
+            labels = str(item).split("\n")
+            option = _label(labels, LABEL_OPTION)
+            skipped = decal or (option and _pair(option)[1] != 0)
+            position = _label(labels, LABEL_MATRIX)
+            if not skipped and position:
+                pair = _pair(position)
+                if _label(labels, LABEL_ENCODER) == "e":
+                    keys.append(KeyGeometry(x, y, w, h, encoder=pair))
+                else:
+                    keys.append(KeyGeometry(x, y, w, h, matrix=pair))
+            x += w
+            w = h = 1.0
+            decal = False
+        y += 1.0
+    return keys
+
+
+def _label(labels: List[str], position: int) -> str:
+    return labels[position].strip() if position < len(labels) else ""
+
+
+def _pair(text: str) -> Tuple[int, int]:
+    first, second = text.split(",")
+    return int(first), int(second)
+
+
+def parse_vial(data: Dict[str, Any], name: str, digest: str) -> KeyboardLayout:
+    """Layout of a Vial definition (vial.json)."""
+    keys = parse_kle(data["layouts"]["keymap"])
+    matrix = data.get("matrix", {})
+    rows, cols = _matrix_size(keys, matrix.get("rows"), matrix.get("cols"))
+    custom = parse_custom_keycodes(data.get("customKeycodes"))
+    return KeyboardLayout(data.get("name", name), rows, cols, keys, digest, custom)
+
+
+def parse_keyboard_json(data: Dict[str, Any], name: str, digest: str) -> KeyboardLayout:
+    """Layout of a QMK keyboard.json / info.json (first layout macro)."""
+    layout = next(iter(data["layouts"].values()))["layout"]
+    keys = [
+        KeyGeometry(
+            float(entry.get("x", 0.0)),
+            float(entry.get("y", 0.0)),
+            float(entry.get("w", 1.0)),
+            float(entry.get("h", 1.0)),
+            matrix=(int(entry["matrix"][0]), int(entry["matrix"][1])),
+        )
+        for entry in layout
+    ]
+    pins = data.get("matrix_pins", {})
+    rows, cols = _matrix_size(keys, len(pins.get("rows", [])), len(pins.get("cols", [])))
+    return KeyboardLayout(data.get("keyboard_name", name), rows, cols, keys, digest)
+
+
+def _matrix_size(
+    keys: List[KeyGeometry], rows: Optional[int], cols: Optional[int]
+) -> Tuple[int, int]:
+    """Declared matrix size, or the smallest one holding every key."""
+    matrix = [key.matrix for key in keys if key.matrix]
+    rows = rows or max((row for row, _ in matrix), default=-1) + 1
+    cols = cols or max((col for _, col in matrix), default=-1) + 1
+    return rows, cols
+
+
+def parse_layout(data: Dict[str, Any], name: str, digest: str) -> KeyboardLayout:
+    """Dispatch on the file flavour (Vial KLE rows or QMK layout macros)."""
+    layouts = data.get("layouts")
+    if not isinstance(layouts, dict):
+        raise ValueError("no layouts")
+    if "keymap" in layouts:
+        return parse_vial(data, name, digest)
+    return parse_keyboard_json(data, name, digest)
+
+
+def _builtin_layout() -> KeyboardLayout:
+    """The original NexaPad look: encoder row above three rows of four keys.
+
+    Encoders sit over columns 0 and 3 with the knob key (0,0) centered
+    between them; matrix keys (0,1)-(0,3) are not wired.
+    """
+    keys = [
+        KeyGeometry(0.0, 0.0, 1.0, 1.25, encoder=(0, 0)),
+        KeyGeometry(1.5, 0.125, matrix=(0, 0)),
+        KeyGeometry(3.0, 0.0, 1.0, 1.25, encoder=(0, 1)),
+    ]
+    for row in range(1, 4):
+        for col in range(4):
+            keys.append(KeyGeometry(float(col), 0.25 + row, matrix=(row, col)))
+    return KeyboardLayout("NexaPad", 4, 4, keys, "builtin")
+
+
+BUILTIN_LAYOUT = _builtin_layout()
+
+
+@lru_cache(maxsize=8)
+def grid_layout(rows: int, cols: int) -> KeyboardLayout:
+    """Plain rows x cols grid for pads without a layout file."""
+    keys = [
+        KeyGeometry(float(col), float(row), matrix=(row, col))
+        for row in range(rows)
+        for col in range(cols)
+    ]
+    return KeyboardLayout(f"{rows}x{cols}", rows, cols, keys, f"grid:{rows}x{cols}")
+
+
+class LayoutLoader:
+    """Loads layout files through an on-disk cache of geometry tables."""
+
+    def __init__(self, cache_dir: Optional[Path] = None):
+        self.cache_dir = Path(cache_dir) if cache_dir else Path.home() / ".nexahub" / "layouts"
+        self._lock = threading.Lock()
+        # digest -> layout, so reloading a known file costs one hash
+        self._layouts: Dict[str, KeyboardLayout] = {}
+        # Digests that failed to parse; reported once
+        self._unusable = set()
+
+    def load(self, file_path) -> Optional[KeyboardLayout]:
+        """Layout of a vial.json or keyboard.json file; None if unusable."""
+        path = Path(file_path)
+        try:
+            data = path.read_bytes()
+        except OSError as e:
+            print(f"Could not read layout {path}: {e}")
+            return None
+        return self.load_bytes(data, path.stem)
+
+    def load_bytes(self, data: bytes, name: str = "layout") -> Optional[KeyboardLayout]:
+        """Layout of raw definition JSON; None if it cannot be parsed."""
+        digest = hashlib.sha1(data).hexdigest()
+        with self._lock:
+            layout = self._layouts.get(digest)
+            if layout is not None or digest in self._unusable:
+                return layout
+
+        layout = self._read_table(digest)
+        if layout is None:
+            try:
+                layout = parse_layout(json.loads(data), name, digest).normalized()
+            except (ValueError, KeyError, TypeError, StopIteration, AttributeError) as e:
+                print(f"Ignoring unusable layout {name}: {e}")
+                with self._lock:
+                    self._unusable.add(digest)
+                return None
+            self._write_table(layout)
+
+        with self._lock:
+            self._layouts[digest] = layout
+        return layout
+
+    def _table_path(self, digest: str) -> Path:
+        return self.cache_dir / f"{digest}.json"
+
+    def _read_table(self, digest: str) -> Optional[KeyboardLayout]:
+        try:
+            with open(self._table_path(digest), "r") as f:
+                return KeyboardLayout.from_dict(json.load(f), digest)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_table(self, layout: KeyboardLayout):
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            with open(self._table_path(layout.digest), "w") as f:
+                json.dump(layout.to_dict(), f)
+        except OSError as e:
+            print(f"Could not cache layout table: {e}")
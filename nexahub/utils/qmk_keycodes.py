@@ -2,8 +2,13 @@
 
 Maps keycode hex values to human-readable QMK names.
 Updated with complete keycodes from vial-code/keycodes_v6.py
+
+Keyboards can add names for their custom keycodes (Vial ``customKeycodes``)
+through a KeycodeNamespace, merged over the base table once per layout.
 """
 
+from typing import Any, Dict, List, Optional
+
 # Basic keycodes (0x0000 - 0x00FF)
 BASIC_KEYCODES = {
     0x0000: "KC_NO",
@@ -624,6 +629,11 @@ ALL_KEYCODE_DICTS = [
     RGB_MATRIX_KEYCODES,
 ]
 
+# Single lookup over ALL_KEYCODE_DICTS; the first dictionary wins
+KEYCODE_NAMES: Dict[int, str] = {}
+for _names in reversed(ALL_KEYCODE_DICTS):
+    KEYCODE_NAMES.update(_names)
+
 
 def get_mods_keycode(keycode: int) -> str:
     """Generate MOD keycode name."""
@@ -790,25 +800,21 @@ def get_user_keycode(keycode: int) -> str:
     return f"USER{idx:02d}"
 
 
-def get_keycode_name(keycode: int) -> str:
+def get_keycode_name(keycode: int, namespace: Optional["KeycodeNamespace"] = None) -> str:
     """Convert a keycode value to its QMK name.
 
     Args:
         keycode: 16-bit keycode value
+        namespace: Keyboard namespace with custom keycode names (None = base table)
 
     Returns:
         QMK keycode name string
     """
-    if keycode == 0x0000:
-        return "KC_NO"
-    if keycode == 0x0001:
-        return "KC_TRNS"
+    return (namespace or BASE_NAMESPACE).name(keycode)
 
-    # Check basic and special keycode dictionaries
-    for kd in ALL_KEYCODE_DICTS:
-        if keycode in kd:
-            return kd[keycode]
 
+def _range_keycode_name(keycode: int) -> str:
+    """Name of a keycode not in the lookup tables (parameterized ranges)."""
     # Check range-based keycodes
     # Mods: 0x0100 - 0x1FFF
     if 0x0100 <= keycode <= 0x1FFF:
@@ -878,6 +884,59 @@ def get_keycode_name(keycode: int) -> str:
     return f"0x{keycode:04X}"
 
 
+class KeycodeNamespace:
+    """Keycode names of one keyboard: custom names merged over KEYCODE_NAMES.
+
+    The merge happens once, so a name costs one dictionary lookup (plus the
+    range decoding of parameterized keycodes, as before).
+    """
+
+    def __init__(self, custom: Optional[Dict[int, str]] = None):
+        self.custom = dict(custom or {})
+        self._names = {**KEYCODE_NAMES, **self.custom} if self.custom else KEYCODE_NAMES
+
+    def name(self, keycode: int) -> str:
+        name = self._names.get(keycode)
+        return name if name is not None else _range_keycode_name(keycode)
+
+
+BASE_NAMESPACE = KeycodeNamespace()
+
+# Layout digest -> namespace
+_namespaces: Dict[str, KeycodeNamespace] = {}
+
+
+def parse_custom_keycodes(entries: List[Any]) -> Dict[int, str]:
+    """Names of Vial ``customKeycodes``.
+
+    Entry i is keycode USER_KEYCODE_BASE + i (USER00 onwards) unless it sets
+    "keycode" itself (int or "0x..." string), which covers vendor ranges.
+    The QMK-style "shortName" is preferred over the display "name".
+    """
+    custom = {}
+    for idx, entry in enumerate(entries or []):
+        if not isinstance(entry, dict):
+            continue
+        name = entry.get("shortName") or entry.get("name")
+        if not name:
+            continue
+        keycode = entry.get("keycode", USER_KEYCODE_BASE + idx)
+        if isinstance(keycode, str):
+            keycode = int(keycode, 0)
+        custom[int(keycode)] = str(name)
+    return custom
+
+
+def keycode_namespace(digest: str, custom: Optional[Dict[int, str]]) -> KeycodeNamespace:
+    """Namespace for a layout, built once per layout digest."""
+    if not custom:
+        return BASE_NAMESPACE
+    namespace = _namespaces.get(digest)
+    if namespace is None:
+        namespace = _namespaces[digest] = KeycodeNamespace(custom)
+    return namespace
+
+
 def shorten_keycode_name(name: str, max_len: int = 8) -> str:
     """Shorten a keycode name for display.
 